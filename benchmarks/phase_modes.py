@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+"""Compare the wall-clock time of running the phases in every phase mode.
+
+The phases run against a stub of insights-core: its phase module only
+imports the modules given with --import (to stand in for the import cost
+of insights-core) and every phase exits successfully. What is measured is
+therefore the cost the wrapper adds to a run, not the phases themselves.
+
+Usage:
+
+    $ python3 benchmarks/phase_modes.py --repeat 5
+    $ python3 benchmarks/phase_modes.py --import requests --import yaml
+"""
+
+import argparse
+import os
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+from unittest import mock
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+PHASES = ["pre_update", "update", "post_update", "collect_and_output"]
+
+# A selection of the modules insights-core pulls in on import
+DEFAULT_IMPORTS = [
+    "argparse",
+    "email.parser",
+    "http.client",
+    "json",
+    "logging.handlers",
+    "shlex",
+    "ssl",
+    "tarfile",
+    "urllib.request",
+    "xml.etree.ElementTree",
+    "yaml",
+]
+
+STUB_PHASE_MODULE = """
+import importlib
+import os
+
+for name in os.environ["BENCHMARK_IMPORTS"].split(","):
+    if name:
+        importlib.import_module(name)
+
+
+def get_phases():
+    return [{"name": name} for name in %r]
+
+
+def _phase():
+    pass
+
+
+%s
+"""
+
+
+def write_stub_core(root, phases):
+    """Write a stub 'insights' package under root."""
+    package = root / "insights" / "client" / "phase"
+    package.mkdir(parents=True)
+    for directory in (root / "insights", root / "insights" / "client", package):
+        (directory / "__init__.py").write_text("")
+    (root / "insights" / "client" / "config.py").write_text("InsightsConfig = None\n")
+    (root / "insights" / "client" / "__init__.py").write_text("InsightsClient = None\n")
+    aliases = "\n".join(f"{name} = _phase" for name in phases)
+    (package / "v2.py").write_text(STUB_PHASE_MODULE % (phases, aliases))
+
+
+def measure(insights_client, mode, phases, repeat):
+    timings = []
+    loaded = insights_client.settings.Settings(phase_mode=mode)
+    with mock.patch.object(insights_client.settings, "get", return_value=loaded):
+        with mock.patch.object(insights_client, "update_motd_message"):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                insights_client.run_phases([{"name": name} for name in phases])
+                timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per mode (default: 5)")
+    parser.add_argument(
+        "--import",
+        dest="imports",
+        action="append",
+        help="module the stub core imports (default: a set of stdlib modules and yaml)",
+    )
+    parser.add_argument(
+        "--phase",
+        dest="phases",
+        action="append",
+        help=f"phase to run (default: {', '.join(PHASES)})",
+    )
+    args = parser.parse_args()
+    phases = args.phases or PHASES
+
+    with tempfile.TemporaryDirectory(prefix="insights-client-benchmark-") as stub_root:
+        write_stub_core(pathlib.Path(stub_root), phases)
+        search_path = [stub_root, str(REPO_ROOT / "src")]
+        sys.path[:0] = search_path
+        os.environ["PYTHONPATH"] = os.pathsep.join(
+            search_path + [p for p in os.environ.get("PYTHONPATH", "").split(os.pathsep) if p]
+        )
+        os.environ["BENCHMARK_IMPORTS"] = ",".join(args.imports or DEFAULT_IMPORTS)
+        sys.argv = [sys.argv[0]]
+
+        import insights_client
+
+        print(f"{'mode':<8} {'min':>8} {'median':>8} {'max':>8}  ({len(phases)} phases)")
+        for mode in insights_client.settings.PHASE_MODES:
+            timings = measure(insights_client, mode, phases, args.repeat)
+            print(
+                f"{mode:<8} {min(timings):>7.3f}s {statistics.median(timings):>7.3f}s "
+                f"{max(timings):>7.3f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+"""Measure the start-up time of insights-client.
+
+For the import of the insights_client package and for the common CLI
+invocations this records:
+
+- the wall-clock time of the whole process, over a number of runs;
+- the cumulative import time of the insights_client and insights packages,
+  as reported by `python -X importtime`.
+
+The results can be written as JSON with --output, so that two trees (for
+example before and after a change) can be compared with --compare.
+
+Usage:
+
+    $ python3 benchmarks/startup.py --repeat 10 --output before.json
+    $ python3 benchmarks/startup.py --repeat 10 --compare before.json
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+ENTRY_POINT = REPO_ROOT / "src" / "insights-client"
+
+# name -> arguments to the Python interpreter
+INVOCATIONS = {
+    "import": ["-c", "import insights_client"],
+    "--version": [str(ENTRY_POINT), "--version"],
+    "--status": [str(ENTRY_POINT), "--status"],
+    "--help": [str(ENTRY_POINT), "--help"],
+}
+
+MEASURED_PACKAGES = ("insights_client", "insights")
+
+
+def _environ():
+    env = dict(os.environ)
+    search_path = [str(REPO_ROOT / "src")]
+    if env.get("PYTHONPATH"):
+        search_path.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(search_path)
+    return env
+
+
+def wall_clock(arguments, repeat):
+    """Return the wall-clock times of running the interpreter with arguments."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + arguments,
+            env=_environ(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def import_times(arguments):
+    """Return the cumulative import time of the measured packages, in seconds.
+
+    Parses the output of `-X importtime`:
+    "import time: <self us> | <cumulative us> | <indented module name>"
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        env=_environ(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    result = dict.fromkeys(MEASURED_PACKAGES, 0.0)
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        if name in result:
+            result[name] += int(fields[1]) / 1e6
+    return result
+
+
+def measure(repeat):
+    results = {}
+    for name, arguments in INVOCATIONS.items():
+        timings = wall_clock(arguments, repeat)
+        results[name] = {
+            "wall_min": min(timings),
+            "wall_median": statistics.median(timings),
+            "import": import_times(arguments),
+        }
+    return results
+
+
+def report(results, baseline=None):
+    header = f"{'invocation':<12} {'min':>8} {'median':>8}"
+    header += "".join(f" {'import ' + name:>24}" for name in MEASURED_PACKAGES)
+    print(header)
+    for name, result in results.items():
+        line = f"{name:<12} {result['wall_min']:>7.3f}s {result['wall_median']:>7.3f}s"
+        line += "".join(f" {result['import'][p]:>23.3f}s" for p in MEASURED_PACKAGES)
+        print(line)
+        if baseline and name in baseline:
+            delta = result["wall_median"] - baseline[name]["wall_median"]
+            print(f"{'':<12} {'':>8} {delta:>+7.3f}s (median, compared to the baseline)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per invocation (default: 5)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare with the results in this JSON file")
+    args = parser.parse_args()
+
+    results = measure(args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -120,11 +120,14 @@ fi
 %systemd_preun %{name}.timer
 %systemd_preun %{name}.service
 %systemd_preun %{name}-boot.service
+%systemd_preun %{name}-daemon.service
 
 %postun
 %systemd_postun %{name}.timer
 %systemd_postun %{name}.service
 %systemd_postun %{name}-boot.service
+# the daemon keeps insights-core imported; restart it to use the new one
+%systemd_postun_with_restart %{name}-daemon.service
 
 # Clean up files created by insights-client that are unowned by the RPM
 if [ $1 -eq 0 ]; then
@@ -1,35 +1,36 @@
 """Gather and upload Insights data for Red Hat Insights"""
 
+import importlib
 import logging
 import os
-import subprocess
 import sys
-
-from insights.client import InsightsClient
-from insights.client.phase.v2 import get_phases
-from insights.client.config import InsightsConfig
+import time
+
+from . import cli
+from . import fastpath
+from . import ipc
+from . import logpipe
+from . import relay
+from . import sd_notify
+from . import settings
+from . import shutdown
+from . import snapshot
+from . import spawn
+from . import state
+from . import summary
+
+from .spawn import CORE_SELINUX_POLICY  # noqa: F401
+from .spawn import debug_command  # noqa: F401
+from .spawn import debug_environ  # noqa: F401
 
 try:
     from .constants import InsightsConstants
-    from .constants import CORE_SELINUX_POLICY
-
-    # if there is a policy for insights-core, unconditionally try to interface
-    # with SELinux: insights-client was built with a policy for insights-core,
-    # so not being able to apply that is an hard failure
-    if CORE_SELINUX_POLICY != "":
-        import selinux
-
-        SWITCH_CORE_SELINUX_POLICY = selinux.is_selinux_enabled()
-    else:
-        SWITCH_CORE_SELINUX_POLICY = False
 except ImportError:
     # The source file is build from 'constants.py.in' and is not
     # available during development
     class InsightsConstants(object):
         version = "development"
 
-    CORE_SELINUX_POLICY = ""
-    SWITCH_CORE_SELINUX_POLICY = False
 
 LOG_FORMAT = "%(asctime)s %(levelname)8s %(name)s:%(lineno)s %(message)s"
 NO_COLOR = os.environ.get("NO_COLOR") is not None
@@ -42,6 +43,36 @@ UNREGISTERED_FILE = "/etc/insights-client/.unregistered"
 
 logger = logging.getLogger(__name__)
 
+# Modules and objects which are imported on first use only, so that the
+# invocations not needing them (like the fast paths, or the MOTD and logging
+# helpers) do not pay for importing them: name -> (module, object in it)
+_LAZY_IMPORTS = {
+    "InsightsClient": ("insights.client", "InsightsClient"),
+    "get_phases": ("insights.client.phase.v2", "get_phases"),
+    "InsightsConfig": ("insights.client.config", "InsightsConfig"),
+    "selinux": ("selinux", None),
+    "subprocess": ("subprocess", None),
+}
+
+
+def __getattr__(name):
+    if name == "SWITCH_CORE_SELINUX_POLICY":
+        value = spawn.switch_core_selinux_policy()
+    elif name in _LAZY_IMPORTS:
+        module_name, object_name = _LAZY_IMPORTS[name]
+        value = importlib.import_module(module_name)
+        if object_name is not None:
+            value = getattr(value, object_name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def _lazy(name):
+    """Return a lazily imported module or object, importing it if necessary."""
+    return getattr(sys.modules[__name__], name)
+
 
 def get_logging_config():
     config = {}
@@ -72,96 +103,253 @@ def set_up_logging(logging_config):
     formatter = logging.Formatter(LOG_FORMAT)
     handler.setFormatter(formatter)
     logger.addHandler(handler)
+    logpipe.take_over(logger)
 
 
 def tear_down_logging():
+    logpipe.release(logger)
     for handler in logger.handlers:
         logger.removeHandler(handler)
 
 
-def debug_environ(environ):
-    items = map(lambda item: f"{item[0]}={item[1]}", environ.items())
-    return " ".join(items)
-
-
-def debug_command(command, environ=None):
-    if environ:
-        full_command = [debug_environ(environ)] + command
-    else:
-        full_command = command
-    # Please note that neither spaces nor any other special characters are quoted.
-    return " ".join(full_command)
-
+def handle_phase_result(phase, returncode):
+    """Act on the return code of a finished phase.
 
-def run_phase(phase):
-    """Call the run script for the given phase."""
-    insights_command = [
-        sys.executable,
-        os.path.join(os.path.dirname(__file__), "run.py"),
-    ] + sys.argv[1:]
-
-    logger.debug(f"Running phase '{phase['name']}'")
-
-    insights_env = {
-        "INSIGHTS_PHASE": str(phase["name"]),
-    }
-    env = os.environ
-    env.update(insights_env)
-
-    if SWITCH_CORE_SELINUX_POLICY:
-        # SELinux context switch into insights-core is allowed and preferred
-        context = selinux.context_new(selinux.getcon()[1])
-        source_type = selinux.context_type_get(context)
-
-        if source_type in ("unconfined_t", "sysadm_t", "unconfined_service_t"):
-            # Do not transition into insights-core context if we're running
-            # in privileged context already.
-            logger.debug(f"Staying in SELinux context {source_type}")
-        else:
-            # Do transition insights-core context if we're running in
-            # other (unknown), confined context.
-            logger.debug(f"Switching SELinux context from {source_type} to {CORE_SELINUX_POLICY}")
-            selinux.context_type_set(context, CORE_SELINUX_POLICY)
-            new_core_context = selinux.context_str(context)
-            selinux.setexeccon(new_core_context)
-        selinux.context_free(context)
-
-    process = subprocess.Popen(insights_command, env=env)
-    process.communicate()
-
-    if SWITCH_CORE_SELINUX_POLICY:
-        # setexeccon() in theory ought to reset the context for the next
-        # execv*() after that execution; it does not seem to happen though,
-        # so for now manually reset it
-        selinux.setexeccon(None)
-        logger.debug("Switched to the original SELinux context")
-
-    if process.returncode == 0:
+    Returns when the next phase should run, exits otherwise.
+    """
+    if returncode == 0:
         logger.debug("phase '%s' successful", phase["name"])
-        update_motd_message()
         return
 
-    if process.returncode not in [0, 100]:
+    if returncode not in [0, 100]:
         logger.debug(
             "phase '%s' failed with return code %d",
             phase["name"],
-            process.returncode,
+            returncode,
         )
 
-    if process.returncode >= 100:
+    if returncode >= 100:
         # 100 and 101 are unrecoverable, like post-unregistration, or
         #   a machine not being registered yet, or simply a 'dump & die'
         #   CLI option
         #   * 100: Success, exit
         #   * 101: Failure, exit
-        sys.exit(process.returncode % 100)
+        sys.exit(returncode % 100)
 
     # Phase failed
     sys.exit(1)
 
 
-def update_motd_message():
-    """Update MOTD (after a phase was run).
+def _output_relay(phase):
+    """Return the relay of the output of a phase process, if it is relayed."""
+    if not settings.get().relay_output:
+        return None
+    return relay.OutputRelay(phase)
+
+
+def _stop_phase_process(process, name, exc, run_summary=None):
+    """Stop the phase process after the wrapper was interrupted with exc.
+
+    name is the phase which was running, if any.
+    """
+    signum = shutdown.signum_of(exc)
+    logger.debug("%s while running phase '%s', stopping it", exc or "interrupted", name)
+    sd_notify.notify(f"STATUS=stopping phase {name}")
+    returncode = shutdown.stop(
+        process, settings.get().stop_timeout, group=shutdown.own_process_group()
+    )
+    if run_summary is not None:
+        run_summary.record_interruption(name, signum, returncode)
+
+
+def run_phase(phase, config_snapshot=None, run_summary=None, throttle=None):
+    """Call the run script for the given phase."""
+    logger.debug(f"Running phase '{phase['name']}'")
+    if throttle is not None:
+        throttle.phase = str(phase["name"])
+        throttle.defer()
+    sd_notify.notify(f"STATUS=phase {phase['name']}")
+
+    channel, channel_fds = ipc.Channel.pair()
+    output = _output_relay(str(phase["name"]))
+    insights_env = {
+        "INSIGHTS_PHASE": str(phase["name"]),
+    }
+    start = time.monotonic()
+    process = spawn.start(insights_env, channel_fds, config_snapshot, output)
+    if throttle is not None:
+        throttle.watch(process, shutdown.own_process_group())
+
+    phase_relay = relay.PhaseRelay(channel, output, throttle)
+    end_message = None
+    try:
+        for message in phase_relay.messages(process):
+            spawn.handle_message(message, run_summary)
+            if message["type"] == "phase_end":
+                end_message = message
+        process.wait()
+    except (shutdown.Interrupted, KeyboardInterrupt) as exc:
+        _stop_phase_process(process, str(phase["name"]), exc, run_summary)
+        raise
+    finally:
+        if throttle is not None:
+            throttle.resume()
+        phase_relay.close()
+
+    _report_phase(
+        phase, process.returncode, time.monotonic() - start, end_message, output, run_summary
+    )
+    handle_phase_result(phase, process.returncode)
+
+
+def _report_phase(phase, returncode, wall, end_message, output, run_summary=None):
+    """Record a finished phase, with the end of its output if it failed."""
+    from . import tracing
+
+    tracing.complete(
+        f"phase {phase['name']}", "phase", time.monotonic() - wall, returncode=returncode
+    )
+    output_tail = None
+    if returncode not in (0, 100) and output is not None and output.tail:
+        output_tail = list(output.tail)
+        logger.debug("last output of phase '%s':\n%s", phase["name"], "\n".join(output_tail))
+    if run_summary is not None:
+        run_summary.record_phase(
+            str(phase["name"]), returncode, wall, end_message, output_tail=output_tail
+        )
+
+
+def _wait_phase_end(phase_relay, name, run_summary=None):
+    """Handle the messages of a phase until it ends; returns its phase_end message.
+
+    None is returned if the channel was closed before the phase ended.
+    """
+    for message in phase_relay.messages():
+        spawn.handle_message(message, run_summary)
+        if message["type"] == "phase_end" and message["phase"] == name:
+            return message
+    return None
+
+
+def run_phase_host(phases, fork=False, config_snapshot=None, run_summary=None, throttle=None):
+    """Call the run script once to run all the given phases in order.
+
+    The wrapper asks the phase host to run one phase after another over the
+    message channel; the return code of every phase is handled the same way
+    as the return code of a phase run by run_phase(). With fork, the phase
+    host is a zygote: it imports insights-core once and runs every phase in
+    a forked child of its own.
+    """
+    names = [str(phase["name"]) for phase in phases]
+    mode = "zygote" if fork else "host"
+    logger.debug("Running phases %s in a phase %s", ", ".join(f"'{n}'" for n in names), mode)
+
+    channel, channel_fds = ipc.Channel.pair()
+    output = _output_relay(f"phase {mode}")
+    insights_env = {
+        "INSIGHTS_PHASE": ",".join(names),
+        "INSIGHTS_PHASE_HOST": mode,
+    }
+    process = spawn.start(insights_env, channel_fds, config_snapshot, output)
+    if throttle is not None:
+        throttle.watch(process, shutdown.own_process_group())
+    phase_relay = relay.PhaseRelay(channel, output, throttle)
+
+    failure = None
+    running = None
+    try:
+        for phase in phases:
+            name = str(phase["name"])
+            start = time.monotonic()
+            end_message = None
+            if throttle is not None:
+                throttle.phase = name
+                throttle.defer()
+            sd_notify.notify(f"STATUS=phase {name}")
+            if output is not None:
+                output.phase = name
+                output.tail.clear()
+            running = name
+            if channel.send("run", phase=name):
+                end_message = _wait_phase_end(phase_relay, name, run_summary)
+            running = None
+            returncode = None if end_message is None else end_message["returncode"]
+            _report_phase(
+                phase, returncode, time.monotonic() - start, end_message, output, run_summary
+            )
+            if returncode != 0:
+                failure = (phase, returncode)
+                break
+            handle_phase_result(phase, 0)
+
+        channel.send("stop")
+        for message in phase_relay.messages(process):
+            spawn.handle_message(message, run_summary)
+        process.wait()
+    except (shutdown.Interrupted, KeyboardInterrupt) as exc:
+        _stop_phase_process(process, running, exc, run_summary)
+        raise
+    finally:
+        if throttle is not None:
+            throttle.resume()
+        phase_relay.close()
+
+    if failure is not None:
+        phase, returncode = failure
+        if returncode is None:
+            # The phase host died without reporting the end of the phase
+            returncode = process.returncode or 1
+        handle_phase_result(phase, returncode)
+
+
+def run_phases(phases, config_snapshot=None, run_summary=None):
+    """Run the phases the way the wrapper settings ask for.
+
+    config_snapshot is the file with the resolved configuration the phases
+    load instead of resolving it again, see the snapshot module; what the
+    phases did is recorded in run_summary, see the summary module. The
+    phases are paused while the host is under pressure, see the pressure
+    module.
+    """
+    from . import pressure
+
+    wrapper_settings = settings.get()
+    throttle = pressure.Throttle.from_settings(wrapper_settings, run_summary)
+    phase_mode = wrapper_settings.phase_mode
+    if phase_mode in ("host", "zygote"):
+        run_phase_host(
+            phases,
+            fork=phase_mode == "zygote",
+            config_snapshot=config_snapshot,
+            run_summary=run_summary,
+            throttle=throttle,
+        )
+        return
+
+    for p in phases:
+        run_phase(p, config_snapshot=config_snapshot, run_summary=run_summary, throttle=throttle)
+
+
+def read_host_state():
+    """Read the state of the host from the stamp files (see the state module)."""
+    return state.State.read(REGISTERED_FILE, UNREGISTERED_FILE, MOTD_FILE)
+
+
+def update_host_state(run_summary):
+    """Act on the state of the host once a run is over, and record it.
+
+    The state is read once per run, after the last phase, instead of after
+    every phase.
+    """
+    host_state = read_host_state()
+    # whatever the phases returned: --status or --unregister end with 100,
+    # and an unregistered host with 101
+    update_motd_message(host_state)
+    state.write(host_state, state.STATE_FILE)
+
+
+def update_motd_message(host_state=None):
+    """Update MOTD (after phases were run).
 
     MOTD displays a message about system not being registered. Once a
     registration stamp file exists, we make that message go away by pointing
@@ -174,25 +362,26 @@ def update_motd_message():
     The motd message could also be deliberately disabled by the users before
     registration, simply because they don't want to use insights-client, by
     pointing /etc/motd.d/insights-client at an empty file.
+
+    host_state is the state of the host, when already read.
     """
-    if not os.path.exists(os.path.dirname(MOTD_FILE)):
+    if host_state is None:
+        host_state = read_host_state()
+
+    if host_state.motd == state.MOTD_UNSUPPORTED:
         logger.debug(
             "directory '%s' does not exist, ignoring MOTD update request",
             os.path.dirname(MOTD_FILE),
         )
         return
 
-    if os.path.exists(MOTD_FILE) and os.path.samefile(os.devnull, MOTD_FILE):
+    if host_state.motd == state.MOTD_DISABLED:
         logger.debug("MOTD file points at /dev/null, ignoring MOTD update request")
         return
 
-    motd_should_exist = not os.path.exists(REGISTERED_FILE) and not os.path.exists(
-        UNREGISTERED_FILE
-    )
-
-    if motd_should_exist:
+    if host_state.motd_wanted:
         # .registered & .unregistered do not exist, MOTD should be displayed
-        if not os.path.lexists(MOTD_FILE):
+        if host_state.motd == state.MOTD_ABSENT:
             logger.debug(
                 ".registered and .unregistered do not exist; pointing the MOTD file '%s' to '%s'",
                 MOTD_SRC,
@@ -207,6 +396,8 @@ def update_motd_message():
                     MOTD_FILE,
                     exc,
                 )
+                return
+            host_state.motd = state.MOTD_PRESENT
         else:
             logger.debug(
                 ".registered and .unregistered do not exist; file '%s' correctly points to '%s'",
@@ -216,7 +407,7 @@ def update_motd_message():
 
     else:
         # .registered or .unregistered exist, MOTD should not be displayed
-        if os.path.lexists(MOTD_FILE):
+        if host_state.motd == state.MOTD_PRESENT:
             logger.debug(
                 ".registered or .unregistered exist; removing the MOTD file '%s'",
                 MOTD_FILE,
@@ -225,6 +416,8 @@ def update_motd_message():
                 os.remove(MOTD_FILE)
             except OSError as exc:
                 logger.debug("could not remove the MOTD file '%s': %s", MOTD_FILE, exc)
+                return
+            host_state.motd = state.MOTD_ABSENT
         else:
             logger.debug(
                 ".registered or .unregistered exist; file '%s' correctly does not exist",
@@ -234,30 +427,100 @@ def update_motd_message():
 
 def _main():
     """Initialize and run insights client."""
+    returncode = fastpath.dispatch(sys.argv[1:], InsightsConstants.version, REGISTERED_FILE)
+    if returncode is not None:
+        if sys.argv[1:] == ["--status"]:
+            # as the phases run for --status would, see update_host_state()
+            update_motd_message()
+        sys.exit(returncode)
+    wrapper_options, sys.argv[1:] = cli.parse(sys.argv[1:])
+    # the features below are imported only by the invocations using them,
+    # and not by the phases, which import the package too
+    if wrapper_options.history or wrapper_options.stats:
+        from . import history
+
+        sys.exit(history.report(history.HISTORY_FILE, stats=wrapper_options.stats))
+    if wrapper_options.splay_timer or wrapper_options.simulate_splay is not None:
+        from . import splay
+
+        try:
+            window = settings.get().splay_window
+        except ValueError as exc:
+            sys.exit(str(exc))
+        if wrapper_options.splay_timer:
+            sys.exit(splay.write_timer(window, splay.TIMER_DROPIN, splay.MACHINE_ID_FILE))
+        sys.exit(splay.report(wrapper_options.simulate_splay, window))
+    if wrapper_options.memory_profile:
+        from . import memprofile
+
+        memprofile.request()
+
+    from . import profiling
+
+    try:
+        with profiling.session(wrapper_options.profile):
+            _run(wrapper_options)
+    finally:
+        logpipe.release_all()
+
+
+def _run(wrapper_options):
+    """Run insights client with the options of the wrapper."""
+    # there is no start-up to wait for; tell systemd right away, so that a
+    # run ending early (like for a configuration error) is not a failure
+    # to start but a failure of the run
+    sd_notify.notify("READY=1", "STATUS=loading the configuration")
+    shutdown.install()
+
     logging_config = get_logging_config()
     set_up_logging(logging_config)
 
-    if SWITCH_CORE_SELINUX_POLICY:
+    if spawn.switch_core_selinux_policy():
         logger.debug("Running with SELinux")
     else:
         logger.debug("Running without SELinux")
 
     try:
+        load_start = time.monotonic()
         try:
-            config = InsightsConfig(_print_errors=True, **logging_config).load_all()
+            with fastpath.capturing_help(sys.argv[1:], InsightsConstants.version):
+                config = _lazy("InsightsConfig")(_print_errors=True, **logging_config).load_all()
+            settings.get()
         except ValueError as e:
             sys.stderr.write("ERROR: " + str(e) + "\n")
             sys.exit("Unable to load Insights Config")
 
+        load_end = time.monotonic()
+
         if config["version"]:
             print("Client: %s" % InsightsConstants.version)
-            print("Core: %s" % InsightsClient().version())
+            print("Core: %s" % _lazy("InsightsClient")().version())
             return
 
         if os.getuid() != 0:
             sys.exit("Insights client must be run as root.")
 
-        client = InsightsClient(config, False)  # read config, but dont setup logging
+        if wrapper_options.boot:
+            from . import boot
+
+            boot_args = boot.prepare(settings.get(), summary.RUN_SUMMARY_FILE)
+            if boot_args:
+                # the archive to upload, instead of collecting
+                sys.argv[1:] += boot_args
+                try:
+                    config = _lazy("InsightsConfig")(
+                        _print_errors=True, **logging_config
+                    ).load_all()
+                except ValueError as e:
+                    sys.stderr.write("ERROR: " + str(e) + "\n")
+                    sys.exit("Unable to load Insights Config")
+
+        if settings.get().limit_resources:
+            from . import envelope
+
+            envelope.apply()
+
+        client = _lazy("InsightsClient")(config, False)  # read config, but dont setup logging
         logger.debug(
             "Initialized. Client: %s, Core: %s",
             InsightsConstants.version,
@@ -267,11 +530,72 @@ def _main():
         # we now have access to the clients logging mechanism
         tear_down_logging()
         client.set_up_logging()
+        if settings.get().json_log:
+            from . import jsonlog
+
+            jsonlog.add(
+                logging.getLogger(),
+                settings.get().json_log,
+                settings.get().json_log_max_size,
+                settings.get().json_log_max_total,
+            )
+        # the phases forward their records to these handlers, see logpipe
+        logpipe.take_over(logging.getLogger())
 
-        for p in get_phases():
-            run_phase(p)
+        if wrapper_options.daemon:
+            from . import scheduler
+
+            def load_config():
+                return _lazy("InsightsConfig")(**logging_config).load_all()
+
+            scheduler.run(load_config, _lazy("get_phases"))
+            return
+
+        from . import history
+        from . import metrics
+        from . import tracing
+
+        if settings.get().trace:
+            tracing.start(tracing.TRACE_FILE)
+            # from before the trace could be started
+            tracing.complete("load configuration", "wrapper", load_start, load_end)
+            tracing.complete("initialize", "wrapper", load_end)
+        with tracing.span("plan phases", "wrapper"):
+            phases = _lazy("get_phases")()
+            if settings.get().plan_phases:
+                from . import planner
+
+                phases = planner.plan(phases, config)
+        config_snapshot = snapshot.write(config)
+        run_summary = summary.RunSummary()
+        exit_code = 1
+        sd_notify.start_watchdog()
+        try:
+            run_phases(phases, config_snapshot=config_snapshot, run_summary=run_summary)
+            exit_code = 0
+        except SystemExit as exc:
+            exit_code = summary.exit_code(exc.code)
+            raise
+        except shutdown.Interrupted as exc:
+            exit_code = 128 + exc.signum
+            raise
+        finally:
+            sd_notify.stop_watchdog()
+            sd_notify.notify("STOPPING=1", f"STATUS=finished with exit code {exit_code}")
+            if config_snapshot is not None:
+                config_snapshot.close()
+            update_host_state(run_summary)
+            run_summary.finish(exit_code)
+            run_summary.write()
+            metrics.write(run_summary, settings.get().metrics_dir)
+            history.record(run_summary, settings.get().history_days, history.HISTORY_FILE)
+            tracing.finish()
     except KeyboardInterrupt:
         sys.exit("Aborting.")
+    except shutdown.Interrupted as exc:
+        logger.debug("Stopping: %s", exc)
+        logpipe.release_all()
+        shutdown.reraise(exc.signum)
 
 
 if __name__ == "__main__":
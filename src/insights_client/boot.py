@@ -0,0 +1,127 @@
+"""Running at boot once the system settled (--boot).
+
+insights-client-boot.service starts right after the network is online,
+when the host is still starting its own services. With --boot, the
+collection waits until the system settled: the load average per CPU, the
+pressure stall information of the CPU, I/O and memory and the queue of the
+systemd jobs are all under their thresholds, see the boot_* settings. It
+waits boot_max_delay seconds at most.
+
+When the archive of the last run is still there and not older than
+boot_reuse_archive seconds, it is uploaded again with --payload instead of
+collecting a new one, and nothing is waited for.
+"""
+
+import logging
+import os
+import time
+
+from . import history
+from . import pressure
+from . import sd_notify
+from . import summary
+
+# How often the system is checked while waiting for it to settle, in seconds
+POLL_INTERVAL = 10.0
+
+# The compressors of the archives insights-core takes as --payload, see the
+# history module
+PAYLOAD_TYPES = ("gz", "bz2", "xz")
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_per_cpu():
+    """Return the load average of the last minute per CPU, or None."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return None
+
+
+def pending_jobs():
+    """Return how many systemd jobs are queued, or None when it is not known."""
+    # not imported by every run
+    import subprocess
+
+    try:
+        output = subprocess.run(
+            ["systemctl", "list-jobs", "--no-legend", "--no-pager"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            timeout=10,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return len([line for line in output.splitlines() if line.strip()])
+
+
+def unsettled(wrapper_settings):
+    """Return why the system did not settle yet, or None once it did."""
+    if wrapper_settings.boot_max_load > 0:
+        load = load_per_cpu()
+        if load is not None and load > wrapper_settings.boot_max_load:
+            return f"load {load:.2f} per CPU"
+    if wrapper_settings.boot_max_pressure > 0:
+        for name in pressure.RESOURCES:
+            value = pressure.read(name)
+            if value is not None and value > wrapper_settings.boot_max_pressure:
+                return f"{name} pressure {value:.1f}%"
+    if wrapper_settings.boot_wait_jobs:
+        jobs = pending_jobs()
+        if jobs:
+            return f"{jobs} systemd jobs queued"
+    return None
+
+
+def wait(wrapper_settings):
+    """Wait until the system settled, or for boot_max_delay; returns whether it settled."""
+    start = time.monotonic()
+    deadline = start + wrapper_settings.boot_max_delay
+    while True:
+        reason = unsettled(wrapper_settings)
+        if reason is None:
+            logger.debug("System settled after %.0f seconds", time.monotonic() - start)
+            return True
+        left = deadline - time.monotonic()
+        if left <= 0:
+            logger.debug(
+                "System not settled after %.0f seconds: %s", time.monotonic() - start, reason
+            )
+            return False
+        sd_notify.notify(f"STATUS=waiting for the system to settle, {reason}")
+        # waiting on purpose is not a hung run; the watchdog of the run is
+        # not started yet
+        sd_notify.notify("WATCHDOG=1")
+        time.sleep(min(POLL_INTERVAL, left))
+
+
+def recent_archive(max_age, path=summary.RUN_SUMMARY_FILE):
+    """Return the archive of the last run if it is still there and recent, or None."""
+    if max_age <= 0:
+        return None
+    last_run = summary.read(path) or {}
+    archive = (last_run.get("archive") or {}).get("path")
+    if not archive or history.compressor(archive) not in PAYLOAD_TYPES:
+        return None
+    try:
+        age = time.time() - os.stat(archive).st_mtime
+    except OSError:
+        return None
+    if age > max_age:
+        logger.debug("The archive '%s' is %.0f seconds old, not reusing it", archive, age)
+        return None
+    return archive
+
+
+def prepare(wrapper_settings, run_summary_file=summary.RUN_SUMMARY_FILE):
+    """Get ready to run at boot; returns the arguments to add for insights-core."""
+    archive = recent_archive(wrapper_settings.boot_reuse_archive, run_summary_file)
+    if archive is not None:
+        logger.debug("Uploading the archive '%s' of the last run again", archive)
+        return ["--payload", archive, "--content-type", history.compressor(archive)]
+    wait(wrapper_settings)
+    return []
@@ -0,0 +1,55 @@
+"""Information about the control group (v2) insights-client runs in."""
+
+import os
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def own_path(pid="self"):
+    """Return the cgroup v2 path of the process, like '/system.slice/x.service'.
+
+    None is returned when the process is not in a cgroup v2 hierarchy.
+    """
+    try:
+        with open(f"/proc/{pid}/cgroup") as f:
+            for line in f:
+                hierarchy, controllers, path = line.rstrip("\n").split(":", 2)
+                if hierarchy == "0" and controllers == "":
+                    return path
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def directory(path):
+    """Return the directory of the cgroup in the cgroup filesystem."""
+    return os.path.join(CGROUP_ROOT, path.lstrip("/"))
+
+
+def cpu_usage_usec(path=None):
+    """Return the CPU time used by all the processes in the cgroup, or None."""
+    if path is None:
+        path = own_path()
+        if path is None:
+            return None
+    try:
+        with open(os.path.join(directory(path), "cpu.stat")) as f:
+            for line in f:
+                key, _, value = line.partition(" ")
+                if key == "usage_usec":
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def process_cpu_ticks(pid):
+    """Return the CPU time of the process and its waited-for children, in ticks."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # the command name may contain spaces; the fields follow the last ')'
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime, stime, cutime, cstime are the fields 14 to 17 of the file
+        return sum(int(value) for value in fields[11:15])
+    except (OSError, IndexError, ValueError):
+        return None
@@ -0,0 +1,69 @@
+"""Command line options of the wrapper itself.
+
+insights-core parses the command line on its own and rejects options it
+does not know, so the options of the wrapper are taken out of the command
+line before insights-core sees it. For the same reason, insights-core does
+not list them in its --help; help_text() is added to it.
+"""
+
+import argparse
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog="insights-client", usage=argparse.SUPPRESS, add_help=False, allow_abbrev=False
+    )
+    group = parser.add_argument_group("insights-client options")
+    group.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and schedule the collection, check-ins and results itself",
+    )
+    group.add_argument(
+        "--boot",
+        action="store_true",
+        help="run as at boot: wait until the system settled, or upload the last archive again",
+    )
+    group.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="profile the run and its phases with cProfile into DIR",
+    )
+    group.add_argument(
+        "--memory-profile",
+        action="store_true",
+        help="trace the memory allocations of the phases with tracemalloc",
+    )
+    group.add_argument("--history", action="store_true", help="list the last runs")
+    group.add_argument(
+        "--stats",
+        action="store_true",
+        help="show the percentiles and weekly medians of the runs",
+    )
+    group.add_argument(
+        "--splay-timer",
+        action="store_true",
+        help="write the drop-in running insights-client.timer at a time of this host",
+    )
+    group.add_argument(
+        "--simulate-splay",
+        metavar="HOSTS",
+        type=int,
+        help="show how HOSTS hosts would be spread over the day with --splay-timer",
+    )
+    return parser
+
+
+def parse(argv):
+    """Split the arguments into the wrapper options and the insights-core ones.
+
+    Returns the wrapper options (as an argparse.Namespace) and the list of
+    the remaining arguments.
+    """
+    options, remaining = _parser().parse_known_args(argv)
+    return options, remaining
+
+
+def help_text():
+    """Return the help of the options of the wrapper, to follow the one of insights-core."""
+    return _parser().format_help()
@@ -0,0 +1,153 @@
+"""The resource limits of insights-client outside of its systemd units.
+
+insights-client.service limits the CPU, memory and tasks of a run. When
+insights-client runs outside of its units (by hand, from cron or from a
+configuration management tool), the wrapper moves itself into a transient
+systemd scope with the same limits, so that the phases it starts are
+limited too. Where systemd cannot create the scope, the wrapper falls back
+to a memory rlimit and to lower CPU and I/O priorities.
+"""
+
+import logging
+import os
+import re
+import resource
+import shutil
+
+from . import cgroup
+
+# The limits of data/systemd/insights-client.service
+CPU_QUOTA_PERCENT = 30
+MEMORY_HIGH = 1024**3
+MEMORY_MAX = 2 * 1024**3
+TASKS_MAX = 300
+
+# Priorities used without a scope
+NICENESS = 10
+IONICE_CLASS = 2  # best-effort
+IONICE_LEVEL = 7  # lowest
+
+# The units of insights-client, and the scopes created by this module
+UNIT_RE = re.compile(r"^insights-client[^/]*\.(service|scope)$")
+
+
+logger = logging.getLogger(__name__)
+
+
+def in_unit(path=None):
+    """Whether the process already runs in a unit of insights-client."""
+    if path is None:
+        path = cgroup.own_path()
+    if not path:
+        return False
+    return any(UNIT_RE.match(part) for part in path.split("/"))
+
+
+def scope_name(pid):
+    return f"insights-client-{pid}.scope"
+
+
+def start_scope_command(pid):
+    """Return the busctl command creating the scope for the process."""
+    properties = [
+        ("Description", "s", "Insights Client"),
+        ("PIDs", "au", "1", str(pid)),
+        ("CPUQuotaPerSecUSec", "t", str(CPU_QUOTA_PERCENT * 10000)),
+        ("MemoryHigh", "t", str(MEMORY_HIGH)),
+        ("MemoryMax", "t", str(MEMORY_MAX)),
+        ("TasksMax", "t", str(TASKS_MAX)),
+    ]
+    command = [
+        "busctl",
+        "call",
+        "--quiet",
+        "org.freedesktop.systemd1",
+        "/org/freedesktop/systemd1",
+        "org.freedesktop.systemd1.Manager",
+        "StartTransientUnit",
+        "ssa(sv)a(sa(sv))",
+        scope_name(pid),
+        "fail",
+        str(len(properties)),
+    ]
+    for prop in properties:
+        command.extend(prop)
+    # no auxiliary units
+    command.append("0")
+    return command
+
+
+def start_scope():
+    """Move this process into a transient scope with the limits; returns success."""
+    import subprocess
+
+    if shutil.which("busctl") is None:
+        logger.debug("busctl is not available, cannot create a scope")
+        return False
+
+    pid = os.getpid()
+    try:
+        subprocess.run(
+            start_scope_command(pid),
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=10,
+        )
+    except subprocess.CalledProcessError as exc:
+        logger.debug("Could not create a scope: %s", exc.stderr.decode("utf-8", "replace").strip())
+        return False
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        logger.debug("Could not create a scope: %s", exc)
+        return False
+
+    logger.debug("Running in the scope %s", scope_name(pid))
+    return True
+
+
+def lower_priorities():
+    """Limit the memory and lower the CPU and I/O priorities of this process.
+
+    The phases started afterwards inherit all of them.
+    """
+    import subprocess
+
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_DATA)
+        if hard == resource.RLIM_INFINITY or hard > MEMORY_MAX:
+            resource.setrlimit(resource.RLIMIT_DATA, (MEMORY_MAX, MEMORY_MAX))
+    except (OSError, ValueError) as exc:
+        logger.debug("Could not limit the memory: %s", exc)
+
+    try:
+        os.nice(NICENESS)
+    except OSError as exc:
+        logger.debug("Could not lower the CPU priority: %s", exc)
+
+    if shutil.which("ionice") is None:
+        logger.debug("ionice is not available, cannot lower the I/O priority")
+        return
+    try:
+        subprocess.run(
+            ["ionice", "-c", str(IONICE_CLASS), "-n", str(IONICE_LEVEL), "-p", str(os.getpid())],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError) as exc:
+        logger.debug("Could not lower the I/O priority: %s", exc)
+
+
+def apply():
+    """Put this process within the limits of insights-client.service.
+
+    Nothing is done when it already runs in a unit of insights-client.
+    """
+    if in_unit():
+        logger.debug("Running in a unit of insights-client, keeping its limits")
+        return
+    if start_scope():
+        return
+    logger.debug("Limiting the memory and lowering the priorities instead")
+    lower_priorities()
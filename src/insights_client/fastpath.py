@@ -0,0 +1,180 @@
+"""Fast paths for invocations which can be answered without insights-core.
+
+Monitoring tools run `insights-client --version` and `--status` often;
+importing insights-core and loading its configuration for them costs far
+more than the answer itself. Only the exact invocations are handled here;
+anything else, or anything which cannot be answered with certainty, goes
+through the full path. `--status` asks the daemon first, when it runs.
+"""
+
+import configparser
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sys
+
+from . import cli
+
+CORE_CONFIG_FILE = "/etc/insights-client/insights-client.conf"
+HELP_CACHE_FILE = "/var/cache/insights-client/help.json"
+
+HELP_ARGS = (["--help"], ["-h"])
+
+
+def _has_insights_environ():
+    """Whether the insights-core configuration is changed by the environment."""
+    return any(key.upper().startswith("INSIGHTS_") for key in os.environ)
+
+
+def core_version():
+    """Return the version of insights-core the way InsightsClient.version() does.
+
+    The VERSION and RELEASE files of the installed 'insights' package are read
+    without importing it. None is returned when they cannot be read.
+    """
+    try:
+        spec = importlib.util.find_spec("insights")
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.submodule_search_locations:
+        return None
+
+    package_info = {}
+    for name in ("VERSION", "RELEASE"):
+        path = os.path.join(list(spec.submodule_search_locations)[0], name)
+        try:
+            with open(path) as f:
+                package_info[name] = f.read().strip()
+        except OSError:
+            return None
+    return "%s-%s" % (package_info["VERSION"], package_info["RELEASE"])
+
+
+def _version(client_version):
+    version = core_version()
+    if version is None:
+        return None
+
+    print("Client: %s" % client_version)
+    print("Core: %s" % version)
+    return 0
+
+
+def _legacy_upload():
+    """Whether the configuration file enables legacy uploads."""
+    parser = configparser.RawConfigParser()
+    try:
+        parser.read(CORE_CONFIG_FILE)
+        return parser.getboolean("insights-client", "legacy_upload", fallback=False)
+    except (configparser.Error, ValueError):
+        # let insights-core report the broken configuration
+        return True
+
+
+def _status(registered_file):
+    if os.getuid() != 0 or _has_insights_environ():
+        return None
+
+    # the daemon knows the resolved configuration, see the query module;
+    # imported for --status only
+    from . import query
+
+    answer = query.request("status", query.SOCKET_PATH)
+    if answer is not None:
+        registered = answer.get("registered")
+        if registered is None:
+            return None
+    elif _legacy_upload():
+        return None
+    else:
+        registered = os.path.exists(registered_file)
+
+    if registered:
+        print("This host is registered.")
+        return 0
+    print("This host is unregistered.")
+    return 1
+
+
+def _help_cache_key(client_version):
+    version = core_version()
+    if version is None:
+        return None
+    columns = shutil.get_terminal_size().columns
+    return f"{client_version}|{version}|{columns}"
+
+
+def _help(client_version):
+    if _has_insights_environ():
+        return None
+
+    key = _help_cache_key(client_version)
+    if key is None:
+        return None
+    try:
+        with open(HELP_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cache.get("key") != key:
+        return None
+
+    sys.stdout.write(cache["text"])
+    return 0
+
+
+def store_help(text, client_version):
+    """Remember the help text printed by the full path."""
+    key = _help_cache_key(client_version)
+    if key is None:
+        return
+
+    temp_file = f"{HELP_CACHE_FILE}.tmp"
+    try:
+        with open(temp_file, "w") as f:
+            json.dump({"key": key, "text": text}, f)
+        os.replace(temp_file, HELP_CACHE_FILE)
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def capturing_help(argv, client_version):
+    """Store the help text printed within the block for the --help fast path.
+
+    The options of the wrapper are added to it.
+    """
+    if argv not in HELP_ARGS or _has_insights_environ():
+        yield
+        return
+
+    buffer = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            yield
+    finally:
+        text = buffer.getvalue()
+        if text:
+            # insights-core does not know the options of the wrapper
+            text += "\n" + cli.help_text()
+        sys.stdout.write(text)
+        if text:
+            store_help(text, client_version)
+
+
+def dispatch(argv, client_version, registered_file):
+    """Answer the invocation without insights-core, if possible.
+
+    Returns the exit code of the invocation when it was answered, None when
+    the full path has to be taken.
+    """
+    if argv == ["--version"]:
+        return _version(client_version)
+    if argv == ["--status"]:
+        return _status(registered_file)
+    if argv in HELP_ARGS:
+        return _help(client_version)
+    return None
@@ -0,0 +1,285 @@
+"""History of the runs, in a SQLite database (--history and --stats).
+
+At the end of every run, its summary (see the summary module) is added to
+HISTORY_FILE: one row per run, and one per phase of the run. Runs older
+than the history_days setting are removed then. Unlike the logs, which
+logrotate removes after a few weeks, the history keeps the trends: like a
+collection getting slower over the months.
+
+--history lists the last runs, --stats shows the percentiles of the
+durations and sizes, and their weekly medians.
+"""
+
+import datetime
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+HISTORY_FILE = "/var/lib/insights/insights-client-history.db"
+
+# The runs listed by --history
+LAST_RUNS = 20
+
+# The weeks shown by the trends of --stats
+TREND_WEEKS = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    duration REAL,
+    exit_code INTEGER,
+    max_rss_kb INTEGER,
+    archive_size INTEGER,
+    uncompressed_size INTEGER,
+    compressor TEXT,
+    upload_size INTEGER,
+    upload_duration REAL,
+    upload_attempts INTEGER,
+    upload_success INTEGER
+);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    returncode INTEGER,
+    wall REAL,
+    max_rss_kb INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS phases_run_id ON phases (run_id);
+"""
+
+# archive file name suffix -> compressor
+COMPRESSORS = {
+    ".tar.gz": "gz",
+    ".tar.xz": "xz",
+    ".tar.bz2": "bz2",
+    ".tar.zst": "zstd",
+    ".tar": "none",
+}
+
+
+logger = logging.getLogger(__name__)
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=10)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(SCHEMA)
+    return db
+
+
+def compressor(archive_path):
+    """Return the compressor of the archive, from its file name, or None."""
+    for suffix, name in COMPRESSORS.items():
+        if archive_path.endswith(suffix):
+            return name
+    return None
+
+
+def record(run_summary, days, path):
+    """Add the run to the history, and forget the runs older than days; 0 disables it.
+
+    Failures are only logged.
+    """
+    if days <= 0:
+        return
+    run = run_summary.as_dict()
+    archive = run["archive"] or {}
+    upload = run["upload"] or {}
+    try:
+        db = connect(path)
+        try:
+            with db:
+                cursor = db.execute(
+                    "INSERT INTO runs (started, duration, exit_code, max_rss_kb, archive_size,"
+                    " uncompressed_size, compressor, upload_size, upload_duration,"
+                    " upload_attempts, upload_success) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        run["started"],
+                        run["duration"],
+                        run["exit_code"],
+                        (run["usage"] or {}).get("max_rss_kb"),
+                        archive.get("size"),
+                        archive.get("uncompressed_size"),
+                        compressor(archive["path"]) if archive.get("path") else None,
+                        upload.get("size"),
+                        upload.get("duration"),
+                        upload.get("attempts"),
+                        None if upload.get("success") is None else int(upload["success"]),
+                    ),
+                )
+                db.executemany(
+                    "INSERT INTO phases (run_id, name, returncode, wall, max_rss_kb)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            cursor.lastrowid,
+                            phase["name"],
+                            phase["returncode"],
+                            phase["wall"],
+                            phase.get("max_rss_kb"),
+                        )
+                        for phase in run["phases"]
+                    ],
+                )
+                db.execute("DELETE FROM runs WHERE started < ?", (time.time() - days * 86400,))
+        finally:
+            db.close()
+    except sqlite3.Error as exc:
+        logger.debug("Could not add the run to the history '%s': %s", path, exc)
+        return
+    logger.debug("Run added to the history '%s'", path)
+
+
+def percentile(values, percent):
+    """Return the percentile of the sorted values, by the nearest rank."""
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def _format_value(value, unit):
+    if value is None:
+        return "-"
+    if unit == "s":
+        return f"{value:.1f}s"
+    if unit == "B":
+        for prefix in ("", "Ki", "Mi"):
+            if abs(value) < 1024:
+                return f"{value:.0f}{prefix}B"
+            value /= 1024
+        return f"{value:.1f}GiB"
+    return str(value)
+
+
+def _date(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
+
+
+def _series(db):
+    """Return (label, unit, query, parameters) of the values with statistics.
+
+    Every query returns (started, value) rows.
+    """
+    series = [
+        ("run", "s", "SELECT started, duration FROM runs WHERE duration IS NOT NULL", ()),
+        (
+            "peak RSS",
+            "B",
+            "SELECT started, max_rss_kb * 1024 FROM runs WHERE max_rss_kb IS NOT NULL",
+            (),
+        ),
+        (
+            "archive",
+            "B",
+            "SELECT started, archive_size FROM runs WHERE archive_size IS NOT NULL",
+            (),
+        ),
+        (
+            "upload",
+            "s",
+            "SELECT started, upload_duration FROM runs WHERE upload_duration IS NOT NULL",
+            (),
+        ),
+    ]
+    names = [row[0] for row in db.execute("SELECT DISTINCT name FROM phases ORDER BY name")]
+    for name in names:
+        series.append(
+            (
+                f"phase {name}",
+                "s",
+                "SELECT started, wall FROM phases JOIN runs ON runs.id = phases.run_id"
+                " WHERE wall IS NOT NULL AND name = ?",
+                (name,),
+            )
+        )
+    return series
+
+
+def history_report(db, last=LAST_RUNS):
+    """Return the lines listing the last runs."""
+    lines = [
+        f"{'started':16}  {'exit':>4}  {'duration':>8}  {'peak RSS':>8}  {'archive':>8}"
+        f"  {'upload':>7}  {'retries':>7}  phases"
+    ]
+    rows = db.execute(
+        "SELECT id, started, exit_code, duration, max_rss_kb, archive_size, upload_duration,"
+        " upload_attempts FROM runs ORDER BY started DESC LIMIT ?",
+        (last,),
+    ).fetchall()
+    for run_id, started, exit_code, duration, rss, archive, upload, attempts in reversed(rows):
+        phases = db.execute(
+            "SELECT name, wall FROM phases WHERE run_id = ? ORDER BY rowid", (run_id,)
+        ).fetchall()
+        phase_text = ", ".join(f"{name} {_format_value(wall, 's')}" for name, wall in phases)
+        retries = "-" if not attempts else str(attempts - 1)
+        lines.append(
+            f"{_date(started):16}  {'-' if exit_code is None else exit_code:>4}"
+            f"  {_format_value(duration, 's'):>8}"
+            f"  {_format_value(None if rss is None else rss * 1024, 'B'):>8}"
+            f"  {_format_value(archive, 'B'):>8}  {_format_value(upload, 's'):>7}"
+            f"  {retries:>7}  {phase_text}"
+        )
+    return lines
+
+
+def stats_report(db, now=None, weeks=TREND_WEEKS):
+    """Return the lines showing the percentiles and the weekly medians."""
+    now = time.time() if now is None else now
+    count, failed = db.execute(
+        "SELECT COUNT(*), COALESCE(SUM(exit_code != 0), 0) FROM runs"
+    ).fetchone()
+    week_starts = [now - (weeks - week) * 7 * 86400 for week in range(weeks)]
+
+    percentiles = [f"{'':24}  {'p50':>8}  {'p90':>8}  {'p99':>8}  {'max':>8}"]
+    trends = [
+        f"{'weekly median':24}" + "".join(f"  {_date(start)[:10]:>10}" for start in week_starts)
+    ]
+    for label, unit, query, parameters in _series(db):
+        rows = db.execute(query, parameters).fetchall()
+        if not rows:
+            continue
+        values = sorted(value for _, value in rows)
+        percentiles.append(
+            f"{label:24}"
+            + "".join(
+                f"  {_format_value(percentile(values, percent), unit):>8}"
+                for percent in (50, 90, 99, 100)
+            )
+        )
+        medians = []
+        for start in week_starts:
+            week = sorted(value for started, value in rows if start <= started < start + 7 * 86400)
+            medians.append(_format_value(percentile(week, 50) if week else None, unit))
+        trends.append(f"{label:24}" + "".join(f"  {median:>10}" for median in medians))
+
+    return [f"{count} runs, {failed} failed", ""] + percentiles + [""] + trends
+
+
+def report(path, stats=False):
+    """Print the history (or the statistics) of the runs; returns the exit code."""
+    # os.path.exists() is False as well when the directory cannot be searched
+    try:
+        os.stat(path)
+    except FileNotFoundError:
+        print("No runs recorded yet.")
+        return 0
+    except OSError as exc:
+        print(f"Cannot read the history '{path}': {exc.strerror}", file=sys.stderr)
+        return 1
+    if not os.access(path, os.R_OK):
+        print(f"Cannot read the history '{path}': Permission denied", file=sys.stderr)
+        return 1
+    try:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+        try:
+            lines = stats_report(db) if stats else history_report(db)
+        finally:
+            db.close()
+    except sqlite3.Error as exc:
+        print(f"Cannot read the history '{path}': {exc}", file=sys.stderr)
+        return 1
+    print("\n".join(lines))
+    return 0
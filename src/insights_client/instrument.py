@@ -0,0 +1,165 @@
+"""Reporting what insights-core does in a phase to the wrapper.
+
+The methods of InsightsClient which produce the interesting results of a
+run are wrapped so that their results are sent as messages on the phase's
+channel, see the ipc module, and their time is added to the trace of the
+run, see the tracing module. The logging insights-core sets up is replaced
+by forwarding the records to the wrapper, see the logpipe module. Nothing
+is wrapped when insights-core does not have the expected methods.
+"""
+
+import collections
+import functools
+import logging
+import os
+import struct
+import time
+
+from insights_client import logpipe
+from insights_client import tracing
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+logger = logging.getLogger(__name__)
+
+# name -> how many times the counted methods were called
+_calls = collections.Counter()
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+def _uncompressed_size(path):
+    """Return the size of the gzip-compressed file once uncompressed, or None.
+
+    It is read from the ISIZE field ending the file, the size modulo 2^32.
+    """
+    if not isinstance(path, str) or not path.endswith(".gz"):
+        return None
+    try:
+        with open(path, "rb") as f:
+            if f.read(2) != GZIP_MAGIC:
+                return None
+            f.seek(-4, os.SEEK_END)
+            return struct.unpack("<I", f.read(4))[0]
+    except (OSError, struct.error):
+        return None
+
+
+def _wrap(cls, name, wrapper_factory):
+    method = getattr(cls, name, None)
+    if method is None or getattr(method, "_insights_client_instrumented", False):
+        return
+    wrapper = functools.wraps(method)(wrapper_factory(method))
+    wrapper._insights_client_instrumented = True
+    setattr(cls, name, wrapper)
+
+
+def _collect(channel):
+    def factory(method):
+        def collect(self, *args, **kwargs):
+            with tracing.span("collection", "insights-core"):
+                archive = method(self, *args, **kwargs)
+            if isinstance(archive, str):
+                sizes = {"size": _size(archive)}
+                uncompressed_size = _uncompressed_size(archive)
+                if uncompressed_size is not None:
+                    sizes["uncompressed_size"] = uncompressed_size
+                channel.send("archive", path=archive, **sizes)
+            return archive
+
+        return collect
+
+    return factory
+
+
+def _upload(channel):
+    def factory(method):
+        def upload(self, payload=None, *args, **kwargs):
+            start = time.monotonic()
+            success = False
+            _calls.pop("upload_archive", None)
+            try:
+                response = method(self, payload, *args, **kwargs)
+                success = True
+                return response
+            finally:
+                tracing.complete("upload", "insights-core", start, success=success)
+                channel.send(
+                    "upload",
+                    size=_size(payload),
+                    duration=time.monotonic() - start,
+                    success=success,
+                    # the attempts to upload, when known
+                    attempts=_calls.get("upload_archive"),
+                )
+
+        return upload
+
+    return factory
+
+
+def _forwarded_logging(channel):
+    def factory(method):
+        def set_up_logging(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            logpipe.forward(channel)
+            return result
+
+        return set_up_logging
+
+    return factory
+
+
+def _counted(name):
+    def factory(method):
+        def counted(self, *args, **kwargs):
+            _calls[name] += 1
+            return method(self, *args, **kwargs)
+
+        return counted
+
+    return factory
+
+
+def _traced(name):
+    def factory(method):
+        def traced(self, *args, **kwargs):
+            with tracing.span(name, "insights-core"):
+                return method(self, *args, **kwargs)
+
+        return traced
+
+    return factory
+
+
+def install(channel):
+    """Report the results of insights-core on the channel."""
+    try:
+        from insights.client import InsightsClient
+    except ImportError as exc:
+        logger.debug("Not reporting the results of insights-core: %s", exc)
+        return
+
+    _wrap(InsightsClient, "collect", _collect(channel))
+    _wrap(InsightsClient, "upload", _upload(channel))
+    _wrap(InsightsClient, "check_results", _traced("results fetch"))
+    _wrap(InsightsClient, "set_up_logging", _forwarded_logging(channel))
+
+    try:
+        from insights.client.connection import InsightsConnection
+    except ImportError as exc:
+        logger.debug("Not counting the upload attempts: %s", exc)
+    else:
+        _wrap(InsightsConnection, "upload_archive", _counted("upload_archive"))
+
+    try:
+        from insights.client.archive import InsightsArchive
+    except ImportError as exc:
+        logger.debug("Not tracing the compression of the archive: %s", exc)
+        return
+    _wrap(InsightsArchive, "create_tar_file", _traced("compression"))
@@ -0,0 +1,160 @@
+"""Message channel between the wrapper and the phases.
+
+Messages are JSON objects with a "type" key, one per line, sent over a pair
+of pipes (one for each direction) inherited by the phase process. The
+phase finds its ends of the pipes in the INSIGHTS_IPC_FDS environment
+variable, as "<read fd>,<write fd>".
+
+Messages sent by the wrapper:
+
+- run: run the phase "phase" (phase host only), with the configuration
+  "options" if given
+- stop: no more phases to run (phase host only)
+
+Messages sent by the phases:
+
+- phase_start: the phase "phase" started
+- phase_end: the phase "phase" finished with "returncode" after "duration"
+  seconds; "reason" tells why it ended
+- archive: the phase created the archive "path" of "size" bytes, and of
+  "uncompressed_size" bytes uncompressed when known
+- upload: the phase uploaded "size" bytes in "duration" seconds, "success"
+  tells whether the upload succeeded and "attempts" how many attempts it
+  took (null when not known)
+- memory: the memory profile of the phase "phase" (with --memory-profile):
+  the "peak" of the traced memory and the top allocations of its
+  "snapshots", see the memprofile module
+- log: a "record" the phase logged, as the attributes of its LogRecord, see
+  the logpipe module
+"""
+
+import json
+import logging
+import os
+import threading
+
+ENVIRON_FDS = "INSIGHTS_IPC_FDS"
+
+READ_SIZE = 65536
+
+
+logger = logging.getLogger(__name__)
+
+
+class Channel(object):
+    """One end of the message channel."""
+
+    def __init__(self, read_fd, write_fd):
+        self._read_fd = read_fd
+        self._write_fd = write_fd
+        self._buffer = b""
+        self._pending = []
+        self._send_lock = threading.Lock()
+        self.eof = False
+
+    @classmethod
+    def pair(cls):
+        """Create the channel of the wrapper and the descriptors for the phase.
+
+        Returns the wrapper's channel and the (read fd, write fd) tuple the
+        phase process has to inherit.
+        """
+        phase_read_fd, wrapper_write_fd = os.pipe()
+        wrapper_read_fd, phase_write_fd = os.pipe()
+        return cls(wrapper_read_fd, wrapper_write_fd), (phase_read_fd, phase_write_fd)
+
+    @classmethod
+    def from_environ(cls):
+        """Return the channel of the phase, or None if there is no channel."""
+        try:
+            read_fd, write_fd = (int(fd) for fd in os.environ[ENVIRON_FDS].split(","))
+        except (KeyError, ValueError):
+            return None
+        # Do not leak the channel into the commands run by the phase
+        for fd in (read_fd, write_fd):
+            try:
+                os.set_inheritable(fd, False)
+            except OSError:
+                return None
+        return cls(read_fd, write_fd)
+
+    @staticmethod
+    def environ(fds):
+        """Return the environment variables telling a phase where its ends are."""
+        return {ENVIRON_FDS: ",".join(str(fd) for fd in fds)}
+
+    def fileno(self):
+        return self._read_fd
+
+    def send(self, message_type, **fields):
+        """Send a message; returns False if the other end is gone."""
+        fields["type"] = message_type
+        data = (json.dumps(fields) + "\n").encode("utf-8")
+        try:
+            # the records of the threads logging are sent too, see logpipe
+            with self._send_lock:
+                while data:
+                    written = os.write(self._write_fd, data)
+                    data = data[written:]
+        except OSError as exc:
+            logger.debug("Could not send a '%s' message: %s", message_type, exc)
+            return False
+        return True
+
+    def read(self):
+        """Read what is available and return the complete messages.
+
+        Blocks until there is something to read. Returns an empty list once
+        the other end closed the channel, see the 'eof' attribute.
+        """
+        try:
+            data = os.read(self._read_fd, READ_SIZE)
+        except OSError as exc:
+            logger.debug("Could not read from the channel: %s", exc)
+            data = b""
+        if not data:
+            self.eof = True
+            return []
+
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        messages = []
+        for line in lines:
+            try:
+                message = json.loads(line.decode("utf-8"))
+            except ValueError:
+                logger.debug("Ignoring a malformed message: %r", line)
+                continue
+            if isinstance(message, dict) and "type" in message:
+                messages.append(message)
+        return messages
+
+    def receive(self):
+        """Return the next message, blocking; None once the channel is closed."""
+        while not self._pending and not self.eof:
+            self._pending.extend(self.read())
+        if self._pending:
+            return self._pending.pop(0)
+        return None
+
+    def __iter__(self):
+        """Iterate over the messages until the other end closes the channel."""
+        while True:
+            message = self.receive()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        for fd in (self._read_fd, self._write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.eof = True
+
+
+def close_fds(fds):
+    """Close the descriptors the phase inherited, in the wrapper."""
+    for fd in fds:
+        os.close(fd)
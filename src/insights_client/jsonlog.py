@@ -0,0 +1,172 @@
+"""Log as newline-delimited JSON, for the log shippers (the json_log setting).
+
+Every record is a JSON object on a line of its own, so the shippers read
+the fields without parsing the text of the log. The file is rotated by the
+handler itself once it grows over json_log_max_size MiB, rather than by
+logrotate: the file is renamed to a segment named after the time of the
+rotation, which a background thread compresses with gzip, removing the
+oldest segments while all of them and the file take more than
+json_log_max_total MiB. Nothing is copied or truncated while being written.
+
+The handler is one of those running behind the queue of the wrapper, see
+the logpipe module, so the writes and the rotations do not hold the run up.
+"""
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+MIB = 1024 * 1024
+
+COMPRESSED_SUFFIX = ".gz"
+
+
+logger = logging.getLogger(__name__)
+
+
+def as_dict(record):
+    """Return the fields logged for the record."""
+    fields = {
+        "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+            timespec="milliseconds"
+        ),
+        "level": record.levelname,
+        "logger": record.name,
+        "message": record.getMessage(),
+        "pid": record.process,
+        "thread": record.threadName,
+        "file": record.pathname,
+        "line": record.lineno,
+    }
+    if record.exc_info and not record.exc_text:
+        record.exc_text = logging.Formatter().formatException(record.exc_info)
+    if record.exc_text:
+        fields["exception"] = record.exc_text
+    if record.stack_info:
+        fields["stack"] = record.stack_info
+    return fields
+
+
+class JsonFileHandler(logging.Handler):
+    """Write the records to path as JSON lines, rotating it by size."""
+
+    def __init__(self, path, max_size, max_total, level=logging.NOTSET):
+        super().__init__(level)
+        self.path = path
+        self.max_size = max_size
+        self.max_total = max_total
+        self.stream = None
+        self.size = 0
+        self._compressors = []
+
+    def _open(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self.stream = os.fdopen(fd, "ab")
+        self.size = os.fstat(fd).st_size
+
+    def emit(self, record):
+        try:
+            data = (json.dumps(as_dict(record), default=str) + "\n").encode("utf-8")
+            if self.stream is None:
+                self._open()
+            if self.size and self.size + len(data) > self.max_size:
+                self.rotate()
+            self.stream.write(data)
+            self.stream.flush()
+            self.size += len(data)
+        except Exception:
+            self.handleError(record)
+
+    def segments(self):
+        """Return the paths of the rotated segments, the oldest first."""
+        directory, name = os.path.split(self.path)
+        prefix = name + "."
+        try:
+            names = os.listdir(directory or ".")
+        except OSError:
+            return []
+        return [
+            os.path.join(directory, segment)
+            for segment in sorted(names)
+            if segment.startswith(prefix) and not segment.endswith(".tmp")
+        ]
+
+    def rotate(self):
+        """Start a new file, compressing the current one in the background."""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        now = time.time()
+        # named so that the oldest sort first
+        segment = f"{self.path}.{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}"
+        segment += f".{int(now * 1000000) % 1000000:06d}"
+        os.rename(self.path, segment)
+        self._open()
+
+        self._compressors = [thread for thread in self._compressors if thread.is_alive()]
+        thread = threading.Thread(
+            target=self._compress, args=(segment,), name="json-log-compress", daemon=True
+        )
+        self._compressors.append(thread)
+        thread.start()
+
+    def _compress(self, segment):
+        compressed = segment + COMPRESSED_SUFFIX
+        temp_path = compressed + ".tmp"
+        try:
+            with open(segment, "rb") as source, gzip.open(temp_path, "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, compressed)
+            os.unlink(segment)
+        except OSError as exc:
+            logger.debug("Could not compress the log segment '%s': %s", segment, exc)
+        self.prune()
+
+    def prune(self):
+        """Remove the oldest segments while all of them and the file take over max_total."""
+
+        def size(path):
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                return 0
+
+        segments = self.segments()
+        total = size(self.path) + sum(size(segment) for segment in segments)
+        for segment in segments:
+            if total <= self.max_total:
+                break
+            total -= size(segment)
+            try:
+                os.unlink(segment)
+            except OSError:
+                pass
+
+    def close(self):
+        # the compressors may log, so not while holding the lock
+        for thread in self._compressors[:]:
+            thread.join()
+        self.acquire()
+        try:
+            self._compressors = []
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+        finally:
+            self.release()
+        super().close()
+
+
+def add(logger, path, max_size, max_total):
+    """Add the JSON log at path to the logger, if a path is given; returns its handler."""
+    if not path:
+        return None
+    handler = JsonFileHandler(path, int(max_size * MIB), int(max_total * MIB))
+    logger.addHandler(handler)
+    return handler
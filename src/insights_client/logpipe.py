@@ -0,0 +1,123 @@
+"""Logging without waiting for the disk or the terminal.
+
+The handlers of the wrapper (its own ones while it starts, then those of
+insights-core writing the log file and the console) run in a background
+thread behind a queue, see take_over(): logging a record only puts it in
+the queue, so a slow or busy disk never holds the run up.
+
+The phases do not write the log file themselves: they forward their
+records on their channel (see the ipc module) to the wrapper, which hands
+them to the same handlers. There is a single writer of the log file for
+the whole run.
+"""
+
+import logging
+
+# The attributes of a record forwarded by a phase
+_FORWARDED_TYPES = (str, int, float, bool, type(None))
+
+
+# logger -> (queue handler, listener) of the loggers taken over
+_listeners = {}
+
+
+class Lazy(object):
+    """A log argument calling func(*args) only when the record is formatted."""
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+
+def take_over(logger):
+    """Move the handlers of the logger to a background thread, behind a queue."""
+    # not imported by the phases, which forward their records instead
+    import logging.handlers
+    import queue
+
+    release(logger)
+    handlers = list(logger.handlers)
+    if not handlers:
+        return
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    listener.start()
+    _listeners[logger] = (queue_handler, listener)
+
+
+def release(logger):
+    """Write the records queued for the logger and give it its handlers back."""
+    try:
+        queue_handler, listener = _listeners.pop(logger)
+    except KeyError:
+        return
+    logger.removeHandler(queue_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        logger.addHandler(handler)
+
+
+def release_all():
+    """Write all the queued records; to be called before the wrapper exits."""
+    for logger in list(_listeners):
+        release(logger)
+
+
+class ChannelHandler(logging.Handler):
+    """Send the records to the wrapper on the channel of the phase."""
+
+    def __init__(self, channel, level=logging.NOTSET):
+        super().__init__(level)
+        self.channel = channel
+        # the channel logs when it cannot send
+        self._sending = False
+
+    def emit(self, record):
+        if self._sending:
+            return
+        self._sending = True
+        try:
+            fields = {
+                key: value
+                for key, value in record.__dict__.items()
+                if isinstance(value, _FORWARDED_TYPES)
+            }
+            fields["msg"] = record.getMessage()
+            fields["args"] = None
+            if record.exc_info and not record.exc_text:
+                fields["exc_text"] = logging.Formatter().formatException(record.exc_info)
+            self.channel.send("log", record=fields)
+        except Exception:
+            self.handleError(record)
+        finally:
+            self._sending = False
+
+
+def forward(channel):
+    """Forward the records of this phase process to the wrapper, instead of handling them.
+
+    The handlers insights-core set up are replaced; only the records they
+    would have handled are forwarded.
+    """
+    root = logging.getLogger()
+    handlers = [handler for handler in root.handlers if not isinstance(handler, ChannelHandler)]
+    if not handlers:
+        return
+    level = min(handler.level for handler in handlers)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(ChannelHandler(channel, level))
+
+
+def handle(message):
+    """Handle a record a phase forwarded in the "log" message, in the wrapper."""
+    record = logging.makeLogRecord(message["record"])
+    logging.getLogger(record.name).handle(record)
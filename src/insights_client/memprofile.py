@@ -0,0 +1,145 @@
+"""Memory profiling of the phases (--memory-profile).
+
+The phase processes trace the allocations of Python with tracemalloc
+(from before importing insights-core), and take snapshots of them at the
+start of every phase, when the phase uses the most memory and at its end.
+The allocations taking the most memory in them, by file and line, are
+sent to the wrapper at the end of the phase (see the ipc module), which
+writes them next to the run summary.
+
+Only one frame is kept per allocation and the snapshots are taken by a
+thread watching the traced memory, so the overhead stays low enough for a
+run on a production host.
+"""
+
+import contextlib
+import os
+import threading
+import time
+import tracemalloc
+
+ENVIRON = "INSIGHTS_MEMORY_PROFILE"
+
+# The allocations reported per snapshot
+TOP = 25
+
+# How often the traced memory is checked, in seconds; a peak snapshot is
+# taken when it grew by PEAK_GROWTH since the last one, at most every
+# PEAK_MIN_INTERVAL seconds
+CHECK_INTERVAL = 0.2
+PEAK_GROWTH = 1.1
+PEAK_MIN_INTERVAL = 1.0
+
+# Allocations of the tracing itself
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+# Whether the wrapper asks the phases for memory profiles
+_requested = False
+
+
+def request():
+    """Ask the phases started from now on for memory profiles."""
+    global _requested
+    _requested = True
+
+
+def environ():
+    """Return the environment variables asking a phase for its memory profile."""
+    if not _requested:
+        return {}
+    return {ENVIRON: "1"}
+
+
+def enabled():
+    """Whether the wrapper asked this phase process for memory profiles."""
+    return bool(os.environ.get(ENVIRON))
+
+
+def start():
+    """Start tracing the allocations, when enabled."""
+    if enabled() and not tracemalloc.is_tracing():
+        tracemalloc.start(1)
+
+
+def report(snapshot, top=TOP):
+    """Return the allocations taking the most memory in the snapshot."""
+    snapshot = snapshot.filter_traces(_FILTERS)
+    statistics = snapshot.statistics("lineno")
+    return {
+        "size": sum(stat.size for stat in statistics),
+        "top": [
+            {
+                "file": stat.traceback[0].filename,
+                "line": stat.traceback[0].lineno,
+                "size": stat.size,
+                "count": stat.count,
+            }
+            for stat in statistics[:top]
+        ],
+    }
+
+
+class PeakWatcher(object):
+    """A thread taking a snapshot whenever the traced memory reaches a new peak."""
+
+    def __init__(self):
+        self.peak_report = None
+        self._peak_size = tracemalloc.get_traced_memory()[0]
+        self._last_snapshot = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-profile", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(CHECK_INTERVAL):
+            self.check()
+
+    def check(self):
+        size = tracemalloc.get_traced_memory()[0]
+        now = time.monotonic()
+        if size < self._peak_size * PEAK_GROWTH or now - self._last_snapshot < PEAK_MIN_INTERVAL:
+            return
+        self._peak_size = size
+        self._last_snapshot = now
+        self.peak_report = report(tracemalloc.take_snapshot())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+@contextlib.contextmanager
+def profiled(channel, name):
+    """Profile the memory used by the phase in the block, reporting it on the channel."""
+    if not enabled() or channel is None:
+        yield
+        return
+
+    start()
+    tracemalloc.reset_peak()
+    start_report = report(tracemalloc.take_snapshot())
+    watcher = PeakWatcher()
+    watcher.start()
+    try:
+        yield
+    finally:
+        watcher.stop()
+        end_report = report(tracemalloc.take_snapshot())
+        channel.send(
+            "memory",
+            phase=name,
+            peak=tracemalloc.get_traced_memory()[1],
+            snapshots={
+                "start": start_report,
+                # the phase never grew past where it started
+                "peak": watcher.peak_report or end_report,
+                "end": end_report,
+            },
+        )
@@ -0,0 +1,140 @@
+"""Metrics of the last run for the textfile collector of node_exporter.
+
+At the end of every run, the run summary (see the summary module) is
+written as metrics in the Prometheus text format to insights_client.prom
+in the directory given by the metrics_dir setting, replaced atomically
+so that the collector never reads half a file.
+"""
+
+import logging
+import os
+
+METRICS_FILENAME = "insights_client.prom"
+
+PREFIX = "insights_client_"
+
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics(object):
+    """Metrics in the Prometheus text format."""
+
+    def __init__(self):
+        self.lines = []
+
+    def add(self, name, help_text, samples):
+        """Add the gauge with the samples, as (labels, value) pairs; None values are left out."""
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        name = PREFIX + name
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+            if label_text:
+                label_text = "{" + label_text + "}"
+            self.lines.append(f"{name}{label_text} {float(value)!r}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def last_success(path):
+    """Return the time of the last successful run from the metrics file, or None."""
+    name = PREFIX + "last_success_timestamp_seconds "
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(name):
+                    return float(line[len(name) :])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def render(run, previous_success=None):
+    """Return the metrics of the run (the dict of a run summary)."""
+    metrics = Metrics()
+    metrics.add("run_start_timestamp_seconds", "When the last run started.", [({}, run["started"])])
+    metrics.add("run_duration_seconds", "How long the last run took.", [({}, run["duration"])])
+    metrics.add("exit_code", "The exit code of the last run.", [({}, run["exit_code"])])
+
+    success = previous_success
+    if run["exit_code"] == 0 and run["duration"] is not None:
+        success = run["started"] + run["duration"]
+    metrics.add(
+        "last_success_timestamp_seconds",
+        "When the last successful run ended.",
+        [({}, success)],
+    )
+
+    metrics.add(
+        "phase_duration_seconds",
+        "How long the phases of the last run took.",
+        [({"phase": phase["name"]}, phase["wall"]) for phase in run["phases"]],
+    )
+    metrics.add(
+        "phase_exit_code",
+        "The exit codes of the phases of the last run.",
+        [({"phase": phase["name"]}, phase["returncode"]) for phase in run["phases"]],
+    )
+
+    archive = run["archive"] or {}
+    metrics.add(
+        "archive_bytes",
+        "The size of the archive of the last run.",
+        [
+            ({"compression": "none"}, archive.get("uncompressed_size")),
+            ({"compression": "compressed"}, archive.get("size")),
+        ],
+    )
+
+    upload = run["upload"] or {}
+    duration = upload.get("duration")
+    throughput = None
+    if duration and upload.get("size") is not None:
+        throughput = upload["size"] / duration
+    attempts = upload.get("attempts")
+    success = upload.get("success")
+    metrics.add("upload_duration_seconds", "How long the last upload took.", [({}, duration)])
+    metrics.add(
+        "upload_throughput_bytes_per_second",
+        "The throughput of the last upload.",
+        [({}, throughput)],
+    )
+    metrics.add(
+        "upload_retries",
+        "How many times the last upload was retried.",
+        [({}, None if not attempts else attempts - 1)],
+    )
+    metrics.add(
+        "upload_success",
+        "Whether the last upload succeeded.",
+        [({}, None if success is None else int(success))],
+    )
+    return metrics.text()
+
+
+def write(run_summary, directory):
+    """Write the metrics of the run to the directory, if any; failures are only logged."""
+    if not directory:
+        return
+    path = os.path.join(directory, METRICS_FILENAME)
+    text = render(run_summary.as_dict(), last_success(path))
+    # the collector only reads the files ending with .prom
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            f.write(text)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except OSError as exc:
+        logger.debug("Could not write the metrics '%s': %s", path, exc)
+        return
+    logger.debug("Metrics written to '%s'", path)
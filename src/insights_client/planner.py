@@ -0,0 +1,75 @@
+"""Planning which phases of insights-core a run needs.
+
+Every phase run costs at least a Python interpreter start-up, so phases
+which have nothing to do for the resolved configuration are not run at all:
+
+- 'update' is not used anymore;
+- 'pre_update' only handles a set of options, all of which exit right
+  after (but --disable-schedule with --register); without any of them it
+  does nothing, and with any of them none of the following phases would
+  ever run.
+
+The options are those of the current versions of insights-core; an option
+added to 'pre_update' later would be skipped, so planning is only done when
+the plan_phases setting enables it.
+"""
+
+import logging
+
+# Options handled by the pre_update phase, in the order it checks them; see
+# _exits() for those it does not exit after
+PRE_UPDATE_OPTIONS = (
+    "version",
+    "validate",
+    "enable_schedule",
+    "disable_schedule",
+    "test_connection",
+    "support",
+    "diagnosis",
+    "checkin",
+)
+
+UNUSED_PHASES = ("update",)
+
+
+logger = logging.getLogger(__name__)
+
+
+def _option(config, name):
+    try:
+        return config[name]
+    except (KeyError, AttributeError):
+        return None
+
+
+def _exits(config, name):
+    """Whether the pre_update phase exits after handling the option."""
+    if name == "disable_schedule":
+        # the host is registered by post_update then
+        return not _option(config, "register")
+    return True
+
+
+def _cli_name(option):
+    return "--" + option.replace("_", "-")
+
+
+def plan(phases, config):
+    """Return the phases which need to run for the configuration, in order."""
+    pre_update_options = [name for name in PRE_UPDATE_OPTIONS if _option(config, name)]
+    exit_options = [name for name in pre_update_options if _exits(config, name)]
+
+    planned = []
+    for phase in phases:
+        name = phase["name"]
+        if name in UNUSED_PHASES:
+            reason = "the phase is not used anymore"
+        elif name == "pre_update" and not pre_update_options:
+            reason = "none of the options it handles is set"
+        elif name != "pre_update" and exit_options:
+            reason = f"'pre_update' exits because of '{_cli_name(exit_options[0])}'"
+        else:
+            planned.append(phase)
+            continue
+        logger.debug("Skipping phase '%s': %s", name, reason)
+    return planned
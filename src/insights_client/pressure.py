@@ -0,0 +1,192 @@
+"""Throttling the phases when the host is under pressure.
+
+The stall information of the kernel (PSI, see the Linux documentation of
+"pressure stall information") tells how much of the time tasks waited for
+CPU, I/O or memory. When the share of the last 10 seconds goes over one of
+the thresholds of the wrapper settings, the wrapper pauses the running
+phase (SIGSTOP) and does not start the next one, until the pressure is
+below the thresholds again. The total time spent paused is bounded, so a
+run always completes eventually.
+"""
+
+import logging
+import os
+import signal
+import time
+
+from . import cgroup
+from . import sd_notify
+
+RESOURCES = ("cpu", "io", "memory")
+SYSTEM_PRESSURE_DIR = "/proc/pressure"
+
+# How often the pressure is checked, in seconds
+INTERVAL = 2.0
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse(text):
+    """Parse the contents of a pressure file.
+
+    Returns a dictionary like {"some": {"avg10": 1.5, ..., "total": 1234}}.
+    """
+    pressure = {}
+    for line in text.splitlines():
+        kind, _, fields = line.partition(" ")
+        values = {}
+        for field in fields.split():
+            key, _, value = field.partition("=")
+            try:
+                values[key] = int(value) if key == "total" else float(value)
+            except ValueError:
+                continue
+        pressure[kind] = values
+    return pressure
+
+
+def pressure_path(resource_name, source="system"):
+    """Return the pressure file of the resource, for the host or the own cgroup."""
+    if source == "cgroup":
+        path = cgroup.own_path()
+        if path is None:
+            return None
+        return os.path.join(cgroup.directory(path), f"{resource_name}.pressure")
+    return os.path.join(SYSTEM_PRESSURE_DIR, resource_name)
+
+
+def read(resource_name, source="system"):
+    """Return the share of time some tasks stalled on the resource lately, in %.
+
+    None is returned when the kernel does not provide the information.
+    """
+    path = pressure_path(resource_name, source)
+    if path is None:
+        return None
+    try:
+        with open(path) as f:
+            return parse(f.read())["some"]["avg10"]
+    except (OSError, KeyError):
+        return None
+
+
+class Throttle(object):
+    """Pauses the phases while a resource is under too much pressure."""
+
+    def __init__(self, thresholds, source="system", max_pause=300.0, run_summary=None):
+        # resource name -> threshold in %, only for the resources checked
+        self.thresholds = thresholds
+        self.source = source
+        self.max_pause = max_pause
+        self.run_summary = run_summary
+        self.interval = INTERVAL
+        self.phase = None
+        self.paused_for = 0.0
+        self._process = None
+        self._group = False
+        self._pause = None
+
+    @classmethod
+    def from_settings(cls, wrapper_settings, run_summary=None):
+        """Return the throttle the settings ask for, or None."""
+        thresholds = {}
+        for name in RESOURCES:
+            threshold = getattr(wrapper_settings, f"pressure_{name}")
+            if threshold > 0:
+                thresholds[name] = threshold
+        if not thresholds:
+            return None
+        if all(read(name, wrapper_settings.pressure_source) is None for name in thresholds):
+            logger.debug("No pressure stall information, not throttling the phases")
+            return None
+        return cls(
+            thresholds,
+            source=wrapper_settings.pressure_source,
+            max_pause=wrapper_settings.pressure_max_pause,
+            run_summary=run_summary,
+        )
+
+    def over(self):
+        """Return the (resource, pressure) over its threshold, or None."""
+        for name, threshold in self.thresholds.items():
+            value = read(name, self.source)
+            if value is not None and value > threshold:
+                return name, value
+        return None
+
+    def _budget_left(self, since=None):
+        paused_for = self.paused_for
+        if since is not None:
+            paused_for += time.monotonic() - since
+        return paused_for < self.max_pause
+
+    def _record(self, action, since, resource_name, value):
+        duration = time.monotonic() - since
+        self.paused_for += duration
+        logger.debug(
+            "phase '%s' %s for %.1f seconds, %s pressure %.1f%%",
+            self.phase,
+            action,
+            duration,
+            resource_name,
+            value,
+        )
+        if self.run_summary is not None:
+            self.run_summary.record_pause(self.phase, action, duration, resource_name, value)
+
+    def defer(self):
+        """Wait before starting the next phase while there is too much pressure."""
+        over = self.over()
+        if over is None or not self._budget_left():
+            return
+        since = time.monotonic()
+        sd_notify.notify(f"STATUS=deferring phase {self.phase}, {over[0]} pressure")
+        while self._budget_left(since):
+            # waiting on purpose is not a hung run
+            sd_notify.progress()
+            time.sleep(self.interval)
+            if self.over() is None:
+                break
+        self._record("deferred", since, *over)
+
+    def watch(self, process, group):
+        """Throttle the phase process and, with group, its whole process group."""
+        self._process = process
+        self._group = group
+
+    def _signal(self, signum):
+        try:
+            if self._group:
+                os.killpg(self._process.pid, signum)
+            else:
+                self._process.send_signal(signum)
+        except ProcessLookupError:
+            pass
+
+    def check(self):
+        """Pause or resume the watched phase, depending on the pressure."""
+        if self._process is None:
+            return
+        if self._pause is None:
+            over = self.over()
+            if over is not None and self._budget_left() and self._process.poll() is None:
+                self._signal(signal.SIGSTOP)
+                self._pause = (time.monotonic(), over)
+                sd_notify.notify(f"STATUS=pausing phase {self.phase}, {over[0]} pressure")
+            return
+
+        sd_notify.progress()
+        since, over = self._pause
+        if self.over() is None or not self._budget_left(since):
+            self.resume()
+
+    def resume(self):
+        """Resume the watched phase if it is paused."""
+        if self._pause is None:
+            return
+        self._signal(signal.SIGCONT)
+        since, over = self._pause
+        self._pause = None
+        sd_notify.notify(f"STATUS=phase {self.phase}")
+        self._record("paused", since, *over)
@@ -0,0 +1,173 @@
+"""Profiling the wrapper and the phases (--profile=DIR).
+
+The wrapper and every phase run under cProfile, each writing its profile
+as DIR/<name>.pstats (the wrapper as "wrapper", the phases by their
+names), readable with the pstats module or tools like snakeviz. At the
+end of the run, all of them are merged into DIR/profile.collapsed, in the
+collapsed-stack format of flamegraph.pl, speedscope and the like, with the
+time in microseconds.
+
+cProfile records the callers of every function rather than whole stacks,
+so the stacks are rebuilt from the call graph, sharing the time of a
+function among its callers the way it was spent in the calls from each.
+
+On Python 3.12 and later, the perf trampoline is activated as well, so
+that `perf record` sees the Python functions.
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import sys
+
+ENVIRON_DIR = "INSIGHTS_PROFILE_DIR"
+
+COLLAPSED_FILE = "profile.collapsed"
+
+# Parts of stacks taking less, in seconds, are left out
+MIN_TIME = 0.0001
+
+
+logger = logging.getLogger(__name__)
+
+# The directory of the profiles of the run, while profiling it
+_directory = None
+
+
+def _activate_perf_trampoline():
+    activate = getattr(sys, "activate_stack_trampoline", None)
+    if activate is None:
+        return
+    try:
+        activate("perf")
+    except (ValueError, OSError) as exc:
+        logger.debug("Could not activate the perf trampoline: %s", exc)
+
+
+@contextlib.contextmanager
+def profiled(directory, name):
+    """Profile the block into directory/<name>.pstats; nothing without a directory."""
+    if not directory:
+        yield
+        return
+
+    # not imported by the runs which are not profiled, like every phase
+    import cProfile
+
+    _activate_perf_trampoline()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = os.path.join(directory, f"{name}.pstats")
+        try:
+            profiler.dump_stats(path)
+        except OSError as exc:
+            logger.debug("Could not write the profile '%s': %s", path, exc)
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == "~":
+        # built-in functions
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(filename)}:{line})"
+    return label.replace(";", ",")
+
+
+def collapse(stats, root):
+    """Return {collapsed stack: seconds} for the pstats.Stats, under the root frame."""
+    callees = collections.defaultdict(list)
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, edge_time) in callers.items():
+            callees[caller].append((func, edge_time))
+
+    stacks = collections.Counter()
+
+    def walk(func, stack, on_stack, share):
+        # share is the part of the time of func spent in this stack
+        _, _, own_time, total_time, _ = stats.stats[func]
+        stack = f"{stack};{_label(func)}"
+        if own_time * share >= MIN_TIME:
+            stacks[stack] += own_time * share
+        for callee, edge_time in callees[func]:
+            callee_total = stats.stats[callee][3]
+            if callee in on_stack or callee_total <= 0:
+                continue
+            if edge_time * share < MIN_TIME:
+                continue
+            walk(callee, stack, on_stack | {callee}, share * edge_time / callee_total)
+
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            walk(func, root, frozenset([func]), 1.0)
+    return stacks
+
+
+def merge(directory):
+    """Merge the profiles in the directory into its collapsed-stack file; returns its path."""
+    import pstats
+
+    stacks = collections.Counter()
+    for filename in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(filename)
+        if ext != ".pstats":
+            continue
+        try:
+            stats = pstats.Stats(os.path.join(directory, filename))
+        except (OSError, ValueError, TypeError, EOFError) as exc:
+            logger.debug("Could not read the profile '%s': %s", filename, exc)
+            continue
+        stacks.update(collapse(stats, name))
+
+    path = os.path.join(directory, COLLAPSED_FILE)
+    with open(path, "w") as f:
+        for stack, seconds in sorted(stacks.items()):
+            usec = round(seconds * 1000000)
+            if usec > 0:
+                f.write(f"{stack} {usec}\n")
+    return path
+
+
+def environ():
+    """Return the environment variables telling a phase where to write its profile."""
+    if _directory is None:
+        return {}
+    return {ENVIRON_DIR: _directory}
+
+
+@contextlib.contextmanager
+def session(directory):
+    """Profile the wrapper, and the phases it starts, for the block.
+
+    The phases find the directory in their environment, see environ(); it
+    is not set in the environment of the wrapper, where insights-core would
+    take it for an unknown option.
+    """
+    global _directory
+
+    if not directory:
+        yield
+        return
+
+    directory = os.path.abspath(directory)
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as exc:
+        sys.exit(f"Cannot write the profiles to '{directory}': {exc}")
+    _directory = directory
+    try:
+        with profiled(directory, "wrapper"):
+            yield
+    finally:
+        _directory = None
+        try:
+            path = merge(directory)
+        except OSError as exc:
+            logger.debug("Could not merge the profiles in '%s': %s", directory, exc)
+        else:
+            logger.debug("Profiles merged into '%s'", path)
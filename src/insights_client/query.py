@@ -0,0 +1,169 @@
+"""Local query API of the daemon, on a root-only Unix socket.
+
+Cockpit, monitoring agents and login scripts ask for the registration
+state, the last run or the analysis results often; starting a client (and
+importing insights-core) for every question costs far more than the
+answer. While the daemon (see the scheduler module) runs, it answers them
+on SOCKET_PATH instead.
+
+Every request is a line with the name of a query; every answer is a line
+of JSON. Unknown queries are answered with {"error": "..."}.
+
+    status    {"registered": true | false | null}; null when it cannot be
+              told without insights-core (legacy uploads)
+    last_run  {"last_run": <the run summary, see the summary module>}
+    results   {"host_details": ..., "insights_details": ...}, the analysis
+              results as last retrieved, null when not retrieved
+    schedule  {"jobs": {<job>: <time of the next run, or null>}}
+"""
+
+import json
+import logging
+import os
+import socket
+import struct
+
+SOCKET_PATH = "/run/insights-client/query.sock"
+
+RESULTS_FILES = {
+    # written by --check-results
+    "host_details": "/var/lib/insights/host-details.json",
+    # written by --check-results of insights-core before 3.6.2
+    "insights_details": "/var/lib/insights/insights-details.json",
+}
+
+# How long a connection may stay silent, in seconds
+IDLE_TIMEOUT = 10.0
+
+
+logger = logging.getLogger(__name__)
+
+_cache = {}
+
+
+def read_json(path):
+    """Return the parsed JSON file, or None; parsed again only when it changed."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _cache.pop(path, None)
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = None
+    _cache[path] = (key, data)
+    return data
+
+
+def status(options, registered_file):
+    """Answer the status query, for the resolved configuration options."""
+    if options.get("legacy_upload"):
+        # registration is checked against the API then
+        return {"registered": None}
+    return {"registered": os.path.exists(registered_file)}
+
+
+def results():
+    """Answer the results query."""
+    return {name: read_json(path) for name, path in RESULTS_FILES.items()}
+
+
+def _peer_uid(writer):
+    sock = writer.get_extra_info("socket")
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    except (AttributeError, OSError):
+        return None
+    return struct.unpack("3i", creds)[1]
+
+
+async def _handle(answer, reader, writer):
+    import asyncio
+
+    try:
+        # the socket is in a root-only directory; this also covers a socket
+        # bound somewhere else
+        if _peer_uid(writer) not in (0, os.getuid()):
+            return
+        while True:
+            line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+            if not line:
+                break
+            name = line.decode("utf-8", "replace").strip()
+            try:
+                response = answer(name)
+            except Exception as exc:
+                logger.debug("Could not answer query '%s': %s", name, exc)
+                response = {"error": f"failed: {exc}"}
+            if response is None:
+                response = {"error": f"unknown query '{name}'"}
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(answer, path):
+    """Start answering the queries on the socket; answer(name) returns the answer or None."""
+    # imported here, the fast path of --status only uses request()
+    import asyncio
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: _handle(answer, reader, writer), path
+    )
+    os.chmod(path, 0o600)
+    logger.debug("Answering queries on '%s'", path)
+    return server
+
+
+async def close(server, path):
+    """Stop answering the queries."""
+    server.close()
+    await server.wait_closed()
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def request(name, path, timeout=1.0):
+    """Ask the daemon; returns its answer, or None when it is not running or cannot answer."""
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall(name.encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    except OSError:
+        return None
+    finally:
+        sock.close()
+    try:
+        response = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(response, dict) or "error" in response:
+        return None
+    return response
@@ -0,0 +1,184 @@
+"""Relaying what a phase process writes and sends to the wrapper.
+
+The output of a phase process goes to pipes of the wrapper rather than to
+the wrapper's own stdout/stderr, which the phase may not be allowed to
+write to when it runs in the insights-core SELinux context. The wrapper
+reads the pipes together with the message channel (see the ipc module) and
+forwards the output byte for byte, as insights-core output like that of
+--diagnosis or --show-results is read by programs. The last lines are kept
+with the time they were written at, to report them when the phase fails.
+"""
+
+import collections
+import logging
+import os
+import selectors
+import sys
+import time
+
+from . import sd_notify
+
+READ_SIZE = 65536
+
+# Lines of output kept for the report of a failed phase
+TAIL_LINES = 50
+
+# How long to wait for the output once the phase process exited, in case
+# a leftover process of the phase keeps the pipes open
+EXIT_DRAIN_TIMEOUT = 0.5
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Stream(object):
+    def __init__(self, target):
+        self.target = target
+        self.partial = b""
+
+
+class OutputRelay(object):
+    """Pipes for the stdout and stderr of a phase process, and their forwarding."""
+
+    def __init__(self, phase=None, terminal=None, tail_lines=TAIL_LINES):
+        self.phase = phase
+        self.terminal = sys.stdout.isatty() if terminal is None else terminal
+        self.tail = collections.deque(maxlen=tail_lines)
+        self._streams = {}
+        self.stdout_fd, self.stderr_fd = (
+            self._pipe(sys.stdout),
+            self._pipe(sys.stderr),
+        )
+
+    def _pipe(self, target):
+        read_fd, write_fd = os.pipe()
+        os.set_inheritable(read_fd, False)
+        self._streams[read_fd] = _Stream(target)
+        return write_fd
+
+    def environ(self):
+        """Return the environment variables for the phase process."""
+        if self.terminal:
+            # show the output as it comes, not when the phase's buffers fill up
+            return {"PYTHONUNBUFFERED": "1"}
+        return {}
+
+    def started(self):
+        """Close the ends of the pipes the phase process inherited."""
+        for fd in (self.stdout_fd, self.stderr_fd):
+            os.close(fd)
+
+    def fds(self):
+        """Return the pipes which are not closed yet."""
+        return list(self._streams)
+
+    def pump(self, fd):
+        """Forward what is available in the pipe; returns False on its end."""
+        stream = self._streams[fd]
+        try:
+            data = os.read(fd, READ_SIZE)
+        except OSError:
+            data = b""
+        if not data:
+            self._record(stream, [stream.partial] if stream.partial else [])
+            os.close(fd)
+            del self._streams[fd]
+            return False
+
+        _write(stream.target, data)
+        lines = (stream.partial + data).split(b"\n")
+        stream.partial = lines.pop()
+        if len(stream.partial) > READ_SIZE:
+            # do not wait for the end of an overly long line
+            lines.append(stream.partial)
+            stream.partial = b""
+        self._record(stream, lines)
+        return True
+
+    def _record(self, stream, lines):
+        if not lines:
+            return
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.tail.extend(f"{now} {line.decode('utf-8', 'replace')}" for line in lines)
+
+    def close(self):
+        for fd in list(self._streams):
+            os.close(fd)
+        self._streams.clear()
+
+
+def _write(target, data):
+    target.flush()
+    buffer = getattr(target, "buffer", None)
+    try:
+        if buffer is None:
+            target.write(data.decode("utf-8", "replace"))
+        else:
+            buffer.write(data)
+        target.flush()
+    except (OSError, ValueError):
+        pass
+
+
+class PhaseRelay(object):
+    """Receives the messages and the output of a phase process together."""
+
+    def __init__(self, channel, output=None, throttle=None):
+        self.channel = channel
+        self.output = output
+        # checked regularly while waiting, see the pressure module
+        self.throttle = throttle
+        self._pending = collections.deque()
+        self._checked = time.monotonic()
+
+    def messages(self, process=None):
+        """Iterate over the messages of the phase, forwarding its output meanwhile.
+
+        The iteration ends once the channel and the output pipes are closed;
+        or, when the phase process is given, shortly after it exited.
+        Messages not consumed yet are kept for the next iteration.
+        """
+        with selectors.DefaultSelector() as selector:
+            if not self.channel.eof:
+                selector.register(self.channel, selectors.EVENT_READ)
+            for fd in self.output.fds() if self.output is not None else ():
+                selector.register(fd, selectors.EVENT_READ)
+
+            exited_at = None
+            while self._pending or selector.get_map():
+                while self._pending:
+                    yield self._pending.popleft()
+
+                timeout = None
+                if self.channel.eof and process is not None:
+                    if exited_at is None and process.poll() is not None:
+                        exited_at = time.monotonic()
+                    if exited_at is not None:
+                        timeout = exited_at + EXIT_DRAIN_TIMEOUT - time.monotonic()
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = EXIT_DRAIN_TIMEOUT
+                if self.throttle is not None:
+                    until_check = self._checked + self.throttle.interval - time.monotonic()
+                    timeout = until_check if timeout is None else min(timeout, until_check)
+
+                events = selector.select(max(timeout, 0) if timeout is not None else None)
+                if self.throttle is not None:
+                    if time.monotonic() >= self._checked + self.throttle.interval:
+                        self._checked = time.monotonic()
+                        self.throttle.check()
+
+                for key, _ in events:
+                    if key.fileobj is self.channel:
+                        self._pending.extend(self.channel.read())
+                        if self.channel.eof:
+                            selector.unregister(self.channel)
+                    elif not self.output.pump(key.fd):
+                        selector.unregister(key.fd)
+                    sd_notify.progress()
+
+    def close(self):
+        self.channel.close()
+        if self.output is not None:
+            self.output.close()
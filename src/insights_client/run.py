@@ -1,23 +1,221 @@
+import gc
 import os
 import sys
+import time
 
 import logging
 
+from insights_client import instrument
+from insights_client import ipc
+from insights_client import memprofile
+from insights_client import profiling
+from insights_client import snapshot
+from insights_client import summary
+from insights_client import tracing
+
 logger = logging.getLogger(__name__)
 
-try:
+
+def exit_code(exc):
+    """Return the exit status a SystemExit would have ended the process with."""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+def call_phase(phase, options=None):
+    """Call the phase, with the configuration snapshot passed by the wrapper.
+
+    The phases of insights-core are decorated to resolve the configuration
+    and to create the client on their own. With a snapshot, the undecorated
+    phase is called with the client and configuration created from the
+    snapshot instead, the same way the decorator does it. The options given
+    on the command line are restored on the configuration, which insights-core
+    checks for some of them; without them, the phase resolves the
+    configuration itself.
+    """
+    func = getattr(phase, "__wrapped__", None)
+    if options is None or func is None:
+        return phase()
+    options = dict(options)
+    cli_options = options.pop(snapshot.CLI_OPTIONS, None)
+    if cli_options is None:
+        return phase()
+
+    try:
+        from insights.client import InsightsClient
+        from insights.client.config import InsightsConfig
+
+        config = InsightsConfig(**options)
+        # not taken by the constructor, which resets it
+        config._cli_opts = cli_options
+        client = InsightsClient(config)
+    except Exception as exc:
+        logger.debug("Could not use the configuration snapshot: %s", exc)
+        return phase()
+
     try:
-        from insights.client.phase import v2 as client
-    except ImportError as e:
-        sys.exit(
-            "Error importing insights.client for %s as %s: %s"
-            % (os.environ["INSIGHTS_PHASE"], os.environ["PYTHONPATH"], e)
+        func(client, config)
+    except Exception:
+        logger.exception("Fatal error")
+        sys.exit(1)
+    sys.exit()
+
+
+def run_hosted_phase(client, name, options=None):
+    """Run a phase in this process and return its exit status."""
+    phase = getattr(client, name)
+    try:
+        with profiling.profiled(os.environ.get(profiling.ENVIRON_DIR), name):
+            call_phase(phase, options)
+    except SystemExit as exc:
+        return exit_code(exc)
+    except Exception as e:
+        print("Fatal: {0}".format(e))
+        return 1
+    return 0
+
+
+def returncode_from_status(status):
+    """Convert a wait() status to a returncode the way subprocess does."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def run_forked_phase(channel, client, name, options=None):
+    """Run a phase in a forked child and return its exit status.
+
+    The child shares the already imported insights-core with this process
+    copy-on-write, yet whatever the phase changes stays in the child. The
+    child reports the phase on the channel itself, unless it gets killed.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        returncode = 1
+        tracing.name_process(f"phase {name}")
+        try:
+            returncode = run_reported_phase(channel, run_hosted_phase, client, name, options)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(returncode & 0xFF)
+
+    start = time.monotonic()
+    _, status = os.waitpid(pid, 0)
+    returncode = returncode_from_status(status)
+    if returncode < 0 and channel is not None:
+        channel.send(
+            "phase_end",
+            phase=name,
+            returncode=returncode,
+            duration=time.monotonic() - start,
+            reason=exit_reason(returncode),
         )
+    return returncode
+
+
+def exit_reason(returncode):
+    """Describe why a phase ended, from its exit status."""
+    if returncode == 0:
+        return "completed"
+    if returncode == 100:
+        return "exited early"
+    if returncode == 101:
+        return "exited early on failure"
+    if returncode < 0:
+        return f"killed by signal {-returncode}"
+    return "failed"
+
+
+def run_reported_phase(channel, run, client, name, options=None):
+    """Run a phase with run(), reporting its start and end on the channel."""
+    if channel is None:
+        return run(client, name, options)
+
+    channel.send("phase_start", phase=name)
+    start = time.monotonic()
+    usage = summary.resource_usage()
+    with memprofile.profiled(channel, name), tracing.span(f"run {name}", "phase"):
+        returncode = run(client, name, options)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    channel.send(
+        "phase_end",
+        phase=name,
+        returncode=returncode,
+        duration=time.monotonic() - start,
+        reason=exit_reason(returncode),
+        usage=summary.usage_since(usage),
+    )
+    return returncode
+
+
+def serve_phases(client, channel, fork=False, options=None):
+    """Run the phases the wrapper asks for on the channel, until it stops.
+
+    With fork, every phase runs in a forked child of this process. A "run"
+    message may carry the "options" of the configuration to run the phase
+    with, instead of options.
+    """
+    if fork and hasattr(gc, "freeze"):
+        # Keep the objects created by importing insights-core out of the
+        # collector, so it does not touch (and copy) their pages in children
+        gc.freeze()
+
+    for message in channel:
+        if message["type"] == "stop":
+            break
+        if message["type"] != "run":
+            continue
+        phase_options = message.get("options", options)
+        if fork:
+            run_forked_phase(channel, client, message["phase"], phase_options)
+        else:
+            run_reported_phase(channel, run_hosted_phase, client, message["phase"], phase_options)
+    return 0
+
+
+def main():
+    # before importing insights-core, to see what importing it takes
+    memprofile.start()
+    phase_host = os.environ.get("INSIGHTS_PHASE_HOST")
+    tracing.start_from_environ(f"phase {os.environ.get('INSIGHTS_PHASE')}")
+    try:
+        try:
+            with tracing.span("import insights-core", "phase"):
+                from insights.client.phase import v2 as client
+        except ImportError as e:
+            sys.exit(
+                "Error importing insights.client for %s as %s: %s"
+                % (os.environ["INSIGHTS_PHASE"], os.environ["PYTHONPATH"], e)
+            )
+
+        channel = ipc.Channel.from_environ()
+        if channel is not None:
+            instrument.install(channel)
+
+        if phase_host and channel is not None:
+            fork = phase_host == "zygote"
+            sys.exit(serve_phases(client, channel, fork=fork, options=snapshot.read()))
+
+        name = os.environ["INSIGHTS_PHASE"]
+        if channel is None:
+            phase = getattr(client, name)
+            with profiling.profiled(os.environ.get(profiling.ENVIRON_DIR), name):
+                sys.exit(call_phase(phase, snapshot.read()))
+        sys.exit(run_reported_phase(channel, run_hosted_phase, client, name, snapshot.read()))
+    except KeyboardInterrupt:
+        sys.exit(1)
+    except Exception as e:
+        print("Fatal: {0}".format(e))
+        sys.exit(1)
+
 
-    phase = getattr(client, os.environ["INSIGHTS_PHASE"])
-    sys.exit(phase())
-except KeyboardInterrupt:
-    sys.exit(1)
-except Exception as e:
-    print("Fatal: {0}".format(e))
-    sys.exit(1)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""Running insights-client as a long-running service (--daemon).
+
+Instead of systemd starting a new insights-client (which imports
+insights-core and resolves the configuration again) for the collection,
+for the check-ins, for retrieving the results and at boot, the daemon
+schedules all of them itself. It resolves the configuration once (and
+again on SIGHUP), and keeps a zygote phase host (see the run script)
+running, which imports insights-core once and forks a process for every
+phase. Every job is run as the phases insights-core needs for the job's
+options, planned the same way as for a single run. While running, the
+daemon answers the queries of the query module.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import signal
+import time
+
+from . import REGISTERED_FILE
+from . import history
+from . import ipc
+from . import metrics
+from . import planner
+from . import query
+from . import read_host_state
+from . import sd_notify
+from . import settings
+from . import shutdown
+from . import snapshot
+from . import spawn
+from . import splay
+from . import state
+from . import summary
+from . import update_host_state
+
+# How often the daemon wakes up when idle, in seconds
+TICK = 60.0
+
+# The retries of the upload at boot, like insights-client-boot.service
+BOOT_RETRIES = 3
+
+
+logger = logging.getLogger(__name__)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class Job(object):
+    """Something the daemon runs regularly, with the options it runs with."""
+
+    def __init__(self, name, options, interval, due):
+        self.name = name
+        self.options = options
+        # seconds between the runs; 0 when the job only runs when triggered
+        self.interval = interval
+        # time.time() of the next run; None when not scheduled
+        self.due = due
+        self.failures = 0
+
+    def __repr__(self):
+        return f"Job({self.name!r}, due={self.due!r})"
+
+
+class PhaseHost(object):
+    """A zygote phase host running the phases of the jobs, kept between jobs."""
+
+    def __init__(self):
+        self.process = None
+        self.channel = None
+        # the phase the phase host was asked to run and did not end yet
+        self.running = None
+        self._messages = None
+
+    def start(self):
+        channel, channel_fds = ipc.Channel.pair()
+        insights_env = {
+            "INSIGHTS_PHASE": "daemon",
+            "INSIGHTS_PHASE_HOST": "zygote",
+        }
+        self.process = spawn.start(insights_env, channel_fds)
+        self.channel = channel
+        self.running = None
+        self._messages = asyncio.Queue()
+        asyncio.get_running_loop().add_reader(channel.fileno(), self._readable)
+        logger.debug("Started the phase host %d", self.process.pid)
+
+    def _readable(self):
+        for message in self.channel.read():
+            self._messages.put_nowait(message)
+        if self.channel.eof:
+            asyncio.get_running_loop().remove_reader(self.channel.fileno())
+            self._messages.put_nowait(None)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None and not self.channel.eof
+
+    async def run_phase(self, name, options, run_summary=None):
+        """Run the phase with the options; returns its phase_end message or None."""
+        if not self.channel.send("run", phase=name, options=options):
+            return None
+        # still set when the job is cancelled while waiting for the phase
+        self.running = name
+        while True:
+            message = await self._messages.get()
+            if message is None:
+                self.running = None
+                return None
+            spawn.handle_message(message, run_summary)
+            if message["type"] == "phase_end" and message["phase"] == name:
+                self.running = None
+                return message
+
+    async def stop(self, timeout):
+        """Stop the phase host, killing it when it does not stop in time.
+
+        A phase host still running a phase does not read the channel until
+        the phase ends; it is terminated right away instead.
+        """
+        if self.process is None:
+            return
+        if self.running is None:
+            self.channel.send("stop")
+            deadline = time.monotonic() + timeout
+            while self.process.poll() is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+            timeout = 0
+        else:
+            logger.debug("Stopping the phase host running phase '%s'", self.running)
+        if self.process.poll() is None:
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    shutdown.stop, self.process, timeout, group=shutdown.own_process_group()
+                ),
+            )
+        if not self.channel.eof:
+            asyncio.get_running_loop().remove_reader(self.channel.fileno())
+        self.channel.close()
+        self.process = None
+        self.running = None
+        logger.debug("Stopped the phase host")
+
+
+class Daemon(object):
+    """Schedules and runs the jobs of insights-client."""
+
+    def __init__(self, load_config, get_phases, host=None):
+        # returns the resolved insights-core configuration
+        self.load_config = load_config
+        # returns the phases of insights-core
+        self.get_phases = get_phases
+        self.host = host if host is not None else PhaseHost()
+        self.options = None
+        self.settings = None
+        self.jobs = {}
+        self._last_upload = None
+        # the offset of the collection with daemon_splay, see the splay module
+        self._splay_offset = None
+        self._wakeup = None
+        self._reload = False
+        self._stopping = False
+        # the signal the daemon is stopped with, if any
+        self._stop_signum = None
+        # the task of the running job
+        self._job = None
+
+    def load(self):
+        """Resolve the configuration and schedule the jobs for it."""
+        settings.get.cache_clear()
+        self.settings = settings.get()
+        self.options = snapshot.options(self.load_config())
+
+        now = time.time()
+        host_state = read_host_state()
+        last_upload = host_state.last_upload
+        self._last_upload = last_upload
+        collect_interval = self.settings.daemon_collect_interval
+        checkin_interval = self.settings.daemon_checkin_interval
+        self._splay_offset = None
+        if self.settings.daemon_splay and collect_interval > 0:
+            try:
+                machine_id = splay.read_machine_id(splay.MACHINE_ID_FILE)
+            except (OSError, ValueError) as exc:
+                logger.debug("Not spreading the collection: %s", exc)
+            else:
+                window = min(self.settings.splay_window, collect_interval)
+                self._splay_offset = splay.offset(machine_id, window)
+        collect_due = None
+        if collect_interval > 0:
+            if last_upload is not None:
+                collect_due = self._after_collection(last_upload)
+            if collect_due is None or collect_due <= now:
+                # like insights-client.timer with Persistent=true: a collection
+                # missed while the daemon was not running happens right away,
+                # or after the offset of the host with daemon_splay
+                collect_due = now + (self._splay_offset or 0)
+        self.jobs = {
+            "collection": Job("collection", {}, collect_interval, collect_due),
+            "checkin": Job(
+                "checkin",
+                {"checkin": True},
+                checkin_interval,
+                now + checkin_interval if checkin_interval > 0 else None,
+            ),
+            # like insights-client-results.path: after every upload
+            "results": Job("results", {"check_results": True}, 0, None),
+        }
+        if host_state.boot_pending:
+            # like insights-client-boot.service
+            try:
+                os.remove(state.BOOT_FILE)
+            except OSError as exc:
+                logger.debug("Could not remove '%s': %s", state.BOOT_FILE, exc)
+            self.jobs["boot"] = Job("boot", {"retries": BOOT_RETRIES}, 0, now)
+            # the boot job is a collection already
+            if collect_interval > 0:
+                self.jobs["collection"].due = self._after_collection(now)
+
+    def _after_collection(self, end):
+        """Return when the collection is due after one at end."""
+        interval = self.settings.daemon_collect_interval
+        if self._splay_offset is None:
+            return end + interval
+        # at the offset of the host, and not right after the collection
+        return splay.next_time(end + interval / 2, interval, self._splay_offset)
+
+    def _check_upload(self):
+        """Trigger the results job when there was a new upload."""
+        last_upload = _mtime(state.LAST_UPLOAD_FILE)
+        if last_upload is not None and last_upload != self._last_upload:
+            self._last_upload = last_upload
+            self.jobs["results"].due = time.time()
+
+    def next_job(self):
+        """Return the job due next, or None."""
+        scheduled = [job for job in self.jobs.values() if job.due is not None]
+        if not scheduled:
+            return None
+        return min(scheduled, key=lambda job: job.due)
+
+    def reschedule(self, job, success):
+        """Schedule the next run of the job after it ran."""
+        now = time.time()
+        if success:
+            job.failures = 0
+        else:
+            job.failures += 1
+            if job.failures <= self.settings.daemon_retries:
+                job.due = now + self.settings.daemon_retry_delay
+                logger.debug(
+                    "Retrying job '%s' in %.0f seconds", job.name, self.settings.daemon_retry_delay
+                )
+                return
+            job.failures = 0
+        if job.name == "collection" and job.interval > 0:
+            job.due = self._after_collection(now)
+        else:
+            job.due = now + job.interval if job.interval > 0 else None
+        if job.name == "boot" and job.due is None:
+            del self.jobs["boot"]
+
+    async def run_job(self, job):
+        """Run the phases of the job; returns whether it succeeded."""
+        options = dict(self.options, **job.options)
+        # as if the options of the job were given on the command line, which
+        # insights-core tells apart from the configuration files
+        options[snapshot.CLI_OPTIONS] = dict(
+            self.options.get(snapshot.CLI_OPTIONS) or {}, **job.options
+        )
+        phases = self.get_phases()
+        if self.settings.plan_phases:
+            phases = planner.plan(phases, options)
+        logger.debug("Running job '%s'", job.name)
+        sd_notify.notify(f"STATUS=running {job.name}")
+
+        run_summary = summary.RunSummary()
+        success = False
+        exit_code = 1
+        try:
+            success = await self._run_phases(phases, options, run_summary)
+            exit_code = 0 if success else 1
+        except asyncio.CancelledError:
+            logger.debug("Job '%s' interrupted", job.name)
+            if self._stop_signum is not None:
+                run_summary.record_interruption(self.host.running, self._stop_signum, None)
+                exit_code = 128 + self._stop_signum
+            raise
+        finally:
+            update_host_state(run_summary)
+            run_summary.finish(exit_code)
+            run_summary.write()
+            metrics.write(run_summary, self.settings.metrics_dir)
+            history.record(run_summary, self.settings.history_days, history.HISTORY_FILE)
+        logger.debug("Job '%s' %s", job.name, "succeeded" if success else "failed")
+        return success
+
+    async def _run_phases(self, phases, options, run_summary):
+        """Run the phases one after another; returns whether they succeeded."""
+        for phase in phases:
+            name = str(phase["name"])
+            if not self.host.alive():
+                self.host.start()
+            start = time.monotonic()
+            end_message = await self.host.run_phase(name, options, run_summary)
+            returncode = None if end_message is None else end_message["returncode"]
+            run_summary.record_phase(name, returncode, time.monotonic() - start, end_message)
+            if returncode == 0:
+                continue
+            if returncode is None:
+                logger.debug("The phase host died while running phase '%s'", name)
+                await self.host.stop(0)
+            # 100 means the job is done, see handle_phase_result()
+            return returncode == 100
+        return True
+
+    def answer(self, name):
+        """Answer the query; returns None for unknown queries."""
+        if name == "status":
+            return query.status(self.options, REGISTERED_FILE)
+        if name == "last_run":
+            return {"last_run": summary.read()}
+        if name == "results":
+            return query.results()
+        if name == "schedule":
+            return {"jobs": {job.name: job.due for job in self.jobs.values()}}
+        return None
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def request_reload(self):
+        self._reload = True
+        self._wake()
+
+    def request_stop(self, signum=None):
+        """Stop the daemon, interrupting the running job."""
+        self._stopping = True
+        self._stop_signum = signum
+        if self._job is not None:
+            self._job.cancel()
+        self._wake()
+
+    async def _sleep(self, seconds):
+        """Sleep until the time passed, or until woken up by a signal."""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), max(seconds, 0))
+        except asyncio.TimeoutError:
+            pass
+
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGHUP, self.request_reload)
+        for signum in shutdown.SIGNALS:
+            loop.add_signal_handler(signum, self.request_stop, signum)
+        self._wakeup = asyncio.Event()
+
+        self.load()
+        self.host.start()
+        try:
+            server = await query.serve(self.answer, query.SOCKET_PATH)
+        except OSError as exc:
+            logger.debug("Could not answer queries on '%s': %s", query.SOCKET_PATH, exc)
+            server = None
+        sd_notify.notify("READY=1", "STATUS=idle")
+
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                logger.debug("Reloading the configuration")
+                sd_notify.notify("RELOADING=1")
+                await self.host.stop(self.settings.stop_timeout)
+                self.load()
+                self.host.start()
+                sd_notify.notify("READY=1", "STATUS=idle")
+
+            # an idle daemon is making progress as long as it wakes up
+            sd_notify.progress()
+            self._check_upload()
+            job = self.next_job()
+            wait = TICK if job is None else min(TICK, job.due - time.time())
+            if wait > 0:
+                await self._sleep(wait)
+                continue
+
+            self._job = asyncio.ensure_future(self.run_job(job))
+            try:
+                success = await self._job
+            except asyncio.CancelledError:
+                if not self._stopping:
+                    raise
+                break
+            finally:
+                self._job = None
+            self.reschedule(job, success)
+            sd_notify.notify("STATUS=idle")
+
+        sd_notify.notify("STOPPING=1")
+        if server is not None:
+            await query.close(server, query.SOCKET_PATH)
+        await self.host.stop(self.settings.stop_timeout)
+
+
+def run(load_config, get_phases):
+    """Run the daemon until it is stopped.
+
+    load_config() resolves the configuration, get_phases() returns the
+    phases of insights-core.
+    """
+    sd_notify.start_watchdog()
+    try:
+        asyncio.run(Daemon(load_config, get_phases).main())
+    finally:
+        sd_notify.stop_watchdog()
@@ -0,0 +1,150 @@
+"""Notifications to systemd, see sd_notify(3).
+
+The notifications go directly to the socket in $NOTIFY_SOCKET; when not
+running under a Type=notify unit there is no socket and nothing is sent.
+"""
+
+import logging
+import os
+import socket
+import threading
+
+from . import cgroup
+
+# Variables telling a process about its service manager; they are not
+# passed to the phases, which must not notify on their own
+ENVIRON = ("NOTIFY_SOCKET", "WATCHDOG_USEC", "WATCHDOG_PID")
+
+
+logger = logging.getLogger(__name__)
+
+
+def notify(*assignments):
+    """Send the assignments (like 'READY=1') to systemd.
+
+    Returns whether they were sent.
+    """
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        # abstract namespace socket
+        address = "\0" + address[1:]
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall("\n".join(assignments).encode("utf-8"))
+    except OSError as exc:
+        logger.debug("Could not notify systemd of %s: %s", ", ".join(assignments), exc)
+        return False
+    return True
+
+
+def watchdog_interval():
+    """Return how often the watchdog must be pinged, in seconds, or None.
+
+    That is half of the watchdog timeout, as sd_watchdog_enabled(3) advises.
+    """
+    try:
+        usec = int(os.environ["WATCHDOG_USEC"])
+    except (KeyError, ValueError):
+        return None
+    watchdog_pid = os.environ.get("WATCHDOG_PID")
+    if watchdog_pid and watchdog_pid != str(os.getpid()):
+        return None
+    if usec <= 0:
+        return None
+    return usec / 1e6 / 2
+
+
+class Watchdog(object):
+    """Pings the systemd watchdog from a background thread, while making progress.
+
+    Progress is either reported explicitly with progress(), or seen as CPU
+    time used by the cgroup of the unit (or, without cgroup v2, by the phase
+    process being watched). When nothing progressed for a whole interval,
+    the watchdog is not pinged and systemd eventually handles the hung run.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._progressed = True
+        self._pid = None
+        self._last_cpu = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+
+    @classmethod
+    def start_if_enabled(cls):
+        """Start the watchdog if the unit has one; returns it, or None."""
+        interval = watchdog_interval()
+        if interval is None:
+            return None
+        watchdog = cls(interval)
+        watchdog._thread.start()
+        logger.debug("Pinging the systemd watchdog every %.0f seconds", interval)
+        return watchdog
+
+    def progress(self):
+        self._progressed = True
+
+    def watch(self, pid):
+        """Also count the CPU time of the process as progress."""
+        self._pid = pid
+
+    def _cpu(self):
+        usage = cgroup.cpu_usage_usec()
+        if usage is None and self._pid is not None:
+            usage = cgroup.process_cpu_ticks(self._pid)
+        return usage
+
+    def _made_progress(self):
+        cpu = self._cpu()
+        progressed = self._progressed or (cpu is not None and cpu != self._last_cpu)
+        self._progressed = False
+        self._last_cpu = cpu
+        return progressed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._made_progress():
+                notify("WATCHDOG=1")
+            else:
+                logger.debug(
+                    "No progress for %.0f seconds, not pinging the watchdog", self.interval
+                )
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+# The watchdog of this run, if the unit has one
+_watchdog = None
+
+
+def start_watchdog():
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = Watchdog.start_if_enabled()
+
+
+def stop_watchdog():
+    global _watchdog
+    if _watchdog is not None:
+        _watchdog.stop()
+        _watchdog = None
+
+
+def progress():
+    """Tell the watchdog the run is making progress."""
+    if _watchdog is not None:
+        _watchdog.progress()
+
+
+def watch(pid):
+    """Tell the watchdog which phase process is running."""
+    if _watchdog is not None:
+        _watchdog.watch(pid)
@@ -0,0 +1,153 @@
+"""Settings of the insights-client wrapper.
+
+insights-core owns the ``[insights-client]`` section of insights-client.conf.
+Options which only affect how the wrapper runs insights-core live in the
+``[wrapper]`` section of the same file, which insights-core ignores.
+"""
+
+import configparser
+import functools
+import logging
+
+CONFIG_FILE = "/etc/insights-client/insights-client.conf"
+SECTION = "wrapper"
+
+PHASE_MODES = ("spawn", "host", "zygote")
+PRESSURE_SOURCES = ("system", "cgroup")
+
+DEFAULTS = {
+    # spawn: one interpreter per phase; host: one interpreter for all phases;
+    # zygote: one interpreter importing insights-core, forking for each phase
+    "phase_mode": "spawn",
+    # skip the phases which have nothing to do for the given options; off
+    # by default, as it relies on what the phases of insights-core do, see
+    # the planner module
+    "plan_phases": False,
+    # pass the output of the phases through the wrapper, see the relay module
+    "relay_output": True,
+    # seconds the phases get to exit when the wrapper is stopped, before
+    # they are killed
+    "stop_timeout": 10.0,
+    # outside of the systemd units, apply the resource limits of the units
+    # to the run, see the envelope module
+    "limit_resources": True,
+    # pause the phases while the share of time tasks stall on the resource
+    # is over the threshold, in %; 0 disables it, see the pressure module
+    "pressure_cpu": 0.0,
+    "pressure_io": 0.0,
+    "pressure_memory": 0.0,
+    # system: the pressure of the whole host; cgroup: of insights-client only
+    "pressure_source": "system",
+    # the most seconds a run spends paused
+    "pressure_max_pause": 300.0,
+    # --daemon: seconds between the collections and between the check-ins
+    # (0 disables them), and how often and after how many seconds a failed
+    # job is retried, see the scheduler module
+    "daemon_collect_interval": 86400.0,
+    "daemon_checkin_interval": 3600.0,
+    "daemon_retries": 3,
+    "daemon_retry_delay": 900.0,
+    # the seconds from midnight the runs of a fleet are spread over by the
+    # machine-id of the hosts, and whether the daemon schedules the
+    # collection that way, see the splay module
+    "splay_window": 14400.0,
+    "daemon_splay": False,
+    # --boot: the collection waits until the load average per CPU and the
+    # pressure of the CPU, I/O and memory (in %) are under these (0 disables
+    # the check), and until no systemd jobs are queued, for boot_max_delay
+    # seconds at most; the archive of the last run is uploaded again instead
+    # when not older than boot_reuse_archive seconds (0 disables it), see the
+    # boot module
+    "boot_max_load": 1.0,
+    "boot_max_pressure": 10.0,
+    "boot_wait_jobs": True,
+    "boot_max_delay": 600.0,
+    "boot_reuse_archive": 0.0,
+    # record the timeline of every run, see the tracing module
+    "trace": True,
+    # the textfile collector directory of node_exporter to write the metrics
+    # of every run to; empty disables it, see the metrics module
+    "metrics_dir": "",
+    # days the runs are kept in the history; 0 disables it, see the history
+    # module
+    "history_days": 365,
+    # the file to log to as JSON lines, rotated once over json_log_max_size
+    # MiB and keeping json_log_max_total MiB at most; empty disables it, see
+    # the jsonlog module
+    "json_log": "",
+    "json_log_max_size": 10.0,
+    "json_log_max_total": 50.0,
+}
+
+CHOICES = {
+    "phase_mode": PHASE_MODES,
+    "pressure_source": PRESSURE_SOURCES,
+}
+
+
+logger = logging.getLogger(__name__)
+
+
+class Settings(object):
+    """Values of the wrapper options, accessible as attributes."""
+
+    def __init__(self, **values):
+        self.__dict__.update(DEFAULTS)
+        self.__dict__.update(values)
+
+    def __repr__(self):
+        items = ", ".join(f"{key}={value!r}" for key, value in sorted(self.__dict__.items()))
+        return f"Settings({items})"
+
+
+def _convert(name, value):
+    """Convert a raw string value to the type of the option's default."""
+    default = DEFAULTS[name]
+    try:
+        if isinstance(default, bool):
+            if value.lower() in ("true", "yes", "on", "1"):
+                return True
+            if value.lower() in ("false", "no", "off", "0"):
+                return False
+            raise ValueError(value)
+        if isinstance(default, int):
+            return int(value)
+        if isinstance(default, float):
+            return float(value)
+    except ValueError:
+        raise ValueError(f"Invalid value specified for {name}: {value}.")
+
+    if name in CHOICES and value not in CHOICES[name]:
+        raise ValueError(
+            f"Invalid value specified for {name}: {value}. "
+            f"Valid options are: {', '.join(CHOICES[name])}."
+        )
+    return value
+
+
+def load(path=CONFIG_FILE):
+    """Read the wrapper settings from the configuration file.
+
+    A missing file or section means all the options have their default
+    values. An invalid value raises ValueError.
+    """
+    parser = configparser.RawConfigParser()
+    try:
+        parser.read(path)
+    except configparser.Error as exc:
+        raise ValueError(f"Could not parse {path}: {exc}")
+
+    values = {}
+    if parser.has_section(SECTION):
+        for name, value in parser.items(SECTION):
+            if name not in DEFAULTS:
+                logger.warning("Unknown option in section [%s] of %s: %s", SECTION, path, name)
+                continue
+            values[name] = _convert(name, value)
+    return Settings(**values)
+
+
+@functools.lru_cache(maxsize=None)
+def get():
+    """Return the wrapper settings, reading the configuration file once."""
+    return load()
@@ -0,0 +1,105 @@
+"""Stopping the phases when the wrapper is asked to stop.
+
+When systemd stops the unit (SIGTERM) or its watchdog fires (SIGABRT), the
+signal interrupts the wrapper wherever it waits for a phase. The wrapper
+then stops the process group of the phase: SIGTERM first, and SIGKILL for
+what is still running after a grace period. Finally the wrapper ends with
+the signal it received, so that its own exit status tells what happened.
+"""
+
+import logging
+import os
+import signal
+import sys
+
+# Signals which make the wrapper stop the phases and exit
+SIGNALS = (signal.SIGTERM, signal.SIGABRT)
+
+
+logger = logging.getLogger(__name__)
+
+
+class Interrupted(BaseException):
+    """The wrapper received one of the SIGNALS."""
+
+    def __init__(self, signum):
+        super(Interrupted, self).__init__(signum)
+        self.signum = signum
+
+    def __str__(self):
+        return f"interrupted by {signal.Signals(self.signum).name}"
+
+
+def _interrupt(signum, frame):
+    # stopping the phases is not to be interrupted again
+    for other in SIGNALS:
+        signal.signal(other, signal.SIG_IGN)
+    raise Interrupted(signum)
+
+
+def install():
+    """Turn the SIGNALS into Interrupted exceptions."""
+    for signum in SIGNALS:
+        signal.signal(signum, _interrupt)
+
+
+def signum_of(exc):
+    """Return the signal which interrupted the wrapper with exc."""
+    if isinstance(exc, Interrupted):
+        return exc.signum
+    return signal.SIGINT
+
+
+def own_process_group():
+    """Whether the phase processes are to run in their own process group.
+
+    Not when the phases may have to read from the terminal: in a process
+    group of their own they would be stopped by SIGTTIN, or would have no
+    controlling terminal at all to ask for a password.
+    """
+    try:
+        return not sys.stdin.isatty()
+    except (AttributeError, ValueError):
+        return True
+
+
+def _kill(process, signum, group):
+    try:
+        if group:
+            os.killpg(process.pid, signum)
+        else:
+            process.send_signal(signum)
+    except ProcessLookupError:
+        pass
+
+
+def stop(process, timeout, group=True):
+    """Stop the phase process and, with group, all the processes in its group.
+
+    Returns the return code of the phase process.
+    """
+    if process.poll() is not None and not group:
+        return process.returncode
+
+    import subprocess
+
+    _kill(process, signal.SIGTERM, group)
+    # a phase paused under pressure has to run to handle SIGTERM
+    _kill(process, signal.SIGCONT, group)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        logger.debug("Phase process still running after %s seconds, killing it", timeout)
+    # leftover processes of the group are killed even when the phase exited
+    _kill(process, signal.SIGKILL, group)
+    return process.wait()
+
+
+def reraise(signum):
+    """End the wrapper with the signal, the way it would without a handler."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+    # in case the signal is blocked
+    sys.exit(128 + signum)
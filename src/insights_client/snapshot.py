@@ -0,0 +1,84 @@
+"""Snapshot of the resolved insights-core configuration.
+
+The wrapper resolves the configuration (CLI flags, insights-client.conf and
+INSIGHTS_* environment variables) once; the snapshot of it is handed to the
+phases on an inherited file descriptor of an unlinked temporary file, so
+that every phase sees exactly the same configuration without resolving it
+again. A phase which cannot read the snapshot resolves the configuration
+on its own, as before.
+"""
+
+import json
+import logging
+import os
+import tempfile
+
+ENVIRON_FD = "INSIGHTS_CONFIG_FD"
+
+# The options given on the command line, which insights-core tells apart
+# from those of the configuration files (like --display-name); kept in the
+# options under the name of the attribute of the configuration
+CLI_OPTIONS = "_cli_opts"
+
+
+logger = logging.getLogger(__name__)
+
+
+def options(config):
+    """Return the public options of the configuration as a dict.
+
+    The options given on the command line are under CLI_OPTIONS, if known.
+    """
+    values = config if isinstance(config, dict) else vars(config)
+    result = {key: value for key, value in values.items() if not key.startswith("_")}
+    if values.get(CLI_OPTIONS) is not None:
+        result[CLI_OPTIONS] = dict(values[CLI_OPTIONS])
+    return result
+
+
+def write(config):
+    """Write the snapshot of the configuration into an unlinked temporary file.
+
+    Returns the file object, or None if the configuration cannot be stored.
+    """
+    try:
+        data = json.dumps(options(config))
+    except (TypeError, ValueError) as exc:
+        logger.debug("Could not serialize the configuration, not passing it to phases: %s", exc)
+        return None
+
+    snapshot = tempfile.TemporaryFile(prefix="insights-client-config-")
+    snapshot.write(data.encode("utf-8"))
+    snapshot.flush()
+    return snapshot
+
+
+def environ(snapshot):
+    """Return the environment variables telling a phase where the snapshot is."""
+    if snapshot is None:
+        return {}
+    return {ENVIRON_FD: str(snapshot.fileno())}
+
+
+def pass_fds(snapshot):
+    if snapshot is None:
+        return ()
+    return (snapshot.fileno(),)
+
+
+def read():
+    """Read the snapshot passed by the wrapper.
+
+    Returns the options as a dict, or None if there is no snapshot or it
+    cannot be read.
+    """
+    if ENVIRON_FD not in os.environ:
+        return None
+    try:
+        fd = int(os.environ[ENVIRON_FD])
+        # pread() does not move the file offset shared with the other phases
+        data = os.pread(fd, os.fstat(fd).st_size, 0)
+        return json.loads(data.decode("utf-8"))
+    except (OSError, ValueError) as exc:
+        logger.debug("Could not read the configuration snapshot: %s", exc)
+        return None
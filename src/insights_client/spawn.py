@@ -0,0 +1,188 @@
+"""Starting the run script for the phases, and handling what they send.
+
+The wrapper running the phases of a single run and the daemon keeping a
+phase host between its jobs (see the scheduler module) start the run script
+the same way: with the INSIGHTS_* variables of the phase set in its
+environment only, with the ends of the message channel (see the ipc module)
+it inherits, and in the SELinux context of insights-core when
+insights-client was built with a policy for it.
+"""
+
+import functools
+import logging
+import os
+import sys
+
+from . import ipc
+from . import logpipe
+from . import sd_notify
+from . import shutdown
+from . import snapshot
+
+try:
+    from .constants import CORE_SELINUX_POLICY
+except ImportError:
+    # The source file is build from 'constants.py.in' and is not
+    # available during development
+    CORE_SELINUX_POLICY = ""
+
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def switch_core_selinux_policy():
+    """Whether the phases are to run in the SELinux context of insights-core."""
+    # if there is a policy for insights-core, unconditionally try to interface
+    # with SELinux: insights-client was built with a policy for insights-core,
+    # so not being able to apply that is an hard failure
+    if CORE_SELINUX_POLICY != "":
+        import selinux
+
+        return selinux.is_selinux_enabled()
+    return False
+
+
+def debug_environ(environ):
+    items = map(lambda item: f"{item[0]}={item[1]}", environ.items())
+    return " ".join(items)
+
+
+def debug_command(command, environ=None):
+    if environ:
+        full_command = [debug_environ(environ)] + command
+    else:
+        full_command = command
+    # Please note that neither spaces nor any other special characters are quoted.
+    return " ".join(full_command)
+
+
+def command():
+    """Build the command which starts the run script."""
+    return [
+        sys.executable,
+        os.path.join(os.path.dirname(__file__), "run.py"),
+    ] + sys.argv[1:]
+
+
+def _switch_selinux_context():
+    """Make the next executed program run in the insights-core SELinux context."""
+    if not switch_core_selinux_policy():
+        return
+    from . import tracing
+
+    with tracing.span("switch SELinux context", "wrapper"):
+        _switch_selinux_exec_context()
+
+
+def _switch_selinux_exec_context():
+    import selinux
+
+    # SELinux context switch into insights-core is allowed and preferred
+    context = selinux.context_new(selinux.getcon()[1])
+    source_type = selinux.context_type_get(context)
+
+    if source_type in ("unconfined_t", "sysadm_t", "unconfined_service_t"):
+        # Do not transition into insights-core context if we're running
+        # in privileged context already.
+        logger.debug(f"Staying in SELinux context {source_type}")
+    else:
+        # Do transition insights-core context if we're running in
+        # other (unknown), confined context.
+        logger.debug(f"Switching SELinux context from {source_type} to {CORE_SELINUX_POLICY}")
+        selinux.context_type_set(context, CORE_SELINUX_POLICY)
+        new_core_context = selinux.context_str(context)
+        selinux.setexeccon(new_core_context)
+    selinux.context_free(context)
+
+
+def _reset_selinux_context():
+    if not switch_core_selinux_policy():
+        return
+    import selinux
+
+    # setexeccon() in theory ought to reset the context for the next
+    # execv*() after that execution; it does not seem to happen though,
+    # so for now manually reset it
+    selinux.setexeccon(None)
+    logger.debug("Switched to the original SELinux context")
+
+
+def start(insights_env, channel_fds, config_snapshot=None, output=None):
+    """Start the run script with the given INSIGHTS_* environment variables.
+
+    channel_fds are the ends of the message channel the process inherits;
+    they are closed in the wrapper once the process is started. The output
+    of the process goes to the pipes of output, if given, see the relay
+    module.
+    """
+    # not imported by the invocations not running any phase
+    import subprocess
+
+    from . import memprofile
+    from . import profiling
+    from . import tracing
+
+    insights_env.update(ipc.Channel.environ(channel_fds))
+    insights_env.update(snapshot.environ(config_snapshot))
+    insights_env.update(profiling.environ())
+    insights_env.update(memprofile.environ())
+    insights_env.update(tracing.environ())
+    if output is not None:
+        insights_env.update(output.environ())
+    env = dict(os.environ, **insights_env)
+    for name in sd_notify.ENVIRON:
+        env.pop(name, None)
+
+    logger.debug("Running %s", logpipe.Lazy(debug_command, command(), insights_env))
+    streams = {}
+    if output is not None:
+        streams = {"stdout": output.stdout_fd, "stderr": output.stderr_fd}
+
+    _switch_selinux_context()
+    try:
+        process = subprocess.Popen(
+            command(),
+            env=env,
+            pass_fds=tuple(channel_fds) + snapshot.pass_fds(config_snapshot),
+            start_new_session=shutdown.own_process_group(),
+            **streams,
+        )
+    finally:
+        # the context applies to the program executed next only, which the
+        # process is, or failed to be
+        _reset_selinux_context()
+        ipc.close_fds(channel_fds)
+        if output is not None:
+            output.started()
+    sd_notify.watch(process.pid)
+    return process
+
+
+def handle_message(message, run_summary=None):
+    """Act on a message a phase sent to the wrapper."""
+    sd_notify.progress()
+    if run_summary is not None:
+        run_summary.record_message(message)
+
+    message_type = message["type"]
+    if message_type == "phase_start":
+        logger.debug("phase '%s' started", message["phase"])
+    elif message_type == "phase_end":
+        logger.debug(
+            "phase '%s' %s after %.2f seconds",
+            message["phase"],
+            message["reason"],
+            message["duration"],
+        )
+    elif message_type == "log":
+        logpipe.handle(message)
+    elif message_type == "archive":
+        logger.debug("archive '%s' created, %s bytes", message["path"], message["size"])
+    elif message_type == "upload":
+        logger.debug(
+            "upload of %s bytes %s after %.2f seconds",
+            message["size"],
+            "succeeded" if message["success"] else "failed",
+            message["duration"],
+        )
@@ -0,0 +1,115 @@
+"""Spreading the runs of a fleet over a window of the day, by machine-id.
+
+With RandomizedDelaySec, every host picks another delay at every boot, so
+hosts cloned or rebooted together reach Red Hat Insights (or Satellite and
+the proxies in between) in uneven bursts. Here, every host gets a fixed
+offset into the window of splay_window seconds starting at midnight,
+derived from a hash of its machine-id: the hosts of a fleet are spread
+evenly over the window, and every host runs at the same time every day.
+
+--splay-timer writes a drop-in for insights-client.timer running at the
+offset of the host; with daemon_splay, the daemon schedules the collection
+at it. --simulate-splay HOSTS shows how a fleet of HOSTS hosts would be
+spread.
+"""
+
+import hashlib
+import os
+import random
+import sys
+
+MACHINE_ID_FILE = "/etc/machine-id"
+
+TIMER_DROPIN = "/etc/systemd/system/insights-client.timer.d/splay.conf"
+
+# Mixed into the hash, so that the offset is not that of other tools hashing
+# the machine-id
+SALT = b"insights-client splay\n"
+
+# The widest bar of --simulate-splay
+BAR_WIDTH = 50
+
+
+def read_machine_id(path=MACHINE_ID_FILE):
+    """Return the machine-id of the host; raises OSError or ValueError."""
+    with open(path) as f:
+        machine_id = f.read().strip()
+    if not machine_id:
+        raise ValueError(f"{path} is empty")
+    return machine_id
+
+
+def offset(machine_id, window):
+    """Return the offset of the host into the window, in whole seconds."""
+    if window <= 0:
+        return 0
+    digest = hashlib.sha256(SALT + machine_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") * int(window) >> 64
+
+
+def next_time(after, interval, host_offset):
+    """Return the first time from after on that is host_offset past a multiple of interval."""
+    if interval <= 0:
+        return after
+    periods = -(-(after - host_offset) // interval)
+    return periods * interval + host_offset
+
+
+def timer_dropin(host_offset):
+    """Return the drop-in of insights-client.timer running at the offset past midnight."""
+    hours, rest = divmod(int(host_offset), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return (
+        "# Written by insights-client --splay-timer: runs at a fixed time of the day,\n"
+        "# derived from the machine-id, instead of a random one.\n"
+        "[Timer]\n"
+        "OnCalendar=\n"
+        f"OnCalendar=*-*-* {hours:02d}:{minutes:02d}:{seconds:02d}\n"
+        "RandomizedDelaySec=0\n"
+    )
+
+
+def write_timer(window, path=TIMER_DROPIN, machine_id_file=MACHINE_ID_FILE):
+    """Write the drop-in of insights-client.timer for this host; returns the exit code."""
+    try:
+        host_offset = offset(read_machine_id(machine_id_file), min(window, 86400))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(timer_dropin(host_offset))
+    except (OSError, ValueError) as exc:
+        print(f"Cannot write the timer drop-in '{path}': {exc}", file=sys.stderr)
+        return 1
+    print(f"Wrote '{path}'; run 'systemctl daemon-reload' to use it.")
+    return 0
+
+
+def simulate(hosts, window, seed=0):
+    """Return the lines of the per-minute histogram of hosts with random machine-ids."""
+    rng = random.Random(seed)
+    minutes = [0] * max(1, -(-int(window) // 60))
+    for _ in range(hosts):
+        machine_id = f"{rng.getrandbits(128):032x}"
+        minutes[offset(machine_id, window) // 60] += 1
+
+    counts = sorted(minutes)
+    mean = hosts / len(minutes)
+    lines = [
+        f"{hosts} hosts over {len(minutes)} minutes: {mean:.1f} requests per minute on average,"
+        f" {counts[0]} at least, {counts[len(counts) // 2]} in the median minute,"
+        f" {counts[-1]} at most",
+        "",
+    ]
+    scale = BAR_WIDTH / counts[-1] if counts[-1] else 0
+    for minute, count in enumerate(minutes):
+        bar = "#" * round(count * scale)
+        lines.append(f"{minute // 60:02d}:{minute % 60:02d}  {count:6d}  {bar}")
+    return lines
+
+
+def report(hosts, window):
+    """Print the simulation of the fleet; returns the exit code."""
+    if hosts <= 0:
+        print("The fleet needs at least one host.", file=sys.stderr)
+        return 1
+    print("\n".join(simulate(hosts, window)))
+    return 0
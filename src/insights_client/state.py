@@ -0,0 +1,129 @@
+"""The state of the host, as told by the stamp files.
+
+insights-core, the systemd units and the packaging keep the state of the
+host in stamp files under /etc/insights-client: .registered and
+.unregistered, .lastupload (watched by insights-client-results.path) and
+.run_insights_client_next_boot (for insights-client-boot.service). They
+stay where they are, as they are, for all of them.
+
+The wrapper reads them once per run into a State, makes its decisions
+(like the MOTD) from it, and writes it to STATE_FILE, atomically replaced,
+so that everything wanting the whole state reads one file.
+"""
+
+import json
+import logging
+import os
+import stat
+import time
+
+STATE_FILE = "/var/lib/insights/insights-client-state.json"
+
+LAST_UPLOAD_FILE = "/etc/insights-client/.lastupload"
+BOOT_FILE = "/etc/insights-client/.run_insights_client_next_boot"
+
+# What the MOTD file is
+MOTD_UNSUPPORTED = "unsupported"  # there is no MOTD directory
+MOTD_DISABLED = "disabled"  # it points at /dev/null
+MOTD_PRESENT = "present"
+MOTD_ABSENT = "absent"
+
+
+logger = logging.getLogger(__name__)
+
+
+def _stat(path, follow_symlinks=True):
+    try:
+        return os.stat(path, follow_symlinks=follow_symlinks)
+    except OSError:
+        return None
+
+
+def _motd(motd_file):
+    link = _stat(motd_file, follow_symlinks=False)
+    if link is None:
+        if _stat(os.path.dirname(motd_file)) is None:
+            return MOTD_UNSUPPORTED
+        return MOTD_ABSENT
+    try:
+        target = os.stat(motd_file) if stat.S_ISLNK(link.st_mode) else link
+        devnull = os.stat(os.devnull)
+    except OSError:
+        # a dangling symbolic link
+        return MOTD_PRESENT
+    if (target.st_dev, target.st_ino) == (devnull.st_dev, devnull.st_ino):
+        return MOTD_DISABLED
+    return MOTD_PRESENT
+
+
+class State(object):
+    """The state of the host at one point of time."""
+
+    def __init__(
+        self,
+        registered=False,
+        unregistered=False,
+        last_upload=None,
+        boot_pending=False,
+        motd=MOTD_ABSENT,
+    ):
+        self.registered = registered
+        self.unregistered = unregistered
+        # the time of the last upload, or None
+        self.last_upload = last_upload
+        # whether there is a run to do at the next boot
+        self.boot_pending = boot_pending
+        # one of the MOTD_* values
+        self.motd = motd
+
+    @classmethod
+    def read(cls, registered_file, unregistered_file, motd_file):
+        """Read the state from the stamp files."""
+        last_upload = _stat(LAST_UPLOAD_FILE)
+        return cls(
+            registered=_stat(registered_file) is not None,
+            unregistered=_stat(unregistered_file) is not None,
+            last_upload=None if last_upload is None else last_upload.st_mtime,
+            boot_pending=_stat(BOOT_FILE) is not None,
+            motd=_motd(motd_file),
+        )
+
+    @property
+    def motd_wanted(self):
+        """Whether the MOTD should be displayed: neither registered nor unregistered yet."""
+        return not self.registered and not self.unregistered
+
+    def as_dict(self):
+        return {
+            "registered": self.registered,
+            "unregistered": self.unregistered,
+            "last_upload": self.last_upload,
+            "boot_pending": self.boot_pending,
+            "motd": self.motd,
+        }
+
+
+def write(host_state, path=STATE_FILE):
+    """Write the state atomically; failures are only logged."""
+    data = dict(host_state.as_dict(), updated=time.time())
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, path)
+    except OSError as exc:
+        logger.debug("Could not write the state '%s': %s", path, exc)
+
+
+def read(path=STATE_FILE):
+    """Return the state last written, or None."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    data.pop("updated", None)
+    try:
+        return State(**data)
+    except TypeError:
+        return None
@@ -0,0 +1,181 @@
+"""Summary of a run: the phases run and the resources they used.
+
+The wrapper collects the summary from the messages of the phases (see the
+ipc module) and writes it as JSON to /var/lib/insights at the end of the
+run, so that the resource limits of the systemd units can be sized from
+actual usage.
+"""
+
+import json
+import logging
+import os
+import resource
+import signal
+import time
+
+RUN_SUMMARY_FILE = "/var/lib/insights/insights-client-run.json"
+
+# Next to the run summary, with --memory-profile
+MEMORY_PROFILE_FILENAME = "insights-client-memory.json"
+
+# ru_inblock and ru_oublock count 512-byte blocks
+BLOCK_SIZE = 512
+
+
+logger = logging.getLogger(__name__)
+
+
+def resource_usage():
+    """Return the resources used by this process and its waited-for children."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "utime": own.ru_utime + children.ru_utime,
+        "stime": own.ru_stime + children.ru_stime,
+        # ru_maxrss is the peak of a single process, in kilobytes
+        "max_rss_kb": max(own.ru_maxrss, children.ru_maxrss),
+        "block_read_bytes": (own.ru_inblock + children.ru_inblock) * BLOCK_SIZE,
+        "block_write_bytes": (own.ru_oublock + children.ru_oublock) * BLOCK_SIZE,
+    }
+
+
+def usage_since(before):
+    """Return the resources used since resource_usage() returned before.
+
+    The peak RSS cannot be subtracted; it is the peak so far.
+    """
+    after = resource_usage()
+    usage = {key: after[key] - before[key] for key in after if key != "max_rss_kb"}
+    usage["max_rss_kb"] = after["max_rss_kb"]
+    return usage
+
+
+def exit_code(code):
+    """Return the exit status of the process for the code of a SystemExit."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    return 1
+
+
+class RunSummary(object):
+    """What happened during a run of the wrapper."""
+
+    def __init__(self, path=RUN_SUMMARY_FILE):
+        self.path = path
+        self.started = time.time()
+        self._start = time.monotonic()
+        self._usage = resource_usage()
+        self.phases = []
+        self.archive = None
+        self.upload = None
+        self.interruption = None
+        self.pauses = []
+        # phase -> its memory profile, see the memprofile module
+        self.memory = {}
+        self.exit_code = None
+        self.duration = None
+        self.usage = None
+
+    def record_message(self, message):
+        """Record what a message of a phase tells about the run."""
+        if message["type"] == "archive":
+            self.archive = {"path": message["path"], "size": message["size"]}
+            if "uncompressed_size" in message:
+                self.archive["uncompressed_size"] = message["uncompressed_size"]
+        elif message["type"] == "upload":
+            self.upload = {key: message[key] for key in ("size", "duration", "success")}
+            if message.get("attempts") is not None:
+                self.upload["attempts"] = message["attempts"]
+        elif message["type"] == "memory":
+            self.memory[message["phase"]] = {
+                "peak": message["peak"],
+                "snapshots": message["snapshots"],
+            }
+
+    def record_phase(self, name, returncode, wall, end_message=None, output_tail=None):
+        """Record a finished phase.
+
+        wall is the time the wrapper waited for the phase; end_message is
+        the phase_end message of the phase, if it sent one; output_tail are
+        the last lines of output of a failed phase.
+        """
+        phase = {"name": name, "returncode": returncode, "wall": wall}
+        if end_message is not None:
+            phase["reason"] = end_message.get("reason")
+            phase.update(end_message.get("usage") or {})
+        if output_tail:
+            phase["output_tail"] = output_tail
+        self.phases.append(phase)
+
+    def record_pause(self, name, action, duration, resource_name, pressure):
+        """Record that a phase was paused (or deferred) because of pressure."""
+        self.pauses.append(
+            {
+                "phase": name,
+                "action": action,
+                "duration": duration,
+                "resource": resource_name,
+                "pressure": pressure,
+            }
+        )
+
+    def record_interruption(self, name, signum, returncode):
+        """Record that the wrapper was stopped by the signal while running a phase.
+
+        name is None when no phase was running; returncode is the one of the
+        phase process once it was stopped.
+        """
+        self.interruption = {
+            "phase": name,
+            "signal": signal.Signals(signum).name,
+            "returncode": returncode,
+        }
+
+    def finish(self, exit_code):
+        self.exit_code = exit_code
+        self.duration = time.monotonic() - self._start
+        # everything the wrapper and all the phases used
+        self.usage = usage_since(self._usage)
+
+    def as_dict(self):
+        return {
+            "started": self.started,
+            "duration": self.duration,
+            "exit_code": self.exit_code,
+            "phases": self.phases,
+            "archive": self.archive,
+            "upload": self.upload,
+            "interruption": self.interruption,
+            "pauses": self.pauses,
+            "usage": self.usage,
+        }
+
+    def write(self):
+        """Write the summary (and the memory profiles) atomically; failures are only logged."""
+        _write_json(self.as_dict(), self.path, "run summary")
+        if self.memory:
+            path = os.path.join(os.path.dirname(self.path), MEMORY_PROFILE_FILENAME)
+            _write_json(self.memory, path, "memory profiles")
+
+
+def _write_json(data, path, what):
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, path)
+    except OSError as exc:
+        logger.debug("Could not write the %s '%s': %s", what, path, exc)
+        return
+    logger.debug("%s written to '%s'", what.capitalize(), path)
+
+
+def read(path=RUN_SUMMARY_FILE):
+    """Return the summary of the last run, or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -2,6 +2,8 @@ import pathlib
 import sys
 from unittest import mock
 
+import pytest
+
 
 def pytest_configure(config):
     repo_root = pathlib.Path(__file__).parents[3]
@@ -16,3 +18,22 @@ def pytest_configure(config):
     # Hijack sys.path, so we don't have to use 'PYTHONPATH=src/'
     sources: pathlib.Path = repo_root / "src"
     sys.path.insert(0, str(sources))
+
+
+class CoreConfig(object):
+    """Stand-in for InsightsConfig, which resets the options of the command line.
+
+    insights-core sets _cli_opts only when loading the command line, and
+    checks it for the options which were given there, like --display-name.
+    """
+
+    def __init__(self, **options):
+        self.__dict__.update(options)
+        self._cli_opts = None
+
+
+@pytest.fixture
+def core_config():
+    config_module = sys.modules["insights.client.config"]
+    with mock.patch.object(config_module, "InsightsConfig", CoreConfig):
+        yield CoreConfig
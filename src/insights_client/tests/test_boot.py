@@ -0,0 +1,105 @@
+import json
+import os
+import time
+
+import pytest
+
+from insights_client import boot
+from insights_client import cli
+from insights_client import pressure
+from insights_client import settings
+
+
+@pytest.fixture
+def system(monkeypatch):
+    """The state of the system, as read by the boot module."""
+    values = {"load": 0.2, "pressure": {}, "jobs": 0}
+    monkeypatch.setattr(boot, "load_per_cpu", lambda: values["load"])
+    monkeypatch.setattr(
+        pressure, "read", lambda name, source="system": values["pressure"].get(name)
+    )
+    monkeypatch.setattr(boot, "pending_jobs", lambda: values["jobs"])
+    monkeypatch.setattr(boot, "POLL_INTERVAL", 0.01)
+    return values
+
+
+def test_unsettled(system):
+    wrapper_settings = settings.Settings()
+    assert boot.unsettled(wrapper_settings) is None
+
+    system["jobs"] = 12
+    assert boot.unsettled(wrapper_settings) == "12 systemd jobs queued"
+    assert boot.unsettled(settings.Settings(boot_wait_jobs=False)) is None
+
+    system["pressure"] = {"io": 35.5}
+    assert boot.unsettled(wrapper_settings) == "io pressure 35.5%"
+
+    system["load"] = 2.5
+    assert boot.unsettled(wrapper_settings) == "load 2.50 per CPU"
+    assert boot.unsettled(settings.Settings(boot_max_load=0.0)) == "io pressure 35.5%"
+
+
+def test_wait_until_settled(system, monkeypatch):
+    checks = []
+
+    def unsettled(wrapper_settings):
+        checks.append(time.monotonic())
+        return "load 3.00 per CPU" if len(checks) < 3 else None
+
+    monkeypatch.setattr(boot, "unsettled", unsettled)
+    assert boot.wait(settings.Settings())
+    assert len(checks) == 3
+
+
+def test_wait_at_most_max_delay(system):
+    system["jobs"] = 4
+    start = time.monotonic()
+    assert not boot.wait(settings.Settings(boot_max_delay=0.05))
+    assert time.monotonic() - start < 1
+
+
+def _last_run(tmp_path, archive):
+    path = tmp_path / "insights-client-run.json"
+    path.write_text(json.dumps({"archive": {"path": str(archive), "size": 10}}))
+    return str(path)
+
+
+def test_prepare_reuses_recent_archive(tmp_path, system):
+    archive = tmp_path / "insights-host-20261018101500.tar.gz"
+    archive.write_bytes(b"archive")
+    run_summary_file = _last_run(tmp_path, archive)
+    system["jobs"] = 4
+
+    wrapper_settings = settings.Settings(boot_reuse_archive=3600.0, boot_max_delay=10.0)
+    start = time.monotonic()
+    assert boot.prepare(wrapper_settings, run_summary_file) == [
+        "--payload",
+        str(archive),
+        "--content-type",
+        "gz",
+    ]
+    # nothing is collected, so nothing waited for
+    assert time.monotonic() - start < 1
+
+
+def test_prepare_collects_without_recent_archive(tmp_path, system):
+    archive = tmp_path / "insights-host-20261018101500.tar.gz"
+    archive.write_bytes(b"archive")
+    two_hours_ago = time.time() - 7200
+    os.utime(archive, (two_hours_ago, two_hours_ago))
+    run_summary_file = _last_run(tmp_path, archive)
+
+    wrapper_settings = settings.Settings(boot_reuse_archive=3600.0)
+    assert boot.prepare(wrapper_settings, run_summary_file) == []
+    # disabled
+    assert boot.recent_archive(0.0, run_summary_file) is None
+    assert boot.recent_archive(10000.0, run_summary_file) == str(archive)
+    archive.unlink()
+    assert boot.recent_archive(10000.0, run_summary_file) is None
+    assert boot.recent_archive(10000.0, str(tmp_path / "missing.json")) is None
+
+
+def test_cli_parse():
+    options, remaining = cli.parse(["--boot", "--retry", "3"])
+    assert options.boot
+    assert remaining == ["--retry", "3"]
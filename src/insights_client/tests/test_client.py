@@ -1,6 +1,11 @@
+import json
+import os
+import subprocess
+import sys
 from unittest import mock
 import insights_client
 import pytest
+from insights_client import summary
 
 
 # Test config load error
@@ -66,3 +71,136 @@ def test_non_root_user(mock_config, os_uid):
     with pytest.raises(SystemExit) as sys_exit:
         insights_client._main()
     assert "root" in str(sys_exit.value)
+
+
+# Test a stop while waiting for the system to settle at boot
+@mock.patch("os.getuid", return_value=0)
+@mock.patch("insights_client.InsightsConfig")
+@mock.patch("insights_client.shutdown.reraise", side_effect=SystemExit(143))
+@mock.patch("insights_client.boot.prepare", side_effect=insights_client.shutdown.Interrupted(15))
+def test_boot_wait_interrupted(mock_prepare, mock_reraise, mock_config, os_uid):
+    mock_config.return_value.load_all.return_value = {"version": False}
+
+    with mock.patch("sys.argv", ["insights-client", "--boot"]):
+        with pytest.raises(SystemExit) as sys_exit:
+            insights_client._main()
+    assert sys_exit.value.code == 143
+    mock_reraise.assert_called_once_with(15)
+
+
+# Test the archive of the last run uploaded again at boot
+@mock.patch("os.getuid", return_value=0)
+@mock.patch("insights_client.InsightsConfig")
+@mock.patch("insights_client.boot.prepare", return_value=["--payload", "a.tar.gz"])
+def test_boot_reuses_archive(mock_prepare, mock_config, os_uid):
+    loaded_argv = []
+
+    def load_all():
+        loaded_argv.append(list(sys.argv[1:]))
+        return {"version": False}
+
+    mock_config.return_value.load_all.side_effect = load_all
+
+    with mock.patch("sys.argv", ["insights-client", "--boot", "--retry", "3"]):
+        with mock.patch("insights_client.envelope.apply"):
+            # stop right after loading the configuration
+            with mock.patch("insights_client.InsightsClient", side_effect=SystemExit(7)):
+                with pytest.raises(SystemExit):
+                    insights_client._main()
+    # loaded again with the archive
+    assert loaded_argv == [["--retry", "3"], ["--retry", "3", "--payload", "a.tar.gz"]]
+
+
+def _fake_phase_host(reports, returncode, output=b""):
+    """Mock Popen for a phase host sending the given phase_end messages."""
+
+    def popen(command, env, pass_fds, start_new_session=False, stdout=None, stderr=None):
+        read_fd, write_fd = (int(fd) for fd in env["INSIGHTS_IPC_FDS"].split(","))
+        assert pass_fds == (read_fd, write_fd)
+        # keep reading end of the wrapper's messages open
+        opened_fds.append(os.dup(read_fd))
+        for phase, code in reports:
+            message = {"type": "phase_end", "phase": phase, "returncode": code}
+            message.update(duration=1.0, reason="test")
+            os.write(write_fd, (json.dumps(message) + "\n").encode())
+        if output:
+            os.write(stderr, output)
+        process = mock.MagicMock()
+        process.returncode = returncode
+        return process
+
+    opened_fds = []
+    return popen
+
+
+# Test all phases reported as successful by the phase host
+@mock.patch("insights_client.update_motd_message")
+@mock.patch("insights_client.subprocess.Popen")
+def test_phase_host_success(mock_popen, mock_motd):
+    phases = [{"name": "pre_update"}, {"name": "collect_and_output"}]
+    mock_popen.side_effect = _fake_phase_host([("pre_update", 0), ("collect_and_output", 0)], 0)
+
+    run_summary = summary.RunSummary()
+    insights_client.run_phase_host(phases, run_summary=run_summary)
+
+    assert mock_popen.call_count == 1
+    # the MOTD is updated once at the end of the run
+    mock_motd.assert_not_called()
+    assert [p["name"] for p in run_summary.phases] == ["pre_update", "collect_and_output"]
+
+
+# Test the phase host stopping at a phase exiting with 100
+@mock.patch("insights_client.update_motd_message")
+@mock.patch("insights_client.subprocess.Popen")
+def test_phase_host_exit_100(mock_popen, mock_motd):
+    phases = [{"name": "pre_update"}, {"name": "collect_and_output"}]
+    mock_popen.side_effect = _fake_phase_host([("pre_update", 100)], 100)
+
+    with pytest.raises(SystemExit) as sys_exit:
+        insights_client.run_phase_host(phases)
+    assert sys_exit.value.code == 0
+    mock_motd.assert_not_called()
+
+
+# Test the phase host dying without reporting the phase it was running
+@mock.patch("insights_client.update_motd_message")
+@mock.patch("insights_client.subprocess.Popen")
+def test_phase_host_crash(mock_popen, mock_motd, capsys):
+    phases = [{"name": "pre_update"}, {"name": "collect_and_output"}]
+    mock_popen.side_effect = _fake_phase_host([("pre_update", 0)], -9, b"Starting\n")
+
+    with pytest.raises(SystemExit) as sys_exit:
+        insights_client.run_phase_host(phases)
+    assert sys_exit.value.code == 1
+    mock_motd.assert_not_called()
+    # the output of the phase host went through the wrapper
+    assert capsys.readouterr().err == "Starting\n"
+
+
+# Test that importing the package does not import the lazily imported modules
+def test_lazy_imports():
+    sources = os.path.dirname(os.path.dirname(insights_client.__file__))
+    modules = ["insights", "selinux", "subprocess"] + [
+        f"insights_client.{name}"
+        for name in (
+            "boot",
+            "envelope",
+            "history",
+            "jsonlog",
+            "memprofile",
+            "metrics",
+            "planner",
+            "pressure",
+            "profiling",
+            "query",
+            "splay",
+            "tracing",
+        )
+    ]
+    code = (
+        f"import sys, insights_client; print(','.join(m for m in {modules!r} if m in sys.modules))"
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=sources)
+    )
+    assert output.decode().strip() == ""
@@ -0,0 +1,88 @@
+import resource
+
+from unittest import mock
+
+import pytest
+
+from insights_client import envelope
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("/system.slice/insights-client.service", True),
+        ("/system.slice/insights-client-boot.service", True),
+        ("/system.slice/insights-client-1234.scope", True),
+        ("/user.slice/user-0.slice/session-3.scope", False),
+        ("/system.slice/cron.service", False),
+        ("/system.slice/insights-client.service.d", False),
+        ("/", False),
+        (None, False),
+    ],
+)
+def test_in_unit(path, expected):
+    with mock.patch("insights_client.cgroup.own_path", return_value=path):
+        assert envelope.in_unit() is expected
+
+
+def test_start_scope_command():
+    command = envelope.start_scope_command(1234)
+
+    assert command[:8] == [
+        "busctl",
+        "call",
+        "--quiet",
+        "org.freedesktop.systemd1",
+        "/org/freedesktop/systemd1",
+        "org.freedesktop.systemd1.Manager",
+        "StartTransientUnit",
+        "ssa(sv)a(sa(sv))",
+    ]
+    assert command[8:11] == ["insights-client-1234.scope", "fail", "6"]
+    properties = " ".join(command[11:])
+    assert "PIDs au 1 1234" in properties
+    assert "CPUQuotaPerSecUSec t 300000" in properties
+    assert "MemoryHigh t 1073741824" in properties
+    assert "MemoryMax t 2147483648" in properties
+    assert "TasksMax t 300" in properties
+    assert command[-1] == "0"
+
+
+@mock.patch("insights_client.envelope.lower_priorities")
+@mock.patch("insights_client.envelope.start_scope", return_value=True)
+@mock.patch("insights_client.envelope.in_unit", return_value=False)
+def test_apply_scope(in_unit, start_scope, lower_priorities):
+    envelope.apply()
+    start_scope.assert_called_once_with()
+    lower_priorities.assert_not_called()
+
+
+@mock.patch("insights_client.envelope.lower_priorities")
+@mock.patch("insights_client.envelope.start_scope", return_value=False)
+@mock.patch("insights_client.envelope.in_unit", return_value=False)
+def test_apply_fallback(in_unit, start_scope, lower_priorities):
+    envelope.apply()
+    lower_priorities.assert_called_once_with()
+
+
+@mock.patch("insights_client.envelope.start_scope")
+@mock.patch("insights_client.envelope.in_unit", return_value=True)
+def test_apply_in_unit(in_unit, start_scope):
+    envelope.apply()
+    start_scope.assert_not_called()
+
+
+@mock.patch("insights_client.envelope.shutil.which", return_value=None)
+@mock.patch("insights_client.envelope.os.nice")
+@mock.patch("insights_client.envelope.resource.setrlimit")
+@mock.patch(
+    "insights_client.envelope.resource.getrlimit",
+    return_value=(resource.RLIM_INFINITY, resource.RLIM_INFINITY),
+)
+def test_lower_priorities(getrlimit, setrlimit, nice, which):
+    envelope.lower_priorities()
+
+    setrlimit.assert_called_once_with(
+        resource.RLIMIT_DATA, (envelope.MEMORY_MAX, envelope.MEMORY_MAX)
+    )
+    nice.assert_called_once_with(envelope.NICENESS)
@@ -0,0 +1,132 @@
+import json
+import os
+import types
+from unittest import mock
+
+import pytest
+
+import insights_client
+from insights_client import cli
+from insights_client import fastpath
+
+
+@pytest.fixture
+def core_package(tmp_path):
+    """A fake installed insights-core package with VERSION and RELEASE files."""
+    package = tmp_path / "insights"
+    package.mkdir()
+    (package / "VERSION").write_text("3.6.7\n")
+    (package / "RELEASE").write_text("1\n")
+    spec = types.SimpleNamespace(submodule_search_locations=[str(package)])
+    with mock.patch("insights_client.fastpath.importlib.util.find_spec", return_value=spec):
+        yield package
+
+
+@pytest.fixture
+def clean_environ():
+    environ = {k: v for k, v in os.environ.items() if not k.startswith("INSIGHTS_")}
+    with mock.patch.dict(os.environ, environ, clear=True):
+        yield
+
+
+def test_version(core_package, capsys):
+    assert fastpath.dispatch(["--version"], "3.10.4", "/nonexistent") == 0
+    assert capsys.readouterr().out == "Client: 3.10.4\nCore: 3.6.7-1\n"
+
+
+def test_version_without_core():
+    with mock.patch("insights_client.fastpath.importlib.util.find_spec", return_value=None):
+        assert fastpath.dispatch(["--version"], "3.10.4", "/nonexistent") is None
+
+
+@pytest.mark.parametrize("argv", [["--version", "--verbose"], ["--register"], []])
+def test_other_invocations(argv, core_package):
+    assert fastpath.dispatch(argv, "3.10.4", "/nonexistent") is None
+
+
+@mock.patch("os.getuid", return_value=0)
+@mock.patch("insights_client.fastpath._legacy_upload", return_value=False)
+def test_status(legacy_upload, getuid, tmp_path, clean_environ, capsys):
+    registered = tmp_path / ".registered"
+
+    assert fastpath.dispatch(["--status"], "3.10.4", str(registered)) == 1
+    assert capsys.readouterr().out == "This host is unregistered.\n"
+
+    registered.touch()
+    assert fastpath.dispatch(["--status"], "3.10.4", str(registered)) == 0
+    assert capsys.readouterr().out == "This host is registered.\n"
+
+
+@mock.patch("os.getuid", return_value=0)
+@mock.patch("insights_client.fastpath._legacy_upload", return_value=True)
+def test_status_from_daemon(legacy_upload, getuid, tmp_path, clean_environ, capsys):
+    with mock.patch("insights_client.query.request", return_value={"registered": True}):
+        assert fastpath.dispatch(["--status"], "3.10.4", str(tmp_path / ".registered")) == 0
+    assert capsys.readouterr().out == "This host is registered.\n"
+
+    # the daemon cannot tell either
+    with mock.patch("insights_client.query.request", return_value={"registered": None}):
+        assert fastpath.dispatch(["--status"], "3.10.4", str(tmp_path / ".registered")) is None
+
+
+@pytest.mark.parametrize(("argv", "motd_updated"), [(["--status"], True), (["--version"], False)])
+@mock.patch("insights_client.fastpath.dispatch", return_value=1)
+@mock.patch("insights_client.update_motd_message")
+def test_fast_path_updates_motd(update_motd_message, dispatch, argv, motd_updated):
+    with mock.patch("sys.argv", ["insights-client"] + argv):
+        with pytest.raises(SystemExit) as exit_info:
+            insights_client._main()
+    assert exit_info.value.code == 1
+    assert update_motd_message.called == motd_updated
+
+
+@mock.patch("os.getuid", return_value=1000)
+def test_status_non_root(getuid, tmp_path, clean_environ):
+    assert fastpath.dispatch(["--status"], "3.10.4", str(tmp_path / ".registered")) is None
+
+
+@mock.patch("os.getuid", return_value=0)
+@mock.patch("insights_client.fastpath._legacy_upload", return_value=True)
+def test_status_legacy_upload(legacy_upload, getuid, tmp_path, clean_environ):
+    assert fastpath.dispatch(["--status"], "3.10.4", str(tmp_path / ".registered")) is None
+
+
+def test_help_cache(core_package, tmp_path, clean_environ, capsys):
+    cache_file = tmp_path / "help.json"
+    with mock.patch("insights_client.fastpath.HELP_CACHE_FILE", str(cache_file)):
+        # nothing cached yet
+        assert fastpath.dispatch(["--help"], "3.10.4", "/nonexistent") is None
+
+        with pytest.raises(SystemExit):
+            with fastpath.capturing_help(["--help"], "3.10.4"):
+                print("usage: insights-client [options]")
+                raise SystemExit(0)
+        help_text = "usage: insights-client [options]\n\n" + cli.help_text()
+        assert capsys.readouterr().out == help_text
+
+        assert fastpath.dispatch(["--help"], "3.10.4", "/nonexistent") == 0
+        assert capsys.readouterr().out == help_text
+
+        # a different client version invalidates the cache
+        assert fastpath.dispatch(["--help"], "3.10.5", "/nonexistent") is None
+        assert json.loads(cache_file.read_text())["text"].startswith("usage:")
+
+
+def test_help_lists_wrapper_options(core_package, tmp_path, clean_environ, capsys):
+    with mock.patch("insights_client.fastpath.HELP_CACHE_FILE", str(tmp_path / "help.json")):
+        with pytest.raises(SystemExit):
+            with fastpath.capturing_help(["--help"], "3.10.4"):
+                print("usage: insights-client [options]")
+                raise SystemExit(0)
+    out = capsys.readouterr().out
+    for option in (
+        "--daemon",
+        "--boot",
+        "--profile DIR",
+        "--memory-profile",
+        "--history",
+        "--stats",
+        "--splay-timer",
+        "--simulate-splay HOSTS",
+    ):
+        assert f"  {option} " in out or f"  {option}\n" in out
@@ -0,0 +1,136 @@
+import sqlite3
+import time
+from unittest import mock
+
+from insights_client import cli
+from insights_client import history
+from insights_client import summary
+
+
+def _run_summary(started, duration, collection_wall=10.0):
+    run_summary = summary.RunSummary()
+    run_summary.started = started
+    run_summary.record_message(
+        {"type": "archive", "path": "/var/tmp/a.tar.gz", "size": 2048, "uncompressed_size": 8192}
+    )
+    run_summary.record_message(
+        {"type": "upload", "size": 2048, "duration": 1.5, "success": True, "attempts": 2}
+    )
+    run_summary.record_phase("pre_update", 0, 1.0)
+    run_summary.record_phase(
+        "collect_and_output", 0, collection_wall, {"usage": {"max_rss_kb": 1024}}
+    )
+    run_summary.finish(0)
+    run_summary.duration = duration
+    return run_summary
+
+
+def test_cli_parse():
+    options, remaining = cli.parse(["--stats"])
+    assert options.stats and not options.history
+    assert remaining == []
+
+
+def test_record(tmp_path):
+    path = str(tmp_path / "history.db")
+    history.record(_run_summary(time.time(), 12.0), 365, path)
+
+    db = sqlite3.connect(path)
+    run = db.execute(
+        "SELECT duration, exit_code, archive_size, uncompressed_size, compressor,"
+        " upload_attempts, upload_success FROM runs"
+    ).fetchone()
+    assert run == (12.0, 0, 2048, 8192, "gz", 2, 1)
+    phases = db.execute("SELECT name, returncode, wall, max_rss_kb FROM phases").fetchall()
+    assert phases == [("pre_update", 0, 1.0, None), ("collect_and_output", 0, 10.0, 1024)]
+
+
+def test_record_forgets_old_runs(tmp_path):
+    path = str(tmp_path / "history.db")
+    history.record(_run_summary(time.time() - 10 * 86400, 12.0), 365, path)
+    history.record(_run_summary(time.time(), 12.0), 7, path)
+
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA foreign_keys = ON")
+    assert db.execute("SELECT COUNT(*) FROM runs").fetchone() == (1,)
+    assert db.execute("SELECT COUNT(*) FROM phases").fetchone() == (2,)
+
+
+def test_record_disabled(tmp_path):
+    path = tmp_path / "history.db"
+    history.record(_run_summary(time.time(), 12.0), 0, str(path))
+    assert not path.exists()
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert history.percentile(values, 50) == 50
+    assert history.percentile(values, 99) == 99
+    assert history.percentile(values, 100) == 100
+    assert history.percentile([7], 90) == 7
+
+
+def test_history_report(tmp_path, capsys):
+    path = str(tmp_path / "history.db")
+    history.record(_run_summary(time.time() - 3600, 12.0), 365, path)
+    history.record(_run_summary(time.time(), 20.0), 365, path)
+
+    assert history.report(path) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == [
+        "started",
+        "exit",
+        "duration",
+        "peak",
+        "RSS",
+        "archive",
+        "upload",
+        "retries",
+        "phases",
+    ]
+    assert len(lines) == 3
+    # the oldest run first
+    assert "12.0s" in lines[1]
+    assert lines[2].endswith("pre_update 1.0s, collect_and_output 10.0s")
+    assert "2KiB" in lines[2]
+
+
+def test_stats_report(tmp_path, capsys):
+    path = str(tmp_path / "history.db")
+    now = time.time()
+    # the collection getting slower every week
+    for week in range(4):
+        started = now - (3 - week) * 7 * 86400 - 3600
+        history.record(_run_summary(started, 100.0 + week, 60.0 * (week + 1)), 365, path)
+
+    assert history.report(path, stats=True) == 0
+    out = capsys.readouterr().out
+    assert out.startswith("4 runs, 0 failed\n")
+    collection = [line for line in out.splitlines() if line.startswith("phase collect_and_output")]
+    percentiles, trend = collection
+    assert percentiles.split()[2:] == ["120.0s", "240.0s", "240.0s", "240.0s"]
+    assert trend.split()[-4:] == ["60.0s", "120.0s", "180.0s", "240.0s"]
+
+
+def test_report_without_history(tmp_path, capsys):
+    assert history.report(str(tmp_path / "history.db")) == 0
+    assert capsys.readouterr().out == "No runs recorded yet.\n"
+
+
+def test_report_permission_denied(tmp_path, capsys):
+    # like /var/lib/insights for a user other than root
+    error = PermissionError(13, "Permission denied")
+    with mock.patch("os.stat", side_effect=error):
+        assert history.report(str(tmp_path / "history.db")) == 1
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert captured.err.endswith("history.db': Permission denied\n")
+
+
+def test_report_broken_history(tmp_path, capsys):
+    path = tmp_path / "history.db"
+    path.write_bytes(b"not a database" * 100)
+    assert history.report(str(path)) == 1
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert captured.err.startswith(f"Cannot read the history '{path}'")
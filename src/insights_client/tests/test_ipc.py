@@ -0,0 +1,131 @@
+import gzip
+import os
+from unittest import mock
+
+import pytest
+
+from insights_client import instrument
+from insights_client import ipc
+
+
+def test_messages_both_ways():
+    wrapper, phase_fds = ipc.Channel.pair()
+    phase = ipc.Channel(*phase_fds)
+
+    assert wrapper.send("run", phase="collect_and_output")
+    assert phase.receive() == {"type": "run", "phase": "collect_and_output"}
+
+    assert phase.send("phase_start", phase="collect_and_output")
+    assert phase.send("phase_end", phase="collect_and_output", returncode=0)
+    phase.close()
+
+    assert [m["type"] for m in wrapper] == ["phase_start", "phase_end"]
+    assert wrapper.eof
+    wrapper.close()
+
+
+def test_partial_and_malformed_lines():
+    read_fd, write_fd = os.pipe()
+    channel = ipc.Channel(read_fd, write_fd)
+
+    os.write(write_fd, b'{"type": "archive", "pa')
+    assert channel.read() == []
+    os.write(write_fd, b'th": "/tmp/a.tar.gz"}\nnot json\n{"no": "type"}\n')
+    assert channel.read() == [{"type": "archive", "path": "/tmp/a.tar.gz"}]
+    channel.close()
+
+
+def test_send_to_closed_channel():
+    wrapper, phase_fds = ipc.Channel.pair()
+    ipc.close_fds(phase_fds)
+    assert not wrapper.send("stop")
+    wrapper.close()
+
+
+def test_from_environ():
+    wrapper, phase_fds = ipc.Channel.pair()
+    with mock.patch.dict(os.environ, ipc.Channel.environ(phase_fds)):
+        phase = ipc.Channel.from_environ()
+    assert phase is not None
+    assert not os.get_inheritable(phase_fds[0])
+    phase.close()
+    wrapper.close()
+
+    with mock.patch.dict(os.environ, clear=True):
+        assert ipc.Channel.from_environ() is None
+
+
+def test_instrumented_client(tmp_path):
+    archive = tmp_path / "insights-archive.tar.gz"
+    archive.write_bytes(b"x" * 10)
+
+    class Client:
+        def collect(self):
+            return str(archive)
+
+        def upload(self, payload=None, content_type=None):
+            return "response"
+
+    wrapper, phase_fds = ipc.Channel.pair()
+    phase = ipc.Channel(*phase_fds)
+    core_client = mock.MagicMock(InsightsClient=Client)
+    with mock.patch.dict("sys.modules", {"insights.client": core_client}):
+        instrument.install(phase)
+        # installing twice does not report twice
+        instrument.install(phase)
+
+    client = Client()
+    assert client.upload(client.collect(), "application/gzip") == "response"
+    phase.close()
+
+    messages = list(wrapper)
+    wrapper.close()
+    assert messages[0] == {"type": "archive", "path": str(archive), "size": 10}
+    assert messages[1]["type"] == "upload"
+    assert messages[1]["size"] == 10
+    assert messages[1]["success"] is True
+    assert len(messages) == 2
+
+
+def test_instrumented_upload_attempts(tmp_path):
+    archive = tmp_path / "insights-archive.tar.gz"
+    with gzip.open(archive, "wb") as f:
+        f.write(b"x" * 1000)
+
+    class Connection:
+        def upload_archive(self, payload):
+            return False
+
+    class Client:
+        def __init__(self):
+            self.connection = Connection()
+
+        def collect(self):
+            return str(archive)
+
+        def upload(self, payload=None, content_type=None):
+            # insights-core retries the failed uploads
+            for _ in range(3):
+                if self.connection.upload_archive(payload):
+                    return "response"
+            raise RuntimeError("upload failed")
+
+    wrapper, phase_fds = ipc.Channel.pair()
+    phase = ipc.Channel(*phase_fds)
+    core_modules = {
+        "insights.client": mock.MagicMock(InsightsClient=Client),
+        "insights.client.connection": mock.MagicMock(InsightsConnection=Connection),
+    }
+    with mock.patch.dict("sys.modules", core_modules):
+        instrument.install(phase)
+
+    client = Client()
+    with pytest.raises(RuntimeError):
+        client.upload(client.collect())
+    phase.close()
+
+    messages = list(wrapper)
+    wrapper.close()
+    assert messages[0]["uncompressed_size"] == 1000
+    assert messages[1]["success"] is False
+    assert messages[1]["attempts"] == 3
@@ -0,0 +1,81 @@
+import gzip
+import json
+import logging
+
+from insights_client import jsonlog
+
+
+def _logger(name):
+    # not known to the logging module, so that no other handlers are added
+    return logging.Logger(name, logging.DEBUG)
+
+
+def test_json_lines(tmp_path):
+    path = tmp_path / "insights-client.jsonl"
+    logger = _logger("insights.client.phase.v2")
+    handler = jsonlog.add(logger, str(path), 1, 5)
+    logger.info("Uploading %s", "archive.tar.gz")
+    try:
+        raise ValueError("no connection")
+    except ValueError:
+        logger.exception("Upload failed")
+    handler.close()
+
+    first, second = [json.loads(line) for line in path.read_text().splitlines()]
+    assert first["level"] == "INFO"
+    assert first["logger"] == "insights.client.phase.v2"
+    assert first["message"] == "Uploading archive.tar.gz"
+    assert first["time"].endswith("+00:00")
+    assert "exception" not in first
+    assert second["level"] == "ERROR"
+    assert "ValueError: no connection" in second["exception"]
+
+
+def test_disabled(tmp_path):
+    logger = _logger("insights_client.tests.jsonlog")
+    assert jsonlog.add(logger, "", 1, 5) is None
+    assert logger.handlers == []
+
+
+def test_rotation(tmp_path):
+    path = tmp_path / "insights-client.jsonl"
+    logger = _logger("insights_client.tests.jsonlog")
+    handler = jsonlog.JsonFileHandler(str(path), max_size=2000, max_total=1000000)
+    logger.addHandler(handler)
+    for number in range(50):
+        logger.debug("record %d", number)
+    handler.close()
+
+    segments = handler.segments()
+    assert segments
+    assert all(segment.endswith(".gz") for segment in segments)
+    lines = []
+    for segment in segments:
+        with gzip.open(segment, "rt") as f:
+            lines.extend(f.read().splitlines())
+    lines.extend(path.read_text().splitlines())
+    # nothing lost, in order
+    assert [json.loads(line)["message"] for line in lines] == [
+        f"record {number}" for number in range(50)
+    ]
+    assert path.stat().st_size <= 2000
+
+
+def test_bounded_total(tmp_path):
+    path = tmp_path / "insights-client.jsonl"
+    # old segments, from previous runs
+    for stamp in ("20260101T000000.000000", "20260102T000000.000000"):
+        (tmp_path / f"insights-client.jsonl.{stamp}.gz").write_bytes(b"x" * 3000)
+    logger = _logger("insights_client.tests.jsonlog")
+    handler = jsonlog.JsonFileHandler(str(path), max_size=1000, max_total=5000)
+    logger.addHandler(handler)
+    for number in range(30):
+        logger.debug("record %d", number)
+    handler.close()
+
+    segments = handler.segments()
+    total = path.stat().st_size + sum((tmp_path / s).stat().st_size for s in segments)
+    assert total <= 5000
+    # the oldest went first
+    assert not (tmp_path / "insights-client.jsonl.20260101T000000.000000.gz").exists()
+    assert json.loads(path.read_text().splitlines()[-1])["message"] == "record 29"
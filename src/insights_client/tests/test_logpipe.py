@@ -0,0 +1,118 @@
+import io
+import logging
+import threading
+
+import pytest
+
+from insights_client import ipc
+from insights_client import logpipe
+
+
+class SlowHandler(logging.StreamHandler):
+    """A handler writing only once allowed to."""
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.allowed = threading.Event()
+
+    def emit(self, record):
+        self.allowed.wait(5)
+        super().emit(record)
+
+
+@pytest.fixture
+def test_logger():
+    # not known to the logging module, so that no other handlers are added
+    logger = logging.Logger("insights_client.tests.logpipe", logging.DEBUG)
+    yield logger
+    logpipe.release(logger)
+
+
+def test_take_over_does_not_wait(test_logger):
+    stream = io.StringIO()
+    handler = SlowHandler(stream)
+    test_logger.addHandler(handler)
+    logpipe.take_over(test_logger)
+    assert handler not in test_logger.handlers
+
+    # returns while the handler still waits
+    test_logger.info("collected %d specs", 3)
+    assert stream.getvalue() == ""
+
+    handler.allowed.set()
+    logpipe.release(test_logger)
+    assert stream.getvalue() == "collected 3 specs\n"
+    assert test_logger.handlers == [handler]
+
+
+def test_take_over_respects_handler_level(test_logger):
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setLevel(logging.INFO)
+    test_logger.addHandler(handler)
+    logpipe.take_over(test_logger)
+    test_logger.debug("hidden")
+    test_logger.info("shown")
+    logpipe.release_all()
+    assert stream.getvalue() == "shown\n"
+
+
+def test_lazy(test_logger):
+    calls = []
+
+    def describe(value):
+        calls.append(value)
+        return f"<{value}>"
+
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setLevel(logging.INFO)
+    test_logger.addHandler(handler)
+    test_logger.setLevel(logging.INFO)
+    test_logger.debug("%s", logpipe.Lazy(describe, "ignored"))
+    test_logger.info("%s", logpipe.Lazy(describe, "used"))
+    assert calls == ["used"]
+    assert stream.getvalue() == "<used>\n"
+
+
+def test_forward(monkeypatch):
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "handlers", [])
+    channel, fds = ipc.Channel.pair()
+    phase_channel = ipc.Channel(*fds)
+
+    # the handlers insights-core sets up in the phase
+    core_handler = logging.StreamHandler(io.StringIO())
+    core_handler.setLevel(logging.INFO)
+    root.addHandler(core_handler)
+    logpipe.forward(phase_channel)
+    (handler,) = root.handlers
+    assert isinstance(handler, logpipe.ChannelHandler)
+    assert handler.level == logging.INFO
+
+    # set up again for the next phase
+    logpipe.forward(phase_channel)
+    assert root.handlers == [handler]
+
+    logger = logging.getLogger("insights.client.phase.v2")
+    try:
+        raise ValueError("no archive")
+    except ValueError:
+        logger.exception("Collection failed for %s", "host")
+    message = channel.receive()
+    assert message["type"] == "log"
+    assert message["record"]["msg"] == "Collection failed for host"
+    assert "ValueError: no archive" in message["record"]["exc_text"]
+
+    # in the wrapper
+    root.handlers = []
+    stream = io.StringIO()
+    wrapper_handler = logging.StreamHandler(stream)
+    wrapper_handler.setFormatter(logging.Formatter("%(name)s %(levelname)s %(message)s"))
+    root.addHandler(wrapper_handler)
+    logpipe.handle(message)
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == "insights.client.phase.v2 ERROR Collection failed for host"
+    assert lines[-1] == "ValueError: no archive"
+
+    ipc.close_fds(fds + (channel._read_fd, channel._write_fd))
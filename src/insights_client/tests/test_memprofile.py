@@ -0,0 +1,82 @@
+import json
+import time
+import tracemalloc
+
+import pytest
+
+from insights_client import cli
+from insights_client import ipc
+from insights_client import memprofile
+from insights_client import run
+from insights_client import summary
+
+
+@pytest.fixture
+def memory_profile(monkeypatch):
+    monkeypatch.setenv(memprofile.ENVIRON, "1")
+    monkeypatch.setattr(memprofile, "CHECK_INTERVAL", 0.01)
+    monkeypatch.setattr(memprofile, "PEAK_MIN_INTERVAL", 0.0)
+    yield
+    tracemalloc.stop()
+
+
+class BigPhase:
+    """Stand-in for insights.client.phase.v2 with a phase allocating, then freeing memory."""
+
+    def collect_and_output(self):
+        data = bytearray(10 * 1024 * 1024)
+        time.sleep(0.2)
+        del data
+
+
+def test_cli_parse():
+    options, remaining = cli.parse(["--memory-profile", "--offline"])
+    assert options.memory_profile
+    assert remaining == ["--offline"]
+
+
+def test_environ(monkeypatch):
+    assert memprofile.environ() == {}
+    monkeypatch.setattr(memprofile, "_requested", False)
+    memprofile.request()
+    assert memprofile.environ() == {memprofile.ENVIRON: "1"}
+
+
+def test_not_enabled():
+    with memprofile.profiled(object(), "update"):
+        pass
+    assert not tracemalloc.is_tracing()
+
+
+def test_phase_memory_reported(memory_profile):
+    wrapper_channel, phase_fds = ipc.Channel.pair()
+    phase_channel = ipc.Channel(*phase_fds)
+    returncode = run.run_reported_phase(
+        phase_channel, run.run_hosted_phase, BigPhase(), "collect_and_output"
+    )
+    phase_channel.close()
+    messages = list(wrapper_channel)
+    wrapper_channel.close()
+
+    assert returncode == 0
+    memory = [message for message in messages if message["type"] == "memory"]
+    assert len(memory) == 1
+    profile = memory[0]
+    assert profile["phase"] == "collect_and_output"
+    assert profile["peak"] > 10 * 1024 * 1024
+
+    snapshots = profile["snapshots"]
+    assert snapshots["peak"]["size"] > 10 * 1024 * 1024
+    assert snapshots["end"]["size"] < snapshots["peak"]["size"]
+    top = snapshots["peak"]["top"][0]
+    assert top["file"] == __file__
+    assert top["size"] >= 10 * 1024 * 1024
+
+
+def test_memory_written_next_to_summary(tmp_path):
+    run_summary = summary.RunSummary(str(tmp_path / "insights-client-run.json"))
+    run_summary.record_message({"type": "memory", "phase": "update", "peak": 100, "snapshots": {}})
+    run_summary.write()
+
+    with open(tmp_path / "insights-client-memory.json") as f:
+        assert json.load(f) == {"update": {"peak": 100, "snapshots": {}}}
@@ -0,0 +1,80 @@
+from insights_client import metrics
+from insights_client import summary
+
+
+def _run_summary(exit_code=0):
+    run_summary = summary.RunSummary()
+    run_summary.record_message(
+        {
+            "type": "archive",
+            "path": "/var/tmp/a.tar.gz",
+            "size": 100,
+            "uncompressed_size": 1000,
+        }
+    )
+    run_summary.record_message(
+        {"type": "upload", "size": 100, "duration": 0.5, "success": True, "attempts": 2}
+    )
+    run_summary.record_phase("pre_update", 0, 1.5)
+    run_summary.record_phase("collect_and_output", exit_code, 2.0)
+    run_summary.finish(exit_code)
+    return run_summary
+
+
+def _samples(path):
+    samples = {}
+    with open(path) as f:
+        for line in f:
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+    return samples
+
+
+def test_write(tmp_path):
+    run_summary = _run_summary()
+    metrics.write(run_summary, str(tmp_path))
+
+    samples = _samples(tmp_path / "insights_client.prom")
+    assert samples["insights_client_exit_code"] == 0
+    assert samples['insights_client_phase_duration_seconds{phase="pre_update"}'] == 1.5
+    assert samples['insights_client_phase_exit_code{phase="collect_and_output"}'] == 0
+    assert samples['insights_client_archive_bytes{compression="none"}'] == 1000
+    assert samples['insights_client_archive_bytes{compression="compressed"}'] == 100
+    assert samples["insights_client_upload_duration_seconds"] == 0.5
+    assert samples["insights_client_upload_throughput_bytes_per_second"] == 200
+    assert samples["insights_client_upload_retries"] == 1
+    assert samples["insights_client_upload_success"] == 1
+    assert samples["insights_client_last_success_timestamp_seconds"] == (
+        run_summary.started + run_summary.duration
+    )
+    assert not (tmp_path / "insights_client.prom.tmp").exists()
+
+
+def test_last_success_kept_on_failure(tmp_path):
+    success = _run_summary()
+    metrics.write(success, str(tmp_path))
+
+    metrics.write(_run_summary(exit_code=1), str(tmp_path))
+
+    samples = _samples(tmp_path / "insights_client.prom")
+    assert samples["insights_client_exit_code"] == 1
+    assert samples["insights_client_last_success_timestamp_seconds"] == (
+        success.started + success.duration
+    )
+
+
+def test_disabled(tmp_path):
+    metrics.write(_run_summary(), "")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_render_without_upload():
+    run_summary = summary.RunSummary()
+    run_summary.record_phase("pre_update", 100, 1.0)
+    run_summary.finish(0)
+
+    text = metrics.render(run_summary.as_dict())
+    assert "insights_client_upload" not in text
+    assert "insights_client_archive_bytes" not in text
+    assert "# TYPE insights_client_exit_code gauge\n" in text
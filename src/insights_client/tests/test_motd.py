@@ -8,6 +8,7 @@ import unittest.mock
 import pytest
 
 import insights_client
+from insights_client import summary
 
 
 class MockFS:
@@ -111,3 +112,18 @@ def test_ignored_on_dev_null(mock_fs):
     mock_fs.touch("etc/insights-client/.registered")
     insights_client.update_motd_message()
     assert mock_fs.samefile("etc/motd.d/insights-client", os.devnull)
+
+
+def test_update_host_state(mock_fs, tmp_path):
+    state_file = tmp_path / "state.json"
+    run_summary = summary.RunSummary()
+    run_summary.record_phase("pre_update", 100, 0.1)
+
+    with unittest.mock.patch("insights_client.state.STATE_FILE", str(state_file)):
+        # whatever the phases returned, like 100 for --status
+        insights_client.update_host_state(run_summary)
+        assert mock_fs.exists("etc/motd.d/insights-client")
+
+    host_state = insights_client.state.read(str(state_file))
+    assert host_state.motd == insights_client.state.MOTD_PRESENT
+    assert host_state.motd_wanted
@@ -0,0 +1,60 @@
+import logging
+
+import pytest
+
+from insights_client import planner
+
+PHASES = [
+    {"name": "pre_update", "run_as_root": True},
+    {"name": "update", "run_as_root": True},
+    {"name": "post_update", "run_as_root": True},
+    {"name": "collect_and_output", "run_as_root": True},
+]
+
+
+def _names(phases):
+    return [phase["name"] for phase in phases]
+
+
+def test_collection_skips_pre_update_and_update(caplog):
+    caplog.set_level(logging.DEBUG)
+    planned = planner.plan(PHASES, {"checkin": False})
+
+    assert _names(planned) == ["post_update", "collect_and_output"]
+    assert "Skipping phase 'pre_update'" in caplog.text
+    assert "Skipping phase 'update'" in caplog.text
+
+
+def test_pre_update_option_runs_pre_update_only(caplog):
+    caplog.set_level(logging.DEBUG)
+    planned = planner.plan(PHASES, {"checkin": True})
+
+    assert _names(planned) == ["pre_update"]
+    assert "'pre_update' exits because of '--checkin'" in caplog.text
+
+
+@pytest.mark.parametrize("option", ["list_specs", "module"])
+def test_options_of_later_phases(option):
+    # handled by post_update and collect_and_output
+    planned = planner.plan(PHASES, {option: "insights.specs"})
+    assert _names(planned) == ["post_update", "collect_and_output"]
+
+
+def test_disable_schedule_exits():
+    planned = planner.plan(PHASES, {"disable_schedule": True, "register": False})
+    assert _names(planned) == ["pre_update"]
+
+
+def test_disable_schedule_with_register():
+    planned = planner.plan(PHASES, {"disable_schedule": True, "register": True})
+    assert _names(planned) == ["pre_update", "post_update", "collect_and_output"]
+
+
+def test_phases_are_dicts_of_get_phases():
+    planned = planner.plan(PHASES, {})
+    assert planned == PHASES[2:]
+
+
+def test_unknown_phases_are_kept():
+    phases = PHASES + [{"name": "new_phase"}]
+    assert _names(planner.plan(phases, {})) == ["post_update", "collect_and_output", "new_phase"]
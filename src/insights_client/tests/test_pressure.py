@@ -0,0 +1,111 @@
+import subprocess
+import time
+
+import pytest
+
+from insights_client import pressure
+from insights_client import settings
+from insights_client import summary
+
+PRESSURE = """some avg10=12.50 avg60=3.00 avg300=1.00 total=123456
+full avg10=2.00 avg60=0.50 avg300=0.10 total=6543
+"""
+
+
+def test_parse():
+    parsed = pressure.parse(PRESSURE)
+    assert parsed["some"] == {"avg10": 12.5, "avg60": 3.0, "avg300": 1.0, "total": 123456}
+    assert parsed["full"]["avg10"] == 2.0
+
+
+def test_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(pressure, "SYSTEM_PRESSURE_DIR", str(tmp_path))
+    (tmp_path / "io").write_text(PRESSURE)
+
+    assert pressure.read("io") == 12.5
+    assert pressure.read("memory") is None
+
+
+@pytest.fixture
+def io_pressure(monkeypatch):
+    values = {"io": 50.0}
+    monkeypatch.setattr(pressure, "read", lambda name, source="system": values.get(name))
+    return values
+
+
+def _stopped(pid, stopped=True):
+    """Wait for the process to be (or not to be) stopped; returns whether it happened."""
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with open(f"/proc/{pid}/stat") as f:
+            state = f.read().rsplit(")", 1)[1].split()[0]
+        if (state == "T") == stopped:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_from_settings(io_pressure):
+    assert pressure.Throttle.from_settings(settings.Settings()) is None
+
+    throttle = pressure.Throttle.from_settings(settings.Settings(pressure_io=40.0))
+    assert throttle.thresholds == {"io": 40.0}
+
+    # no pressure stall information for memory
+    assert pressure.Throttle.from_settings(settings.Settings(pressure_memory=40.0)) is None
+
+
+def test_pause_and_resume(io_pressure):
+    run_summary = summary.RunSummary()
+    throttle = pressure.Throttle({"io": 40.0}, run_summary=run_summary)
+    throttle.phase = "collect_and_output"
+    process = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    try:
+        throttle.watch(process, group=True)
+        throttle.check()
+        assert _stopped(process.pid)
+
+        # still under pressure
+        throttle.check()
+        assert _stopped(process.pid)
+
+        io_pressure["io"] = 10.0
+        throttle.check()
+        assert _stopped(process.pid, stopped=False)
+    finally:
+        process.kill()
+        process.wait()
+
+    assert len(run_summary.pauses) == 1
+    pause = run_summary.pauses[0]
+    assert pause["phase"] == "collect_and_output"
+    assert pause["action"] == "paused"
+    assert pause["resource"] == "io"
+    assert pause["pressure"] == 50.0
+
+
+def test_pause_bounded(io_pressure):
+    throttle = pressure.Throttle({"io": 40.0}, max_pause=0.0)
+    process = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    try:
+        throttle.watch(process, group=True)
+        throttle.check()
+        assert _stopped(process.pid, stopped=False)
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_defer(io_pressure):
+    run_summary = summary.RunSummary()
+    throttle = pressure.Throttle({"io": 40.0}, max_pause=0.05, run_summary=run_summary)
+    throttle.interval = 0.01
+    throttle.phase = "collect_and_output"
+    throttle.defer()
+
+    assert [pause["action"] for pause in run_summary.pauses] == ["deferred"]
+    assert throttle.paused_for >= 0.05
+
+    # no pause left for this run
+    throttle.defer()
+    assert len(run_summary.pauses) == 1
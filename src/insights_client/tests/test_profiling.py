@@ -0,0 +1,69 @@
+import os
+import pstats
+import time
+
+from insights_client import cli
+from insights_client import profiling
+
+
+def _busy():
+    end = time.perf_counter() + 0.05
+    while time.perf_counter() < end:
+        pass
+
+
+def _work():
+    _busy()
+
+
+def test_cli_parse():
+    options, remaining = cli.parse(["--profile=/tmp/profile", "--offline"])
+    assert options.profile == "/tmp/profile"
+    assert remaining == ["--offline"]
+
+
+def test_profiled(tmp_path):
+    with profiling.profiled(str(tmp_path), "collect_and_output"):
+        _work()
+
+    stats = pstats.Stats(str(tmp_path / "collect_and_output.pstats"))
+    assert any(name == "_busy" for _, _, name in stats.stats)
+
+
+def test_profiled_without_directory(tmp_path):
+    with profiling.profiled(None, "collect_and_output"):
+        _work()
+    assert os.listdir(tmp_path) == []
+
+
+def test_collapse(tmp_path):
+    with profiling.profiled(str(tmp_path), "update"):
+        _work()
+    stacks = profiling.collapse(pstats.Stats(str(tmp_path / "update.pstats")), "update")
+
+    busy = [stack for stack in stacks if "_busy (test_profiling.py" in stack.split(";")[-1]]
+    assert len(busy) == 1
+    frames = busy[0].split(";")
+    assert frames[0] == "update"
+    assert frames[-2].startswith("_work (test_profiling.py")
+    assert stacks[busy[0]] > 0.01
+
+
+def test_session(tmp_path):
+    directory = tmp_path / "profile"
+    directory.mkdir()
+    # the profile of a phase, written by the phase process
+    with profiling.profiled(str(directory), "update"):
+        _work()
+
+    with profiling.session(str(directory)):
+        assert profiling.environ() == {profiling.ENVIRON_DIR: str(directory)}
+        # insights-core would take it for an option of its own
+        assert profiling.ENVIRON_DIR not in os.environ
+        _work()
+    assert profiling.environ() == {}
+
+    assert sorted(os.listdir(directory)) == ["profile.collapsed", "update.pstats", "wrapper.pstats"]
+    with open(directory / "profile.collapsed") as f:
+        roots = {line.split(";", 1)[0] for line in f}
+    assert roots == {"update", "wrapper"}
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import stat
+
+from insights_client import query
+
+
+def _answer(name):
+    if name == "status":
+        return {"registered": True}
+    if name == "broken":
+        raise RuntimeError("broken")
+    return None
+
+
+def _serve_and_request(path, *names):
+    async def run():
+        server = await query.serve(_answer, path)
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+        loop = asyncio.get_running_loop()
+        try:
+            answers = [
+                await loop.run_in_executor(None, query.request, name, path) for name in names
+            ]
+        finally:
+            await query.close(server, path)
+        return mode, answers
+
+    return asyncio.run(run())
+
+
+def test_request(tmp_path):
+    path = str(tmp_path / "run" / "query.sock")
+
+    mode, answers = _serve_and_request(path, "status", "unknown", "broken")
+
+    assert mode == 0o600
+    assert stat.S_IMODE(os.stat(tmp_path / "run").st_mode) == 0o700
+    # unknown and failed queries are no answer
+    assert answers == [{"registered": True}, None, None]
+    assert not os.path.exists(path)
+
+
+def test_request_not_running(tmp_path):
+    path = tmp_path / "query.sock"
+    assert query.request("status", str(path)) is None
+
+    # a socket left behind
+    path.touch()
+    assert query.request("status", str(path)) is None
+
+
+def test_status(tmp_path):
+    registered = tmp_path / ".registered"
+    assert query.status({}, str(registered)) == {"registered": False}
+    registered.touch()
+    assert query.status({}, str(registered)) == {"registered": True}
+    assert query.status({"legacy_upload": True}, str(registered)) == {"registered": None}
+
+
+def test_results(tmp_path, monkeypatch):
+    host_details = tmp_path / "host-details.json"
+    monkeypatch.setattr(
+        query,
+        "RESULTS_FILES",
+        {"host_details": str(host_details), "insights_details": str(tmp_path / "none.json")},
+    )
+    assert query.results() == {"host_details": None, "insights_details": None}
+
+    host_details.write_text(json.dumps({"total": 1}))
+    assert query.results() == {"host_details": {"total": 1}, "insights_details": None}
+
+    # parsed again only when changed
+    with open(host_details, "r+") as f:
+        f.write(json.dumps({"total": 2}))
+    os.utime(host_details, ns=(0, 0))
+    assert query.results()["host_details"] == {"total": 2}
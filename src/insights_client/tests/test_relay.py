@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+from insights_client import ipc
+from insights_client import relay
+
+
+def _pump_all(output):
+    output.started()
+    for fd in output.fds():
+        while output.pump(fd):
+            pass
+
+
+def _untimed(tail):
+    # the lines kept are prefixed with the time
+    return [line[len("YYYY-mm-dd HH:MM:SS ") :] for line in tail]
+
+
+def test_output_relay_unchanged(capsys):
+    output = relay.OutputRelay("collect_and_output", terminal=False)
+    assert output.environ() == {}
+    os.write(output.stdout_fd, b'{"facts": {}}\nUploading')
+    os.write(output.stderr_fd, b"a warning\n")
+    _pump_all(output)
+
+    # not on a terminal either, the output is forwarded as is
+    captured = capsys.readouterr()
+    assert captured.out == '{"facts": {}}\nUploading'
+    assert captured.err == "a warning\n"
+    assert _untimed(output.tail) == ['{"facts": {}}', "Uploading", "a warning"]
+
+
+def test_output_relay_terminal(capsys):
+    output = relay.OutputRelay("collect_and_output", terminal=True, tail_lines=2)
+    assert output.environ() == {"PYTHONUNBUFFERED": "1"}
+    os.write(output.stdout_fd, b"one\ntwo\nthree\nPassword: ")
+    _pump_all(output)
+
+    assert capsys.readouterr().out == "one\ntwo\nthree\nPassword: "
+    assert _untimed(output.tail) == ["three", "Password: "]
+
+
+def test_phase_relay(capsys):
+    channel, channel_fds = ipc.Channel.pair()
+    output = relay.OutputRelay("pre_update", terminal=False)
+    code = (
+        "import os, sys\n"
+        "print('collecting')\n"
+        "sys.stdout.flush()\n"
+        'os.write(%d, b\'{"type": "phase_end", "phase": "pre_update"}\\n\')\n' % channel_fds[1]
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-c", code],
+        pass_fds=channel_fds,
+        stdout=output.stdout_fd,
+        stderr=output.stderr_fd,
+    )
+    ipc.close_fds(channel_fds)
+    output.started()
+
+    phase_relay = relay.PhaseRelay(channel, output)
+    messages = list(phase_relay.messages(process))
+    process.wait()
+    phase_relay.close()
+
+    assert messages == [{"type": "phase_end", "phase": "pre_update"}]
+    assert capsys.readouterr().out == "collecting\n"
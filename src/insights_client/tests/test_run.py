@@ -0,0 +1,114 @@
+import os
+import sys
+
+import pytest
+
+from insights_client import ipc
+from insights_client import run
+
+
+class FakePhases:
+    """Stand-in for insights.client.phase.v2, recording the phases run."""
+
+    def __init__(self, **exits):
+        self.exits = exits
+        self.run = []
+
+    def __getattr__(self, name):
+        def phase():
+            self.run.append(name)
+            code = self.exits.get(name)
+            if isinstance(code, Exception):
+                raise code
+            sys.exit(code)
+
+        return phase
+
+
+def _run_host(client, names, fork=False):
+    """Ask the phase host to run the phases; returns the messages it sent."""
+    wrapper_channel, phase_fds = ipc.Channel.pair()
+    phase_channel = ipc.Channel(*phase_fds)
+    for name in names:
+        wrapper_channel.send("run", phase=name)
+    wrapper_channel.send("stop")
+
+    returncode = run.serve_phases(client, phase_channel, fork=fork)
+    phase_channel.close()
+    messages = list(wrapper_channel)
+    wrapper_channel.close()
+
+    assert returncode == 0
+    return [(m["type"], m["phase"], m.get("returncode")) for m in messages]
+
+
+def test_host_runs_phases():
+    client = FakePhases(post_update=100)
+    messages = _run_host(client, ["pre_update", "post_update"])
+
+    assert client.run == ["pre_update", "post_update"]
+    assert messages == [
+        ("phase_start", "pre_update", None),
+        ("phase_end", "pre_update", 0),
+        ("phase_start", "post_update", None),
+        ("phase_end", "post_update", 100),
+    ]
+
+
+def test_host_reports_exceptions_as_failures(capsys):
+    client = FakePhases(pre_update=RuntimeError("boom"))
+    messages = _run_host(client, ["pre_update"])
+
+    assert messages[-1] == ("phase_end", "pre_update", 1)
+    assert "Fatal: boom" in capsys.readouterr().out
+
+
+def test_host_reports_resource_usage():
+    wrapper_channel, phase_fds = ipc.Channel.pair()
+    phase_channel = ipc.Channel(*phase_fds)
+    wrapper_channel.send("run", phase="pre_update")
+    wrapper_channel.send("stop")
+
+    run.serve_phases(FakePhases(), phase_channel, fork=True)
+    phase_channel.close()
+    end_message = list(wrapper_channel)[-1]
+    wrapper_channel.close()
+
+    assert end_message["type"] == "phase_end"
+    assert end_message["usage"]["max_rss_kb"] > 0
+
+
+def test_zygote_isolates_phases():
+    client = FakePhases(post_update=101)
+    messages = _run_host(client, ["pre_update", "post_update"], fork=True)
+
+    # the phases ran in forked children, which did not change this process
+    assert client.run == []
+    assert [m for m in messages if m[0] == "phase_end"] == [
+        ("phase_end", "pre_update", 0),
+        ("phase_end", "post_update", 101),
+    ]
+
+
+@pytest.mark.parametrize(
+    "returncode,reason",
+    [(0, "completed"), (100, "exited early"), (1, "failed"), (-9, "killed by signal 9")],
+)
+def test_exit_reason(returncode, reason):
+    assert run.exit_reason(returncode) == reason
+
+
+def test_returncode_from_status():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(3)
+    _, status = os.waitpid(pid, 0)
+    assert run.returncode_from_status(status) == 3
+
+
+@pytest.mark.parametrize(
+    "code,expected",
+    [(None, 0), (0, 0), (101, 101), ("message", 1)],
+)
+def test_exit_code(code, expected):
+    assert run.exit_code(SystemExit(code)) == expected
@@ -0,0 +1,328 @@
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+from unittest import mock
+
+import pytest
+
+from insights_client import cli
+from insights_client import history
+from insights_client import query
+from insights_client import run
+from insights_client import scheduler
+from insights_client import settings
+from insights_client import spawn
+from insights_client import splay
+from insights_client import state
+from insights_client import summary
+
+PHASES = [{"name": "pre_update"}, {"name": "update"}, {"name": "post_update"}]
+
+
+class FakeHost(object):
+    """Stand-in for the phase host, ending the phases with the given return codes."""
+
+    def __init__(self, returncodes=None, on_run=None):
+        self.returncodes = returncodes or {}
+        self.on_run = on_run
+        self.run = []
+        self.started = 0
+        self.stopped = 0
+
+    def start(self):
+        self.started += 1
+
+    def alive(self):
+        return self.started > self.stopped
+
+    async def run_phase(self, name, options, run_summary=None):
+        self.run.append((name, options))
+        if self.on_run is not None:
+            self.on_run()
+        returncode = self.returncodes.get(name, 0)
+        if returncode is None:
+            return None
+        return {"type": "phase_end", "phase": name, "returncode": returncode}
+
+    async def stop(self, timeout):
+        self.stopped += 1
+
+
+@pytest.fixture
+def daemon_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(state, "LAST_UPLOAD_FILE", str(tmp_path / ".lastupload"))
+    monkeypatch.setattr(state, "BOOT_FILE", str(tmp_path / ".run_insights_client_next_boot"))
+    monkeypatch.setattr(query, "SOCKET_PATH", str(tmp_path / "query.sock"))
+    monkeypatch.setattr(history, "HISTORY_FILE", str(tmp_path / "history.db"))
+    monkeypatch.setattr(settings, "load", lambda: settings.Settings(plan_phases=True))
+    monkeypatch.setattr(scheduler, "update_host_state", mock.Mock())
+    monkeypatch.setattr(summary.RunSummary, "write", mock.Mock())
+    yield tmp_path
+    settings.get.cache_clear()
+
+
+def _daemon(host=None):
+    daemon = scheduler.Daemon(lambda: {"loglevel": "DEBUG"}, lambda: PHASES, host or FakeHost())
+    daemon.load()
+    return daemon
+
+
+def test_cli_parse():
+    options, remaining = cli.parse(["--daemon", "--verbose"])
+    assert options.daemon
+    assert remaining == ["--verbose"]
+
+    options, remaining = cli.parse(["--register", "--display-name", "host"])
+    assert not options.daemon
+    assert remaining == ["--register", "--display-name", "host"]
+
+
+def test_load_without_upload(daemon_files):
+    daemon = _daemon()
+
+    assert daemon.options == {"loglevel": "DEBUG"}
+    assert daemon.jobs["collection"].due <= time.time()
+    assert daemon.jobs["checkin"].due > time.time() + 3500
+    assert daemon.jobs["results"].due is None
+    assert daemon.next_job().name == "collection"
+
+
+def test_load_after_upload(daemon_files):
+    last_upload = daemon_files / ".lastupload"
+    last_upload.touch()
+    an_hour_ago = time.time() - 3600
+    os.utime(last_upload, (an_hour_ago, an_hour_ago))
+
+    daemon = _daemon()
+
+    assert daemon.jobs["collection"].due == pytest.approx(an_hour_ago + 86400)
+    assert daemon.next_job().name == "checkin"
+
+
+def test_load_at_boot(daemon_files):
+    boot_file = daemon_files / ".run_insights_client_next_boot"
+    boot_file.touch()
+
+    daemon = _daemon()
+
+    assert not boot_file.exists()
+    assert daemon.next_job().name == "boot"
+    assert daemon.jobs["boot"].options == {"retries": 3}
+    assert daemon.jobs["collection"].due > time.time() + 86000
+
+
+def test_load_with_splay(daemon_files, monkeypatch):
+    machine_id_file = daemon_files / "machine-id"
+    machine_id_file.write_text("3f1a4a7b9c2d4e5f8a6b7c8d9e0f1a2b\n")
+    monkeypatch.setattr(splay, "MACHINE_ID_FILE", str(machine_id_file))
+    monkeypatch.setattr(
+        settings, "load", lambda: settings.Settings(plan_phases=True, daemon_splay=True)
+    )
+    host_offset = splay.offset("3f1a4a7b9c2d4e5f8a6b7c8d9e0f1a2b", 14400)
+
+    # a missed collection is delayed by the offset of the host
+    now = time.time()
+    daemon = _daemon()
+    assert daemon.jobs["collection"].due == pytest.approx(now + host_offset, abs=5)
+
+    # the next ones are at the offset past midnight
+    job = daemon.jobs["collection"]
+    daemon.reschedule(job, True)
+    assert job.due % 86400 == pytest.approx(host_offset)
+    assert time.time() + 43200 <= job.due <= time.time() + 86400 + 43200
+
+
+def test_upload_triggers_results(daemon_files):
+    daemon = _daemon()
+    daemon._check_upload()
+    assert daemon.jobs["results"].due is None
+
+    (daemon_files / ".lastupload").touch()
+    daemon._check_upload()
+    assert daemon.jobs["results"].due <= time.time()
+
+
+def test_run_collection_job(daemon_files):
+    host = FakeHost()
+    daemon = _daemon(host)
+
+    assert asyncio.run(daemon.run_job(daemon.jobs["collection"]))
+    # the phases planned for a collection, with the resolved configuration
+    assert host.run == [("post_update", {"loglevel": "DEBUG", "_cli_opts": {}})]
+    assert scheduler.update_host_state.call_count == 1
+
+
+def test_run_collection_job_unplanned(daemon_files, monkeypatch):
+    monkeypatch.setattr(settings, "load", lambda: settings.Settings())
+    host = FakeHost()
+    daemon = _daemon(host)
+
+    assert asyncio.run(daemon.run_job(daemon.jobs["collection"]))
+    assert [name for name, _ in host.run] == ["pre_update", "update", "post_update"]
+
+
+def test_run_checkin_job(daemon_files):
+    host = FakeHost({"pre_update": 100})
+    daemon = _daemon(host)
+
+    assert asyncio.run(daemon.run_job(daemon.jobs["checkin"]))
+    assert host.run == [
+        ("pre_update", {"loglevel": "DEBUG", "checkin": True, "_cli_opts": {"checkin": True}})
+    ]
+
+
+def test_failed_job_is_retried(daemon_files):
+    host = FakeHost({"post_update": None})
+    daemon = _daemon(host)
+    job = daemon.jobs["collection"]
+
+    assert not asyncio.run(daemon.run_job(job))
+    # the phase host died and is stopped, to be started again
+    assert host.stopped == 1
+
+    for _ in range(3):
+        daemon.reschedule(job, False)
+        assert job.due == pytest.approx(time.time() + 900, abs=5)
+    daemon.reschedule(job, False)
+    assert job.due == pytest.approx(time.time() + 86400, abs=5)
+
+
+def test_main_runs_due_job_and_stops(daemon_files):
+    daemon = scheduler.Daemon(lambda: {}, lambda: PHASES)
+    daemon.host = FakeHost(on_run=daemon.request_stop)
+
+    asyncio.run(daemon.main())
+
+    assert [name for name, _ in daemon.host.run] == ["post_update"]
+    assert daemon.host.stopped == 1
+
+
+def test_answer(daemon_files, monkeypatch):
+    monkeypatch.setattr(scheduler, "REGISTERED_FILE", str(daemon_files / ".registered"))
+    monkeypatch.setattr(summary, "read", lambda: {"exit_code": 0})
+    daemon = _daemon()
+
+    assert daemon.answer("status") == {"registered": False}
+    assert daemon.answer("last_run") == {"last_run": {"exit_code": 0}}
+    assert set(daemon.answer("schedule")["jobs"]) == {"collection", "checkin", "results"}
+    assert daemon.answer("unknown") is None
+
+
+def test_main_serves_queries(daemon_files):
+    daemon = scheduler.Daemon(lambda: {}, lambda: PHASES)
+    listening = []
+
+    def on_run():
+        listening.append(os.path.exists(query.SOCKET_PATH))
+        daemon.request_stop()
+
+    daemon.host = FakeHost(on_run=on_run)
+    asyncio.run(daemon.main())
+
+    assert listening == [True]
+    assert not os.path.exists(query.SOCKET_PATH)
+
+
+# A phase host starting the phases it is asked to run, which never end
+HUNG_PHASE_HOST = """
+import time
+from insights_client import ipc
+
+channel = ipc.Channel.from_environ()
+for message in channel:
+    if message["type"] == "run":
+        channel.send("phase_start", phase=message["phase"])
+        time.sleep(60)
+"""
+
+
+def test_stop_interrupts_running_job(daemon_files, monkeypatch):
+    sources = os.path.dirname(os.path.dirname(spawn.__file__))
+    monkeypatch.setenv("PYTHONPATH", sources)
+    monkeypatch.setattr(spawn, "command", lambda: [sys.executable, "-c", HUNG_PHASE_HOST])
+    monkeypatch.setattr(
+        settings, "load", lambda: settings.Settings(plan_phases=True, stop_timeout=2.0)
+    )
+    daemon = scheduler.Daemon(lambda: {}, lambda: PHASES)
+    processes = []
+    start_host = daemon.host.start
+
+    def start():
+        start_host()
+        processes.append(daemon.host.process)
+
+    daemon.host.start = start
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.call_later(1.0, daemon.request_stop, 15)
+        await daemon.main()
+
+    start_time = time.monotonic()
+    asyncio.run(asyncio.wait_for(main(), 30))
+
+    # stopped without waiting for the phase, nor for stop_timeout
+    assert time.monotonic() - start_time < 3.0
+    (process,) = processes
+    assert process.returncode == -15
+    assert daemon.host.process is None
+    (run_summary,) = [call.args[0] for call in scheduler.update_host_state.call_args_list]
+    assert run_summary.interruption == {
+        "phase": "post_update",
+        "signal": "SIGTERM",
+        "returncode": None,
+    }
+
+
+def core_phase(func):
+    """Like the phase decorator of insights-core, which resolves the configuration."""
+
+    @functools.wraps(func)
+    def _f():
+        raise AssertionError("the configuration was resolved again")
+
+    return _f
+
+
+class CoreHost(FakeHost):
+    """Runs the phases in this process, the way the phase host does."""
+
+    def __init__(self, core):
+        super().__init__()
+        self.core = core
+
+    async def run_phase(self, name, options, run_summary=None):
+        # as sent on the channel
+        options = json.loads(json.dumps(options))
+        self.run.append((name, options))
+        returncode = run.run_hosted_phase(self.core, name, options)
+        return {"type": "phase_end", "phase": name, "returncode": returncode}
+
+
+def test_job_runs_post_update(daemon_files, monkeypatch, core_config):
+    monkeypatch.setattr(settings, "load", lambda: settings.Settings())
+    seen = []
+
+    @core_phase
+    def post_update(client, config):
+        # like insights-core, for --display-name
+        if "display_name" in config._cli_opts and not config.register:
+            sys.exit(100)
+        seen.append(config._cli_opts)
+
+    core = mock.Mock(pre_update=core_phase(mock.Mock()), post_update=post_update)
+    core.update = core.pre_update
+    host = CoreHost(core)
+    daemon = scheduler.Daemon(
+        lambda: {"register": False, "loglevel": "DEBUG", "_cli_opts": {"verbose": True}},
+        lambda: PHASES,
+        host,
+    )
+    daemon.load()
+
+    assert asyncio.run(daemon.run_job(daemon.jobs["checkin"]))
+    assert [name for name, _ in host.run] == ["pre_update", "update", "post_update"]
+    assert seen == [{"verbose": True, "checkin": True}]
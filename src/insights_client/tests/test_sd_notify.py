@@ -0,0 +1,96 @@
+import os
+import socket
+
+import pytest
+
+from insights_client import cgroup
+from insights_client import sd_notify
+
+
+@pytest.fixture
+def notify_socket(tmp_path, monkeypatch):
+    path = str(tmp_path / "notify")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    sock.settimeout(5)
+    monkeypatch.setenv("NOTIFY_SOCKET", path)
+    yield sock
+    sock.close()
+
+
+def test_notify(notify_socket):
+    assert sd_notify.notify("READY=1", "STATUS=phase collect_and_output")
+    assert notify_socket.recv(4096) == b"READY=1\nSTATUS=phase collect_and_output"
+
+
+def test_notify_abstract_socket(monkeypatch):
+    name = f"insights-client-test-{os.getpid()}"
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind("\0" + name)
+    sock.settimeout(5)
+    monkeypatch.setenv("NOTIFY_SOCKET", "@" + name)
+    try:
+        assert sd_notify.notify("WATCHDOG=1")
+        assert sock.recv(4096) == b"WATCHDOG=1"
+    finally:
+        sock.close()
+
+
+def test_notify_without_socket(monkeypatch, tmp_path):
+    monkeypatch.delenv("NOTIFY_SOCKET", raising=False)
+    assert not sd_notify.notify("READY=1")
+
+    monkeypatch.setenv("NOTIFY_SOCKET", str(tmp_path / "missing"))
+    assert not sd_notify.notify("READY=1")
+
+
+@pytest.mark.parametrize(
+    "usec, pid, expected",
+    [
+        ("900000000", None, 450.0),
+        ("900000000", "self", 450.0),
+        ("900000000", "1", None),
+        ("0", None, None),
+        ("garbage", None, None),
+        (None, None, None),
+    ],
+)
+def test_watchdog_interval(monkeypatch, usec, pid, expected):
+    monkeypatch.delenv("WATCHDOG_USEC", raising=False)
+    monkeypatch.delenv("WATCHDOG_PID", raising=False)
+    if usec is not None:
+        monkeypatch.setenv("WATCHDOG_USEC", usec)
+    if pid is not None:
+        monkeypatch.setenv("WATCHDOG_PID", str(os.getpid()) if pid == "self" else pid)
+
+    assert sd_notify.watchdog_interval() == expected
+
+
+def test_watchdog_progress(monkeypatch):
+    cpu = iter([10, 10, 20, 20])
+    monkeypatch.setattr(cgroup, "cpu_usage_usec", lambda: next(cpu))
+    watchdog = sd_notify.Watchdog(1)
+
+    # the start of the run is progress
+    assert watchdog._made_progress()
+    assert not watchdog._made_progress()
+    # CPU time used by the unit is progress
+    assert watchdog._made_progress()
+    # and so is a message from a phase
+    watchdog.progress()
+    assert watchdog._made_progress()
+
+
+def test_watchdog_pings(notify_socket, monkeypatch):
+    monkeypatch.setenv("WATCHDOG_USEC", "20000")
+    monkeypatch.delenv("WATCHDOG_PID", raising=False)
+    sd_notify.start_watchdog()
+    try:
+        assert notify_socket.recv(4096) == b"WATCHDOG=1"
+    finally:
+        sd_notify.stop_watchdog()
+
+
+def test_process_cpu_ticks():
+    assert cgroup.process_cpu_ticks(os.getpid()) >= 0
+    assert cgroup.process_cpu_ticks(-1) is None
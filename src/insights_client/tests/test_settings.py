@@ -0,0 +1,44 @@
+import pytest
+
+from insights_client import settings
+
+
+def _write_config(tmp_path, content):
+    path = tmp_path / "insights-client.conf"
+    path.write_text(content)
+    return str(path)
+
+
+def test_defaults_without_file(tmp_path):
+    loaded = settings.load(str(tmp_path / "missing.conf"))
+    assert loaded.phase_mode == "spawn"
+
+
+def test_core_section_ignored(tmp_path):
+    path = _write_config(tmp_path, "[insights-client]\nphase_mode=host\n")
+    assert settings.load(path).phase_mode == "spawn"
+
+
+def test_wrapper_section(tmp_path):
+    path = _write_config(
+        tmp_path, "[insights-client]\nloglevel=DEBUG\n\n[wrapper]\nphase_mode=host\n"
+    )
+    assert settings.load(path).phase_mode == "host"
+
+
+def test_invalid_choice(tmp_path):
+    path = _write_config(tmp_path, "[wrapper]\nphase_mode=fork\n")
+    with pytest.raises(ValueError):
+        settings.load(path)
+
+
+@pytest.mark.parametrize("value,expected", [("False", False), ("no", False), ("True", True)])
+def test_boolean(tmp_path, value, expected):
+    path = _write_config(tmp_path, f"[wrapper]\nplan_phases={value}\n")
+    assert settings.load(path).plan_phases is expected
+
+
+def test_invalid_boolean(tmp_path):
+    path = _write_config(tmp_path, "[wrapper]\nplan_phases=maybe\n")
+    with pytest.raises(ValueError):
+        settings.load(path)
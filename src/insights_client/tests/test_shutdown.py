@@ -0,0 +1,75 @@
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+import insights_client
+from insights_client import shutdown
+from insights_client import summary
+
+
+@pytest.fixture
+def signal_handlers():
+    handlers = {signum: signal.getsignal(signum) for signum in shutdown.SIGNALS}
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def test_install(signal_handlers):
+    shutdown.install()
+    with pytest.raises(shutdown.Interrupted) as interrupted:
+        os.kill(os.getpid(), signal.SIGTERM)
+    assert interrupted.value.signum == signal.SIGTERM
+    assert str(interrupted.value) == "interrupted by SIGTERM"
+    # a second signal does not interrupt the stopping of the phases
+    assert signal.getsignal(signal.SIGTERM) == signal.SIG_IGN
+
+
+def test_signum_of():
+    assert shutdown.signum_of(shutdown.Interrupted(signal.SIGABRT)) == signal.SIGABRT
+    assert shutdown.signum_of(KeyboardInterrupt()) == signal.SIGINT
+
+
+def test_stop_terminates():
+    process = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    assert shutdown.stop(process, 5) == -signal.SIGTERM
+
+
+def test_stop_kills_after_timeout():
+    code = (
+        "import signal, time\n"
+        "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+        "print('ready', flush=True)\n"
+        "time.sleep(60)\n"
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-c", code], stdout=subprocess.PIPE, start_new_session=True
+    )
+    assert process.stdout.readline() == b"ready\n"
+    assert shutdown.stop(process, 0.5) == -signal.SIGKILL
+    process.stdout.close()
+
+
+def test_stop_phase_process_records_interruption():
+    process = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    run_summary = summary.RunSummary()
+    insights_client._stop_phase_process(
+        process, "collect_and_output", shutdown.Interrupted(signal.SIGTERM), run_summary
+    )
+
+    assert process.returncode is not None
+    assert run_summary.interruption == {
+        "phase": "collect_and_output",
+        "signal": "SIGTERM",
+        "returncode": -signal.SIGTERM,
+    }
+
+
+def test_reraise():
+    sources = os.path.dirname(os.path.dirname(insights_client.__file__))
+    code = "from insights_client import shutdown; shutdown.reraise(15)"
+    process = subprocess.run([sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=sources))
+    assert process.returncode == -signal.SIGTERM
@@ -0,0 +1,124 @@
+import functools
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+from insights_client import run
+from insights_client import snapshot
+
+
+class Config:
+    """Stand-in for InsightsConfig: options are attributes."""
+
+    def __init__(self, **options):
+        self.__dict__.update(options)
+        self._print_errors = True
+
+
+def test_roundtrip():
+    config_snapshot = snapshot.write(Config(offline=True, retries=3, proxy=None))
+    try:
+        with mock.patch.dict(os.environ, snapshot.environ(config_snapshot)):
+            assert snapshot.read() == {"offline": True, "retries": 3, "proxy": None}
+            # every phase reads the whole snapshot
+            assert snapshot.read() == {"offline": True, "retries": 3, "proxy": None}
+    finally:
+        config_snapshot.close()
+
+
+def test_unserializable_config():
+    assert snapshot.write(Config(callback=object())) is None
+    assert snapshot.environ(None) == {}
+    assert snapshot.pass_fds(None) == ()
+
+
+def test_read_without_snapshot():
+    with mock.patch.dict(os.environ, clear=True):
+        assert snapshot.read() is None
+
+
+def test_read_broken_snapshot():
+    with mock.patch.dict(os.environ, {snapshot.ENVIRON_FD: "not-a-fd"}):
+        assert snapshot.read() is None
+
+
+def _decorated_phase(func):
+    def phase():
+        raise AssertionError("the configuration was resolved again")
+
+    phase.__wrapped__ = func
+    return phase
+
+
+def test_phase_uses_snapshot():
+    func = mock.MagicMock()
+    config_class = sys.modules["insights.client.config"].InsightsConfig
+
+    with pytest.raises(SystemExit) as sys_exit:
+        run.call_phase(_decorated_phase(func), {"offline": True, "_cli_opts": {}})
+    assert sys_exit.value.code is None
+    config_class.assert_called_with(offline=True)
+    func.assert_called_once()
+
+
+def test_phase_snapshot_without_cli_options():
+    func = mock.MagicMock()
+    phase = mock.MagicMock(__wrapped__=func)
+
+    run.call_phase(phase, {"offline": True})
+    phase.assert_called_once_with()
+    func.assert_not_called()
+
+
+def test_phase_without_snapshot():
+    func = mock.MagicMock()
+    phase = mock.MagicMock(__wrapped__=func)
+
+    run.call_phase(phase, None)
+    phase.assert_called_once_with()
+    func.assert_not_called()
+
+
+def core_phase(func):
+    """Like the phase decorator of insights-core, which resolves the configuration."""
+
+    @functools.wraps(func)
+    def _f():
+        raise AssertionError("the configuration was resolved again")
+
+    return _f
+
+
+@core_phase
+def post_update(client, config):
+    # like insights-core: the display name is set right away only when it
+    # was given on the command line, and sent with the upload otherwise
+    if "display_name" in config._cli_opts and not config.register:
+        client.set_display_name(config.display_name)
+        sys.exit(0)
+
+
+@pytest.mark.parametrize(
+    "cli_options,display_name_set",
+    [({"display_name": "web1"}, True), ({}, False)],
+)
+def test_post_update_uses_cli_options(core_config, cli_options, display_name_set):
+    wrapper_config = Config(display_name="web1", register=False)
+    wrapper_config._cli_opts = cli_options
+    config_snapshot = snapshot.write(wrapper_config)
+    try:
+        with mock.patch.dict(os.environ, snapshot.environ(config_snapshot)):
+            options = snapshot.read()
+    finally:
+        config_snapshot.close()
+    client_class = sys.modules["insights.client"].InsightsClient
+    client_class.reset_mock()
+
+    with pytest.raises(SystemExit) as sys_exit:
+        run.call_phase(post_update, options)
+    assert not sys_exit.value.code
+    (config,), _ = client_class.call_args
+    assert config._cli_opts == cli_options
+    assert client_class.return_value.set_display_name.called == display_name_set
@@ -0,0 +1,60 @@
+from insights_client import cli
+from insights_client import splay
+
+MACHINE_ID = "3f1a4a7b9c2d4e5f8a6b7c8d9e0f1a2b"
+
+
+def test_offset_is_stable_and_in_the_window():
+    host_offset = splay.offset(MACHINE_ID, 14400)
+    assert 0 <= host_offset < 14400
+    assert splay.offset(MACHINE_ID, 14400) == host_offset
+    assert splay.offset(MACHINE_ID, 0) == 0
+    offsets = {splay.offset(f"{number:032x}", 14400) for number in range(100)}
+    assert len(offsets) > 90
+
+
+def test_next_time():
+    assert splay.next_time(1000, 86400, 3600) == 3600
+    assert splay.next_time(3600, 86400, 3600) == 3600
+    assert splay.next_time(3601, 86400, 3600) == 86400 + 3600
+    assert splay.next_time(1000, 0, 3600) == 1000
+
+
+def test_write_timer(tmp_path):
+    machine_id_file = tmp_path / "machine-id"
+    machine_id_file.write_text(MACHINE_ID + "\n")
+    dropin = tmp_path / "insights-client.timer.d" / "splay.conf"
+
+    assert splay.write_timer(14400, str(dropin), str(machine_id_file)) == 0
+    lines = dropin.read_text().splitlines()
+    host_offset = splay.offset(MACHINE_ID, 14400)
+    hours, rest = divmod(host_offset, 3600)
+    assert "OnCalendar=" in lines
+    assert f"OnCalendar=*-*-* {hours:02d}:{rest // 60:02d}:{rest % 60:02d}" in lines
+    assert "RandomizedDelaySec=0" in lines
+
+
+def test_write_timer_without_machine_id(tmp_path, capsys):
+    dropin = tmp_path / "splay.conf"
+    assert splay.write_timer(14400, str(dropin), str(tmp_path / "machine-id")) == 1
+    assert not dropin.exists()
+    assert "Cannot write the timer drop-in" in capsys.readouterr().err
+
+
+def test_simulate():
+    lines = splay.simulate(24000, 14400)
+    assert lines[0].startswith("24000 hosts over 240 minutes: 100.0 requests per minute")
+    rows = lines[2:]
+    assert len(rows) == 240
+    assert rows[0].startswith("00:00")
+    assert rows[-1].startswith("03:59")
+    assert sum(int(row.split()[1]) for row in rows) == 24000
+    # the same fleet, the same histogram
+    assert splay.simulate(24000, 14400) == lines
+
+
+def test_cli_parse():
+    options, remaining = cli.parse(["--simulate-splay", "5000", "--verbose"])
+    assert options.simulate_splay == 5000
+    assert not options.splay_timer
+    assert remaining == ["--verbose"]
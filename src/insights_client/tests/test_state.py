@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from insights_client import state
+
+
+@pytest.fixture
+def stamp_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(state, "LAST_UPLOAD_FILE", str(tmp_path / ".lastupload"))
+    monkeypatch.setattr(state, "BOOT_FILE", str(tmp_path / ".run_insights_client_next_boot"))
+    (tmp_path / "motd.d").mkdir()
+    return tmp_path
+
+
+def _read(tmp_path, motd_file=None):
+    return state.State.read(
+        str(tmp_path / ".registered"),
+        str(tmp_path / ".unregistered"),
+        motd_file or str(tmp_path / "motd.d" / "insights-client"),
+    )
+
+
+def test_read_new_host(stamp_files):
+    host_state = _read(stamp_files)
+
+    assert not host_state.registered
+    assert not host_state.unregistered
+    assert host_state.last_upload is None
+    assert not host_state.boot_pending
+    assert host_state.motd == state.MOTD_ABSENT
+    assert host_state.motd_wanted
+
+
+def test_read_registered_host(stamp_files):
+    (stamp_files / ".registered").touch()
+    (stamp_files / ".lastupload").touch()
+    os.utime(stamp_files / ".lastupload", (1000, 1000))
+    (stamp_files / ".run_insights_client_next_boot").touch()
+    (stamp_files / "insights-client.motd").touch()
+    (stamp_files / "motd.d" / "insights-client").symlink_to(stamp_files / "insights-client.motd")
+
+    host_state = _read(stamp_files)
+
+    assert host_state.registered
+    assert host_state.last_upload == 1000
+    assert host_state.boot_pending
+    assert host_state.motd == state.MOTD_PRESENT
+    assert not host_state.motd_wanted
+
+
+def test_read_motd(stamp_files):
+    motd_file = stamp_files / "motd.d" / "insights-client"
+    motd_file.symlink_to(os.devnull)
+    assert _read(stamp_files).motd == state.MOTD_DISABLED
+
+    assert _read(stamp_files, str(stamp_files / "none" / "motd")).motd == state.MOTD_UNSUPPORTED
+
+
+def test_write_and_read(stamp_files):
+    path = str(stamp_files / "state.json")
+    assert state.read(path) is None
+
+    state.write(state.State(registered=True, last_upload=1000.0), path)
+    host_state = state.read(path)
+
+    assert host_state.as_dict() == state.State(registered=True, last_upload=1000.0).as_dict()
+    assert not os.path.exists(f"{path}.tmp")
@@ -0,0 +1,74 @@
+import json
+
+from insights_client import summary
+
+
+def test_usage_since():
+    before = summary.resource_usage()
+    sum(range(100000))
+    usage = summary.usage_since(before)
+
+    assert set(usage) == {
+        "utime",
+        "stime",
+        "max_rss_kb",
+        "block_read_bytes",
+        "block_write_bytes",
+    }
+    assert usage["utime"] >= 0
+    assert usage["max_rss_kb"] > 0
+
+
+def test_write_and_read(tmp_path):
+    path = tmp_path / "insights-client-run.json"
+    run_summary = summary.RunSummary(str(path))
+    run_summary.record_message({"type": "archive", "path": "/var/tmp/a.tar.gz", "size": 100})
+    run_summary.record_message({"type": "upload", "size": 100, "duration": 0.5, "success": True})
+    end_message = {
+        "type": "phase_end",
+        "phase": "collect_and_output",
+        "returncode": 0,
+        "reason": "completed",
+        "usage": {"utime": 1.5, "max_rss_kb": 2048},
+    }
+    run_summary.record_phase("collect_and_output", 0, 2.0, end_message)
+    run_summary.record_phase("post_update", None, 0.1, output_tail=["Killed"])
+    run_summary.finish(0)
+    run_summary.write()
+
+    written = summary.read(str(path))
+    assert written["exit_code"] == 0
+    assert written["archive"] == {"path": "/var/tmp/a.tar.gz", "size": 100}
+    assert written["upload"]["duration"] == 0.5
+    assert written["phases"][0] == {
+        "name": "collect_and_output",
+        "returncode": 0,
+        "wall": 2.0,
+        "reason": "completed",
+        "utime": 1.5,
+        "max_rss_kb": 2048,
+    }
+    assert written["phases"][1] == {
+        "name": "post_update",
+        "returncode": None,
+        "wall": 0.1,
+        "output_tail": ["Killed"],
+    }
+    assert not (tmp_path / "insights-client-run.json.tmp").exists()
+    assert json.loads(path.read_text()) == written
+
+
+def test_write_failure_is_ignored(tmp_path):
+    run_summary = summary.RunSummary(str(tmp_path / "missing" / "run.json"))
+    run_summary.finish(1)
+    run_summary.write()
+
+
+def test_read_missing(tmp_path):
+    assert summary.read(str(tmp_path / "run.json")) is None
+
+
+def test_exit_code():
+    assert summary.exit_code(None) == 0
+    assert summary.exit_code(1) == 1
+    assert summary.exit_code("Aborting.") == 1
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from insights_client import tracing
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "insights-client-trace.json"
+    yield path
+    tracing.finish()
+
+
+def test_not_tracing(trace_file):
+    with tracing.span("plan phases", "wrapper"):
+        pass
+    assert tracing.environ() == {}
+    assert not trace_file.exists()
+
+
+def test_trace_across_processes(trace_file):
+    tracing.start(str(trace_file))
+    trace_id = tracing.environ()[tracing.ENVIRON_ID]
+    with tracing.span("plan phases", "wrapper"):
+        pass
+
+    # a phase, joining the trace from its environment
+    code = (
+        "from insights_client import tracing\n"
+        "tracing.start_from_environ('phase collect_and_output')\n"
+        "with tracing.span('collection', 'insights-core'):\n"
+        "    pass\n"
+    )
+    start = time.monotonic()
+    env = dict(os.environ, PYTHONPATH=SRC_DIR, **tracing.environ())
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    tracing.complete("phase collect_and_output", "phase", start, returncode=0)
+    tracing.finish()
+
+    with open(trace_file) as f:
+        events = json.load(f)
+
+    assert {event["args"]["trace_id"] for event in events} == {trace_id}
+    spans = {event["name"]: event for event in events if event["ph"] == "X"}
+    assert set(spans) == {"plan phases", "collection", "phase collect_and_output"}
+    assert spans["collection"]["pid"] != spans["plan phases"]["pid"]
+    # the collection happened within the phase
+    phase = spans["phase collect_and_output"]
+    assert phase["ts"] <= spans["collection"]["ts"]
+    assert spans["collection"]["ts"] + spans["collection"]["dur"] <= phase["ts"] + phase["dur"]
+    names = [event["args"]["name"] for event in events if event["ph"] == "M"]
+    assert names == ["insights-client", "phase collect_and_output"]
+
+
+def test_trace_replaced_by_next_run(trace_file):
+    tracing.start(str(trace_file))
+    first_id = tracing.environ()[tracing.ENVIRON_ID]
+    tracing.finish()
+
+    tracing.start(str(trace_file))
+    tracing.finish()
+    with open(trace_file) as f:
+        events = json.load(f)
+    assert first_id not in {event["args"]["trace_id"] for event in events}
+
+
+def test_trace_not_writable(tmp_path):
+    tracing.start(str(tmp_path / "missing" / "trace.json"))
+    assert tracing.environ() == {}
@@ -0,0 +1,170 @@
+"""Timeline of a run across the wrapper and the phases.
+
+The wrapper starts a trace for every run, with an ID of its own, and
+passes the ID and the trace file to the phases in their environment. The
+wrapper and the phases append what they spent their time on (loading the
+configuration, the phases, the collection, the upload, ...) to the file as
+Chrome trace events, in the "JSON Array Format" which the trace viewers
+(Perfetto, chrome://tracing, speedscope) load as is, even when the run did
+not end cleanly.
+
+Every event is a line written with one write() on a file opened for
+appending, so that the processes do not mix their events up. The times
+are those of the monotonic clock, in microseconds, which is the same for
+all the processes.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+TRACE_FILE = "/var/lib/insights/insights-client-trace.json"
+
+ENVIRON_ID = "INSIGHTS_TRACE_ID"
+ENVIRON_FILE = "INSIGHTS_TRACE_FILE"
+
+
+logger = logging.getLogger(__name__)
+
+
+def _usec(seconds):
+    return int(seconds * 1000000)
+
+
+class Trace(object):
+    """The events of a run written by one process."""
+
+    def __init__(self, trace_id, path, fd):
+        self.trace_id = trace_id
+        self.path = path
+        self.fd = fd
+
+    @classmethod
+    def create(cls, path):
+        """Start the trace of a new run in the file, replacing the previous one."""
+        # not imported by the phases, which join the trace
+        import uuid
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o600)
+        os.write(fd, b"[\n")
+        return cls(uuid.uuid4().hex, path, fd)
+
+    @classmethod
+    def join(cls, trace_id, path):
+        """Add the events of this process to the trace of the run."""
+        return cls(trace_id, path, os.open(path, os.O_WRONLY | os.O_APPEND))
+
+    def _write(self, data):
+        try:
+            os.write(self.fd, data)
+        except OSError as exc:
+            logger.debug("Could not write to the trace '%s': %s", self.path, exc)
+
+    def emit(self, event):
+        event.setdefault("pid", os.getpid())
+        event.setdefault("tid", threading.get_native_id())
+        event.setdefault("args", {})["trace_id"] = self.trace_id
+        self._write(json.dumps(event).encode("utf-8") + b",\n")
+
+    def complete(self, name, category, start, end, **args):
+        """Add what took from start to end (time.monotonic())."""
+        self.emit(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": _usec(start),
+                "dur": _usec(end - start),
+                "args": args,
+            }
+        )
+
+    def name_process(self, name):
+        self.emit({"name": "process_name", "ph": "M", "args": {"name": name}})
+
+    def finish(self):
+        """End the trace of the run; no process adds events after."""
+        event = {
+            "name": "run",
+            "ph": "i",
+            "s": "g",
+            "ts": _usec(time.monotonic()),
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": {"trace_id": self.trace_id, "finished": time.time()},
+        }
+        self._write(json.dumps(event).encode("utf-8") + b"\n]\n")
+        self.close()
+
+    def close(self):
+        os.close(self.fd)
+
+
+_trace = None
+
+
+def start(path):
+    """Start the trace of the run of the wrapper; nothing is traced when it cannot be."""
+    global _trace
+    try:
+        _trace = Trace.create(path)
+    except OSError as exc:
+        logger.debug("Could not create the trace '%s': %s", path, exc)
+        return
+    _trace.name_process("insights-client")
+    logger.debug("Tracing the run %s to '%s'", _trace.trace_id, path)
+
+
+def start_from_environ(process_name):
+    """Join the trace of the run of the wrapper, in a phase process."""
+    global _trace
+    trace_id = os.environ.get(ENVIRON_ID)
+    path = os.environ.get(ENVIRON_FILE)
+    if not trace_id or not path:
+        return
+    try:
+        _trace = Trace.join(trace_id, path)
+    except OSError as exc:
+        logger.debug("Could not open the trace '%s': %s", path, exc)
+        return
+    _trace.name_process(process_name)
+
+
+def environ():
+    """Return the environment variables telling a phase about the trace."""
+    if _trace is None:
+        return {}
+    return {ENVIRON_ID: _trace.trace_id, ENVIRON_FILE: _trace.path}
+
+
+def finish():
+    """End the trace of the run of the wrapper."""
+    global _trace
+    if _trace is not None:
+        _trace.finish()
+        _trace = None
+
+
+def name_process(name):
+    """Name this process in the trace, like a forked phase."""
+    if _trace is not None:
+        _trace.name_process(name)
+
+
+def complete(name, category, start, end=None, **args):
+    """Add what took from start (time.monotonic()) to end, or until now."""
+    if _trace is not None:
+        _trace.complete(name, category, start, time.monotonic() if end is None else end, **args)
+
+
+@contextlib.contextmanager
+def span(name, category, **args):
+    """Add what the block took."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        complete(name, category, start, **args)